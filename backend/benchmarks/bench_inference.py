@@ -0,0 +1,329 @@
+"""Inference benchmarks for the scoring backend.
+
+Run from backend/ so the relative `models/` paths resolve:
+
+    python benchmarks/bench_inference.py --output results.json
+    python benchmarks/bench_inference.py --compare benchmarks/baseline.json
+    python benchmarks/bench_inference.py --save-baseline benchmarks/baseline.json
+
+Requests are synthetic `VideoMetrics` drawn from fixed per-field ranges with a
+fixed seed, so two runs on the same machine score the same rows. Results are a
+flat mapping of metric name -> value, unit and which direction is better;
+`--compare` exits with status 1 when any metric is worse than the baseline by
+more than its threshold.
+"""
+import argparse
+import asyncio
+import fnmatch
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, os.path.normpath(SRC_DIR))
+
+# Before any backend module calls basicConfig with DEBUG.
+logging.basicConfig(level=logging.WARNING)
+
+from schemas import VideoMetrics  # noqa: E402
+
+SEED = 20240917
+BATCH_SIZES = (1, 8, 64, 512, 4096)
+BREAKDOWN_SIZES = (1, 512)
+# Per-field ranges of the synthetic requests; fields not listed fall back to
+# [0, 100) for ints and [0, 1) for floats.
+FIELD_RANGES = {
+    "video_duration_sec": (5, 60),
+    "verified_status": (0, 2),
+    "author_ban_status": (0, 3),
+    "share_ratio": (0.0, 0.05),
+    "comment_ratio": (0.0, 0.01),
+    "like_ratio": (0.0, 0.3),
+    "title_length": (5, 80),
+    "description_length": (0, 300),
+}
+
+
+def synthetic_metrics(n: int, seed: int = SEED) -> List[VideoMetrics]:
+    """`n` valid requests, one column per `VideoMetrics` field."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, field in VideoMetrics.model_fields.items():
+        if field.annotation is int:
+            low, high = FIELD_RANGES.get(name, (0, 100))
+            columns[name] = rng.integers(low, high, size=n).tolist()
+        else:
+            low, high = FIELD_RANGES.get(name, (0.0, 1.0))
+            columns[name] = rng.uniform(low, high, size=n).tolist()
+    return [
+        VideoMetrics(**{name: values[i] for name, values in columns.items()})
+        for i in range(n)
+    ]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def sample(fn: Callable[[], Any], min_time: float, min_repeats: int, warm_up: int = 3) -> np.ndarray:
+    """Seconds per call of `fn`, repeated for at least `min_time` seconds."""
+    for _ in range(warm_up):
+        fn()
+    times = []
+    started = time.perf_counter()
+    while len(times) < min_repeats or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return np.array(times)
+
+
+class Results:
+    def __init__(self):
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, value: float, unit: str, better: str = "lower"):
+        self.metrics[name] = {"value": float(value), "unit": unit, "better": better}
+
+    def add_latency(self, prefix: str, times: np.ndarray):
+        for q in (50, 95, 99):
+            self.add(f"{prefix}.p{q}_ms", np.percentile(times, q) * 1000, "ms")
+
+    def add_throughput(self, prefix: str, rows: int, times: np.ndarray):
+        median = float(np.median(times))
+        self.add(f"{prefix}.ms_per_call", median * 1000, "ms")
+        self.add(f"{prefix}.rows_per_s", rows / median, "rows/s", better="higher")
+
+
+def bench_manager(results: Results, engine: str, batch_sizes: Sequence[int], min_time: float):
+    from scoring_manager import ScoringManager
+
+    manager = ScoringManager(engine=engine)
+    rows = synthetic_metrics(max(*batch_sizes, *BREAKDOWN_SIZES))
+
+    single = itertools.cycle(rows)
+    results.add_latency("manager.single", sample(lambda: manager.score(next(single)), min_time, 200))
+
+    for size in batch_sizes:
+        batch = rows[:size]
+        results.add_throughput(f"manager.batch{size}", size, sample(lambda: manager.score_many(batch), min_time, 5))
+
+    models = manager.models
+    stages = {
+        "assemble": lambda batch, X: models.layout.assemble(batch),
+        "engagement": lambda batch, X: models._predict_quality_score(X),
+        "classification": lambda batch, X: models._predict_quality_class(X),
+        "watch_duration": lambda batch, X: models._predict_watch_duration(X),
+    }
+    for size in BREAKDOWN_SIZES:
+        batch = rows[:size]
+        X = models.layout.assemble(batch)
+        for stage, fn in stages.items():
+            times = sample(lambda: fn(batch, X), min_time / 2, 20)
+            results.add(f"model.{stage}.batch{size}.ms", np.median(times) * 1000, "ms")
+
+
+async def _bench_app(results: Results, batch_size: int, concurrency: int, min_time: float):
+    import httpx
+    import main
+
+    async with main.lifespan(main.app):
+        while not main.scoring_manager.ready:
+            if main.scoring_manager.load_error is not None:
+                raise main.scoring_manager.load_error
+            await asyncio.sleep(0.05)
+        rows = [m.model_dump() for m in synthetic_metrics(max(batch_size, 256))]
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def timed(path: str, body: Dict[str, Any]) -> float:
+                t0 = time.perf_counter()
+                response = await client.post(path, json=body)
+                response.raise_for_status()
+                return time.perf_counter() - t0
+
+            async def repeat(path: str, bodies: Callable[[int], Dict[str, Any]], min_repeats: int) -> np.ndarray:
+                for i in range(3):
+                    await timed(path, bodies(i))
+                times = []
+                started = time.perf_counter()
+                while len(times) < min_repeats or time.perf_counter() - started < min_time:
+                    times.append(await timed(path, bodies(len(times))))
+                return np.array(times)
+
+            results.add_latency("app.score", await repeat("/score", lambda i: rows[i % len(rows)], 200))
+            batch = {"videos": rows[:batch_size]}
+            results.add_throughput(f"app.batch{batch_size}", batch_size, await repeat("/score/batch", lambda i: batch, 5))
+
+            # Concurrent single-row requests, which the micro-batcher coalesces.
+            sent = 0
+            started = time.perf_counter()
+            while sent < 200 or time.perf_counter() - started < min_time:
+                await asyncio.gather(
+                    *(timed("/score", rows[(sent + i) % len(rows)]) for i in range(concurrency))
+                )
+                sent += concurrency
+            elapsed = time.perf_counter() - started
+            results.add(f"app.score_concurrent{concurrency}.rows_per_s", sent / elapsed, "rows/s", better="higher")
+
+
+def bench_startup(results: Results, engine: str, repeats: int):
+    """Import and load times of a fresh server process, which is also its peak RSS."""
+    probes = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--probe-startup", "--engine", engine],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        probe["process_s"] = time.perf_counter() - t0
+        probes.append(probe)
+    for key, unit in (("import_s", "s"), ("load_s", "s"), ("process_s", "s"), ("peak_rss_mb", "MB")):
+        results.add(f"startup.{key}", np.median([p[key] for p in probes]), unit)
+
+
+def probe_startup(engine: str):
+    os.environ["SCORING_ENGINE"] = engine
+    t0 = time.perf_counter()
+    import main
+
+    t1 = time.perf_counter()
+    main.scoring_manager.load()
+    t2 = time.perf_counter()
+    print(json.dumps({"import_s": t1 - t0, "load_s": t2 - t1, "peak_rss_mb": peak_rss_mb()}))
+
+
+def environment(engine: str) -> Dict[str, Any]:
+    import fastapi
+    import sklearn
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "engine": engine,
+        "seed": SEED,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scikit-learn": sklearn.__version__,
+        "fastapi": fastapi.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def threshold_for(name: str, default: float, overrides: Dict[str, float]) -> float:
+    for pattern, threshold in overrides.items():
+        if fnmatch.fnmatch(name, pattern):
+            return threshold
+    return default
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], default: float, overrides: Dict[str, float]) -> List[str]:
+    """Print a comparison table and return the names of regressed metrics."""
+    for key in ("engine", "machine", "cpu_count", "numpy", "scikit-learn"):
+        if current["environment"].get(key) != baseline["environment"].get(key):
+            print(
+                f"note: {key} differs from the baseline "
+                f"({baseline['environment'].get(key)} -> {current['environment'].get(key)})"
+            )
+    regressions = []
+    print(f"{'metric':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metric in current["metrics"].items():
+        old = baseline["metrics"].get(name)
+        if old is None or old["value"] == 0:
+            continue
+        change = metric["value"] / old["value"] - 1
+        worse = -change if metric["better"] == "higher" else change
+        threshold = threshold_for(name, default, overrides)
+        status = ""
+        if worse > threshold:
+            status = f"REGRESSION (> {threshold:.0%})"
+            regressions.append(name)
+        print(f"{name:<44} {old['value']:>12.4g} {metric['value']:>12.4g} {change:>+8.1%} {status}")
+    return regressions
+
+
+def parse_overrides(values: Sequence[str]) -> Dict[str, float]:
+    overrides = {}
+    for value in values:
+        pattern, _, threshold = value.partition("=")
+        overrides[pattern] = float(threshold)
+    return overrides
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark scoring latency, throughput, startup and memory.")
+    parser.add_argument("--engine", default=os.getenv("SCORING_ENGINE", "sklearn"))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=list(BATCH_SIZES))
+    parser.add_argument("--min-time", type=float, default=2.0, help="seconds spent on each measurement")
+    parser.add_argument("--startup-repeats", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--quick", action="store_true", help="short measurements, for smoke runs")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as the new baseline")
+    parser.add_argument("--compare", metavar="BASELINE", help="fail on regressions against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown (default 0.15)")
+    parser.add_argument(
+        "--metric-threshold",
+        action="append",
+        default=[],
+        metavar="PATTERN=FRACTION",
+        help="per-metric threshold, glob on the metric name, e.g. 'startup.*=0.3'; first match wins",
+    )
+    parser.add_argument("--probe-startup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe_startup:
+        probe_startup(args.engine)
+        return 0
+    if args.quick:
+        args.min_time, args.startup_repeats = 0.2, 1
+
+    # Measure the models, not the result caches.
+    os.environ["SCORING_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["SCORING_ENGINE"] = args.engine
+    results = Results()
+    bench_startup(results, args.engine, args.startup_repeats)
+    bench_manager(results, args.engine, args.batch_sizes, args.min_time)
+    asyncio.run(_bench_app(results, 64, args.concurrency, args.min_time))
+    results.add("bench.peak_rss_mb", peak_rss_mb(), "MB")
+
+    report = {"environment": environment(args.engine), "metrics": results.metrics}
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    if not args.compare:
+        for name, metric in results.metrics.items():
+            print(f"{name:<44} {metric['value']:>12.4g} {metric['unit']}")
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold, parse_overrides(args.metric_threshold))
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+# Recent executor waits kept for the percentile stats.
+WAIT_SAMPLES = 2048
+
+
+class OverloadedError(Exception):
+    """Raised when a request arrives while the admission queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Scoring queue is full")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded admission in front of a dedicated, fixed-size model executor.
+
+    Every scoring request must `admit()` first; once `max_pending` requests
+    are admitted and unfinished, new ones are rejected immediately with
+    OverloadedError instead of queueing without bound. All model work runs
+    on the `workers` executor threads, whose queue waits and run times are
+    recorded for `stats()`.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = 256, retry_after: int = 1):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="scoring")
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._queued = 0
+        self._running = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._tasks = 0
+        self._run_time = 0.0
+        self._waits: deque = deque(maxlen=WAIT_SAMPLES)
+
+    @contextmanager
+    def admit(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise OverloadedError(self.retry_after)
+            self._pending += 1
+            self._admitted += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue model work on the executor, timing its wait and run."""
+        enqueued = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def timed():
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._waits.append(started - enqueued)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._tasks += 1
+                    self._run_time += time.perf_counter() - started
+
+        return self.executor.submit(timed)
+
+    def call(self, fn: Callable, *args) -> Any:
+        """Run `fn` on the executor and block until it returns."""
+        return self.submit(fn, *args).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = np.array(self._waits) * 1000.0
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending_requests": self._pending,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "tasks": self._tasks,
+                "mean_run_ms": self._run_time / self._tasks * 1000.0 if self._tasks else 0.0,
+                "wait_ms": {
+                    "mean": float(waits.mean()) if len(waits) else 0.0,
+                    "p50": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                    "p99": float(np.percentile(waits, 99)) if len(waits) else 0.0,
+                    "max": float(waits.max()) if len(waits) else 0.0,
+                },
+            }
@@ -0,0 +1,181 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from schemas import VideoMetrics
+
+_STOP = object()
+
+# Upper edges of the reported batch-size histogram buckets.
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-video score calls into batched predicts.
+
+    Callers block in `score()` while a single worker thread gathers requests
+    for up to `window_ms` or until `max_batch_size` are queued, runs
+    `score_many` once over the batch and hands each caller its own row.
+
+    With `adaptive` on, the window is only waited out while a batch is still
+    being scored or recent batches actually coalesced more than one request,
+    so a lone request at low load is dispatched immediately instead of paying
+    the window as latency.
+
+    When `submit_batch` is given (e.g. `AdmissionController.submit`), batches
+    are handed to it instead of being scored on the collecting thread, so the
+    next batch can be gathered while the previous one runs.
+    """
+
+    def __init__(
+        self,
+        score_many: Callable[[Sequence[VideoMetrics]], List[Dict[str, Any]]],
+        max_batch_size: int = 64,
+        window_ms: float = 2.0,
+        adaptive: bool = True,
+        submit_batch: Optional[Callable[..., Future]] = None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.score_many = score_many
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self.adaptive = adaptive
+        self.submit_batch = submit_batch
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._load = 1.0  # exponentially weighted mean batch size
+        self._in_flight = 0  # batches handed to submit_batch and not finished
+        self._batches = 0
+        self._requests = 0
+        self._max_batch = 0
+        self._queue_wait = 0.0
+        self._histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+        self._thread = threading.Thread(
+            target=self._run, name="micro-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, metrics: VideoMetrics) -> Future:
+        future: Future = Future()
+        self._queue.put((metrics, future, time.perf_counter()))
+        return future
+
+    def score(self, metrics: VideoMetrics) -> Dict[str, Any]:
+        return self.submit(metrics).result()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            histogram = {
+                f"le_{edge}": count
+                for edge, count in zip(BATCH_SIZE_BUCKETS, self._histogram)
+            }
+            histogram[f"gt_{BATCH_SIZE_BUCKETS[-1]}"] = self._histogram[-1]
+            return {
+                "max_batch_size": self.max_batch_size,
+                "window_ms": self.window * 1000.0,
+                "adaptive": self.adaptive,
+                "in_flight": self._in_flight,
+                "batches": self._batches,
+                "requests": self._requests,
+                "mean_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "largest_batch": self._max_batch,
+                "mean_queue_wait_ms": (
+                    self._queue_wait / self._requests * 1000.0 if self._requests else 0.0
+                ),
+                "batch_size_histogram": histogram,
+            }
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        # With submit_batch the collector never blocks on scoring, so batch
+        # sizes alone would stay at 1 under load; a batch still running on the
+        # executor is the backlog that makes waiting for company worthwhile.
+        with self._lock:
+            busy = self._in_flight > 0 or self._load > 1.5
+        wait = self.window if not self.adaptive or busy else 0.0
+        deadline = time.perf_counter() + wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            if self.submit_batch is not None:
+                with self._lock:
+                    self._in_flight += 1
+                try:
+                    self.submit_batch(self._score_submitted, batch)
+                except BaseException:
+                    self._finished()
+                    raise
+            else:
+                self._score_batch(batch)
+
+    def _score_submitted(self, batch: list):
+        try:
+            self._score_batch(batch)
+        finally:
+            self._finished()
+
+    def _finished(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _score_batch(self, batch: list):
+        started = time.perf_counter()
+        # Callers that went away (e.g. a disconnected client cancelling its
+        # wrapped future) are dropped; the rest can no longer be cancelled, so
+        # setting their results below cannot fail.
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.score_many([metrics for metrics, _, _ in batch])
+        except Exception as exc:
+            logging.exception("Batched scoring failed for %d requests", len(batch))
+            for _, future, _ in batch:
+                future.set_exception(exc)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        self._record(batch, started)
+
+    def _record(self, batch: list, started: float):
+        size = len(batch)
+        with self._lock:
+            self._load = 0.8 * self._load + 0.2 * size
+            self._batches += 1
+            self._requests += size
+            self._max_batch = max(self._max_batch, size)
+            self._queue_wait += sum(started - enqueued for _, _, enqueued in batch)
+            for i, edge in enumerate(BATCH_SIZE_BUCKETS):
+                if size <= edge:
+                    self._histogram[i] += 1
+                    break
+            else:
+                self._histogram[-1] += 1
@@ -0,0 +1,139 @@
+import io
+import struct
+from typing import Dict, Mapping, Optional, Sequence
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is only needed for Arrow IPC payloads
+    pa = None
+
+# Raw columns: a header naming the columns, then every column as contiguous
+# little-endian float64 values (column-major). Layout, all integers little-endian:
+#   magic "LBC1" | uint16 n_columns | uint32 n_rows
+#   n_columns x (uint16 name length | UTF-8 name)
+#   zero padding to a multiple of 8 bytes
+#   n_columns * n_rows float64 values
+RAW = "application/vnd.lobang.columns"
+ARROW = "application/vnd.apache.arrow.stream"
+MEDIA_TYPES = (RAW, ARROW)
+MAGIC = b"LBC1"
+_HEADER = struct.Struct("<4sHI")
+_NAME_LENGTH = struct.Struct("<H")
+
+
+def request_format(content_type: Optional[str]) -> Optional[str]:
+    """RAW or ARROW for a columnar Content-Type, None for anything else (JSON)."""
+    if not content_type:
+        return None
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type if media_type in MEDIA_TYPES else None
+
+
+def _check_names(names: Sequence[str]):
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"Duplicate columns: {duplicated}")
+
+
+def _check_values(columns: Mapping[str, np.ndarray]):
+    for name, values in columns.items():
+        if not np.isfinite(values).all():
+            raise ValueError(f"Column {name} contains NaN or infinite values")
+
+
+def decode_raw(body: bytes) -> Dict[str, np.ndarray]:
+    """Columns of a raw payload as read-only views of `body`, without copying."""
+    if len(body) < _HEADER.size:
+        raise ValueError("Payload is shorter than the header")
+    magic, n_columns, n_rows = _HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise ValueError("Payload does not start with the LBC1 magic")
+    offset = _HEADER.size
+    names = []
+    for _ in range(n_columns):
+        if offset + _NAME_LENGTH.size > len(body):
+            raise ValueError("Payload ends inside the column names")
+        (length,) = _NAME_LENGTH.unpack_from(body, offset)
+        offset += _NAME_LENGTH.size
+        names.append(body[offset:offset + length].decode("utf-8"))
+        offset += length
+    _check_names(names)
+    offset += -offset % 8
+    if len(body) != offset + 8 * n_columns * n_rows:
+        raise ValueError(f"Expected {n_columns} columns of {n_rows} float64 values after the header")
+    values = np.frombuffer(body, dtype="<f8", count=n_columns * n_rows, offset=offset)
+    columns = dict(zip(names, values.reshape(n_columns, n_rows)))
+    _check_values(columns)
+    return columns
+
+
+def encode_raw(columns: Mapping[str, np.ndarray]) -> bytes:
+    names = [name.encode("utf-8") for name in columns]
+    n_rows = len(next(iter(columns.values()))) if columns else 0
+    header = io.BytesIO()
+    header.write(_HEADER.pack(MAGIC, len(names), n_rows))
+    for name in names:
+        header.write(_NAME_LENGTH.pack(len(name)))
+        header.write(name)
+    header.write(b"\0" * (-header.tell() % 8))
+    values = np.empty((len(names), n_rows), dtype="<f8")
+    for row, column in zip(values, columns.values()):
+        row[:] = column
+    return header.getvalue() + values.tobytes()
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Arrow payloads require pyarrow; send application/vnd.lobang.columns instead")
+
+
+def decode_arrow(body: bytes) -> Dict[str, np.ndarray]:
+    _require_pyarrow()
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except pa.ArrowException as exc:
+        raise ValueError(f"Invalid Arrow IPC stream: {exc}")
+    _check_names(table.column_names)
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        kind = column.type
+        if not (pa.types.is_integer(kind) or pa.types.is_floating(kind) or pa.types.is_boolean(kind)):
+            raise ValueError(f"Column {name} has non-numeric type {column.type}")
+        if column.null_count:
+            raise ValueError(f"Column {name} contains nulls")
+        # Zero-copy for a single chunk of float64; other numeric types are cast.
+        columns[name] = column.to_numpy().astype(np.float64, copy=False)
+    _check_values(columns)
+    return columns
+
+
+def encode_arrow(columns: Mapping[str, np.ndarray], categories: Mapping[str, Sequence[str]] = ()) -> bytes:
+    """Write `columns` as one Arrow record batch; `categories` maps integer code
+    columns to their labels, which are sent dictionary-encoded."""
+    _require_pyarrow()
+    categories = dict(categories)
+    arrays = []
+    for name, values in columns.items():
+        if name in categories:
+            arrays.append(
+                pa.DictionaryArray.from_arrays(
+                    pa.array(np.asarray(values, dtype=np.int8)), pa.array(list(categories[name]))
+                )
+            )
+        else:
+            arrays.append(pa.array(values))
+    batch = pa.RecordBatch.from_arrays(arrays, names=list(columns))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def decode(body: bytes, media_type: str) -> Dict[str, np.ndarray]:
+    return decode_arrow(body) if media_type == ARROW else decode_raw(body)
+
+
+def encode(columns: Mapping[str, np.ndarray], media_type: str, categories: Mapping[str, Sequence[str]] = ()) -> bytes:
+    return encode_arrow(columns, categories) if media_type == ARROW else encode_raw(columns)
@@ -0,0 +1,211 @@
+import logging
+import math
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from nearest_centroid import NearestCentroid
+from tree_engine import (
+    CompiledBoosting,
+    CompiledForest,
+    CompiledHistBoosting,
+    CompiledImputer,
+    CompiledLinear,
+    CompiledPipeline,
+    CompiledStack,
+    CompiledStandardScaler,
+    probe_matrix,
+)
+
+# Above this many features exact baseline Shapley (2^n coalitions per row) is
+# replaced by one-at-a-time occlusion.
+MAX_SHAPLEY_FEATURES = 10
+# Elementwise transforms that keep every column where it is, so contributions
+# computed after them still belong to the same input feature.
+COLUMNWISE = (CompiledImputer, CompiledStandardScaler)
+
+Decomposition = Tuple[np.ndarray, np.ndarray]  # (bias per row, (rows, features) contributions)
+
+
+@lru_cache(maxsize=None)
+def _shapley_weights(n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Coalition masks and the matrix that turns coalition values into Shapley values.
+
+    With v the (rows, 2^n) values of f on every coalition, `v @ weights`
+    gives the exact Shapley value of each feature against the reference.
+    """
+    n_coalitions = 1 << n_features
+    masks = ((np.arange(n_coalitions)[:, None] >> np.arange(n_features)) & 1).astype(bool)
+    sizes = masks.sum(axis=1)
+    factorial = [math.factorial(k) for k in range(n_features + 1)]
+    weights = np.zeros((n_coalitions, n_features))
+    for s in range(n_coalitions):
+        size = sizes[s]
+        for j in range(n_features):
+            if masks[s, j]:
+                weights[s, j] = factorial[size - 1] * factorial[n_features - size] / factorial[n_features]
+            else:
+                weights[s, j] = -factorial[size] * factorial[n_features - size - 1] / factorial[n_features]
+    return masks, weights
+
+
+def baseline_shapley(predict, X: np.ndarray, reference: np.ndarray) -> Decomposition:
+    """Model-agnostic attribution of `predict` against a single reference row."""
+    n_rows, n_features = X.shape
+    if n_features > MAX_SHAPLEY_FEATURES:
+        base = np.asarray(predict(reference[None, :]), dtype=np.float64)[0]
+        occluded = np.repeat(X[:, None, :], n_features, axis=1)
+        idx = np.arange(n_features)
+        occluded[:, idx, idx] = reference
+        full = np.asarray(predict(X), dtype=np.float64)
+        without = np.asarray(predict(occluded.reshape(-1, n_features)), dtype=np.float64)
+        return np.full(n_rows, base), full[:, None] - without.reshape(n_rows, n_features)
+    masks, weights = _shapley_weights(n_features)
+    coalitions = np.where(masks[None, :, :], X[:, None, :], reference)
+    values = np.asarray(predict(coalitions.reshape(-1, n_features)), dtype=np.float64)
+    values = values.reshape(n_rows, len(masks))
+    return values[:, 0], values @ weights
+
+
+def reference_point(model, n_features: int) -> np.ndarray:
+    """Training means recorded by the model's own imputer or scaler, else zeros."""
+    pending = [model]
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, CompiledPipeline):
+            for step in node.transforms:
+                if isinstance(step, CompiledImputer) and len(step.statistics) == n_features:
+                    return np.array(step.statistics, dtype=np.float64)
+                if isinstance(step, CompiledStandardScaler) and step.mean is not None:
+                    if len(step.mean) == n_features:
+                        return np.array(step.mean, dtype=np.float64)
+        pending.extend(getattr(node, "members", []))
+    logging.info("No training means in %s, linear and Shapley parts use a zero reference", type(model).__name__)
+    return np.zeros(n_features)
+
+
+def decompose(model, X: np.ndarray, reference: np.ndarray) -> Decomposition:
+    """Split each prediction of a compiled model into a bias and per-feature parts.
+
+    Trees use their decision paths and linear steps their coefficients, which
+    both add up exactly. A stack combines member parts through a linear final
+    estimator exactly; a tree final estimator's credit to each member is split
+    over that member's features in proportion to their parts. Anything else is
+    explained by baseline Shapley values against `reference`.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if isinstance(model, CompiledForest):
+        weights = np.full(model.forest.n_trees, 1.0 / model.forest.n_trees)
+        return model.forest.contributions(X, weights)
+    if isinstance(model, CompiledBoosting):
+        weights = np.full(model.forest.n_trees, model.learning_rate)
+        bias, contrib = model.forest.contributions(X, weights)
+        return bias + model._init(X), contrib
+    if isinstance(model, CompiledHistBoosting):
+        bias, contrib = model.forest.contributions(X, np.ones(model.forest.n_trees))
+        return bias + model.baseline, contrib
+    if isinstance(model, CompiledLinear):
+        contrib = (X - reference) * model.coef
+        return np.full(len(X), float(reference @ model.coef) + model.intercept), contrib
+    if isinstance(model, CompiledPipeline) and all(isinstance(s, COLUMNWISE) for s in model.transforms):
+        for step in model.transforms:
+            X = step.transform(X)
+            reference = step.transform(reference[None, :])[0]
+        return decompose(model.final, X, reference)
+    if isinstance(model, CompiledStack):
+        return _decompose_stack(model, X, reference)
+    return baseline_shapley(model.predict, X, reference)
+
+
+def _decompose_stack(model: CompiledStack, X: np.ndarray, reference: np.ndarray) -> Decomposition:
+    parts = [decompose(member, X, reference) for member in model.members]
+    meta = np.column_stack([bias + contrib.sum(axis=1) for bias, contrib in parts])
+    if model.passthrough:
+        meta = np.column_stack([meta, X])
+        parts = parts + [(np.zeros(len(X)), np.eye(X.shape[1])[j] * X[:, j, None]) for j in range(X.shape[1])]
+
+    final = model.final
+    if isinstance(final, CompiledLinear):
+        bias = np.full(len(X), final.intercept)
+        contrib = np.zeros_like(X)
+        for weight, (member_bias, member_contrib) in zip(final.coef, parts):
+            bias += weight * member_bias
+            contrib += weight * member_contrib
+        if model.passthrough:
+            # Passthrough columns were credited in full; move their reference share to the bias.
+            passthrough = final.coef[len(model.members):]
+            bias += reference @ passthrough
+            contrib -= reference * passthrough
+        return bias, contrib
+
+    meta_reference = np.array([b[0] for b, _ in parts], dtype=np.float64)
+    bias, credit = decompose(final, meta, meta_reference)
+    contrib = np.zeros_like(X)
+    for m, (member_bias, member_contrib) in enumerate(parts):
+        moved = meta[:, m] - member_bias
+        share = np.divide(
+            member_contrib,
+            moved[:, None],
+            out=np.full_like(member_contrib, 1.0 / X.shape[1]),
+            where=np.abs(moved[:, None]) > 1e-12,
+        )
+        contrib += credit[:, m, None] * share
+    return bias, contrib
+
+
+class RegressionExplainer:
+    """Per-feature contributions for one compiled regressor, set up once at load."""
+
+    def __init__(self, model, features: Sequence[str]):
+        self.model = model
+        self.features = list(features)
+        self.reference = reference_point(model, len(self.features))
+        self._check()
+
+    def _check(self):
+        X = probe_matrix(self.model, len(self.features), n_rows=64)
+        bias, contrib = decompose(self.model, X, self.reference)
+        error = float(np.max(np.abs(bias + contrib.sum(axis=1) - self.model.predict(X))))
+        log = logging.info if error < 1e-6 else logging.warning
+        log("Explanations of %s add up to the prediction within %g", type(self.model).__name__, error)
+
+    def explain(self, X: np.ndarray) -> List[Dict[str, Any]]:
+        bias, contrib = decompose(self.model, X, self.reference)
+        return [
+            {
+                "base_value": float(b),
+                "contributions": dict(zip(self.features, map(float, row))),
+            }
+            for b, row in zip(bias, contrib)
+        ]
+
+
+class ClusterExplainer:
+    """KMeans assignment explained by each feature's share of the distance margin.
+
+    For the assigned centre k and the runner-up r, feature j contributes
+    (z_j - r_j)^2 - (z_j - k_j)^2 in the scaled space of the classifier; the
+    sum is the squared-distance margin by which k won.
+    """
+
+    def __init__(self, classifier: NearestCentroid, features: Sequence[str], labels: Sequence[str]):
+        self.classifier = classifier
+        self.features = list(features)
+        self.labels = list(labels)
+
+    def explain(self, X: np.ndarray) -> List[Dict[str, Any]]:
+        Z = self.classifier.transform(X)
+        centers = self.classifier.centers
+        squared = (Z[:, None, :] - centers[None, :, :]) ** 2
+        order = np.argsort(squared.sum(axis=2), axis=1)
+        rows = np.arange(len(Z))
+        margin = squared[rows, order[:, 1]] - squared[rows, order[:, 0]]
+        return [
+            {
+                "runner_up": self.labels[self.classifier.codes[second]],
+                "margin": float(row.sum()),
+                "contributions": dict(zip(self.features, map(float, row))),
+            }
+            for second, row in zip(order[:, 1], margin)
+        ]
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Mapping, Sequence, Tuple
+
+import numpy as np
+from schemas import VideoMetrics
+
+
+@dataclass(frozen=True)
+class FeatureSchema:
+    """Ordered input columns of one model artifact."""
+
+    model: str
+    features: Tuple[str, ...]
+
+
+# Built-in column orders, only used for artifacts trained before the
+# training scripts started writing a `.features.json` sidecar.
+ENGAGEMENT_SCHEMA = FeatureSchema(
+    "engagement",
+    (
+        "video_duration_sec",
+        "verified_status",
+        "author_ban_status",
+        "share_ratio",
+        "comment_ratio",
+    ),
+)
+CLASSIFICATION_SCHEMA = FeatureSchema(
+    "classification",
+    (
+        "video_duration_sec",
+        "verified_status",
+        "author_ban_status",
+        "like_ratio",
+        "share_ratio",
+        "comment_ratio",
+    ),
+)
+WATCH_DURATION_SCHEMA = FeatureSchema(
+    "watch_duration",
+    (
+        "like_ratio",
+        "comment_ratio",
+        "share_ratio",
+        "title_length",
+        "description_length",
+        "edge_intensity",
+        "color_histogram",
+        "spectral_entropy",
+        "audio_intensity",
+    ),
+)
+
+
+def schema_path(artifact_path: str) -> str:
+    return os.path.splitext(artifact_path)[0] + ".features.json"
+
+
+def load_feature_schema(artifact_path: str, default: FeatureSchema, model=None) -> FeatureSchema:
+    """Read the column order saved next to a model artifact.
+
+    Raises ValueError when the schema names a column VideoMetrics does not
+    have, or disagrees with the feature names the estimator was fitted on.
+    """
+    path = schema_path(artifact_path)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            schema = FeatureSchema(default.model, tuple(json.load(f)["features"]))
+    else:
+        logging.warning(
+            "No feature schema at %s, assuming the built-in %s column order",
+            path,
+            default.model,
+        )
+        schema = default
+
+    unknown = [name for name in schema.features if name not in VideoMetrics.model_fields]
+    if unknown:
+        raise ValueError(f"{path} lists features VideoMetrics does not provide: {unknown}")
+    fitted = getattr(model, "feature_names_in_", None)
+    if fitted is not None and list(fitted) != list(schema.features):
+        raise ValueError(
+            f"{artifact_path} was fitted on {list(fitted)} but its schema lists {list(schema.features)}"
+        )
+    return schema
+
+
+class FeatureLayout:
+    """Packs requests into one float matrix shared by every model.
+
+    Each model's features occupy a contiguous block of columns, in the order
+    of its schema, so `project()` hands the model a view of the packed matrix
+    instead of a copy. A field used by several models is read from the
+    request objects once and written into each block that needs it.
+    """
+
+    def __init__(self, schemas: Sequence[FeatureSchema]):
+        self.schemas = {schema.model: schema for schema in schemas}
+        self.columns = [name for schema in schemas for name in schema.features]
+        self.blocks: Dict[str, slice] = {}
+        start = 0
+        for schema in schemas:
+            self.blocks[schema.model] = slice(start, start + len(schema.features))
+            start += len(schema.features)
+        self.fields = list(dict.fromkeys(self.columns))
+        self._targets = {
+            name: np.array([j for j, column in enumerate(self.columns) if column == name])
+            for name in self.fields
+        }
+        self._integral = [name for name in self.fields if VideoMetrics.model_fields[name].annotation is int]
+
+    def assemble(self, metrics_list: Sequence[VideoMetrics]) -> np.ndarray:
+        n = len(metrics_list)
+        X = np.empty((n, len(self.columns)), dtype=np.float64)
+        for name, targets in self._targets.items():
+            values = np.fromiter((getattr(m, name) for m in metrics_list), np.float64, count=n)
+            X[:, targets] = values[:, None]
+        return X
+
+    def from_columns(self, columns: Mapping[str, np.ndarray]) -> np.ndarray:
+        """Pack already columnar input (one 1-d array per VideoMetrics field)."""
+        missing = [name for name in self.fields if name not in columns]
+        if missing:
+            raise ValueError(f"Missing feature columns: {missing}")
+        # Integer fields accept whole numbers only, as VideoMetrics does for JSON.
+        fractional = [name for name in self._integral if not np.all(np.mod(columns[name], 1) == 0)]
+        if fractional:
+            raise ValueError(f"Columns {fractional} must hold whole numbers")
+        n = len(columns[self.fields[0]])
+        X = np.empty((n, len(self.columns)), dtype=np.float64)
+        for name, targets in self._targets.items():
+            X[:, targets] = np.asarray(columns[name], dtype=np.float64)[:, None]
+        return X
+
+    def project(self, X: np.ndarray, model: str) -> np.ndarray:
+        return X[:, self.blocks[model]]
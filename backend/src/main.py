@@ -1,19 +1,385 @@
-from fastapi import FastAPI
-from scoring_manager import ScoringManager
-from schemas import VideoMetrics
-import logging
+import asyncio
+import functools
+import hmac
+import os
+import pickle
+from contextlib import asynccontextmanager
+from typing import Literal
 
-app = FastAPI()
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response
+from pydantic import ValidationError
+from admission import AdmissionController, OverloadedError
+from batching import MicroBatcher
+from model_registry import REGISTRY_DIR, RegistryWatcher, list_versions, version_dir
+from model_store import memory_report
+from prediction_cache import PredictionCache
+from scoring_manager import MODES, QUALITY_MAP, ScoringManager
+from schemas import VideoMetrics, VideoMetricsBatch, VideoSource
+import columnar
+import streaming
+import telemetry
+from video_features import FeatureExtractor
+import logging
 
-scoring_manager = ScoringManager()
 logging.basicConfig(level=logging.DEBUG)
 
+# Models load on a background thread once the app starts, so importing this
+# module and answering /health never waits on the pickles. The version named
+# by models/registry/CURRENT is served if present, else the files in models/.
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", REGISTRY_DIR)
+scoring_manager = ScoringManager(
+    engine=os.getenv("SCORING_ENGINE", "sklearn"),
+    mmap=os.getenv("SCORING_MMAP", "0") == "1",
+    lazy=True,
+    registry_dir=MODEL_REGISTRY_DIR,
+    feature_extractor=FeatureExtractor(
+        sample_every=int(os.getenv("VIDEO_SAMPLE_EVERY", "5")),
+        max_frames=int(os.getenv("VIDEO_MAX_FRAMES", "600")) or None,
+        workers=int(os.getenv("VIDEO_WORKERS", "0")) or None,
+        parallel_min_frames=int(os.getenv("VIDEO_PARALLEL_MIN_FRAMES", "128")),
+    ),
+)
+# /video/metrics only reads media from below this directory.
+VIDEO_MEDIA_ROOT = os.path.realpath(os.getenv("VIDEO_MEDIA_ROOT", "media"))
+
+# All model work runs on a fixed-size executor behind a bounded admission
+# queue; requests beyond SCORING_MAX_PENDING are shed with a 503.
+admission = AdmissionController(
+    workers=int(os.getenv("SCORING_WORKERS", "0")) or None,
+    max_pending=int(os.getenv("SCORING_MAX_PENDING", "256")),
+    retry_after=int(os.getenv("SCORING_RETRY_AFTER_SECONDS", "1")),
+)
+
+# Concurrent /score calls are coalesced into batched predicts, separately for
+# each scoring mode. Set SCORING_BATCH_MAX_SIZE=1 to score every request on its own.
+batchers = {
+    mode: MicroBatcher(
+        functools.partial(scoring_manager.score_many, mode=mode),
+        max_batch_size=int(os.getenv("SCORING_BATCH_MAX_SIZE", "64")),
+        window_ms=float(os.getenv("SCORING_BATCH_WINDOW_MS", "2")),
+        adaptive=os.getenv("SCORING_BATCH_ADAPTIVE", "1") == "1",
+        submit_batch=admission.submit,
+    )
+    for mode in MODES
+}
+batcher = batchers["full"]
+# mode=fast uses the distilled surrogates where they exist (training/distill.py).
+ScoringMode = Literal["full", "fast"]
+
+# Rows per scoring call on /score/stream.
+STREAM_CHUNK_SIZE = int(os.getenv("SCORING_STREAM_CHUNK_SIZE", "1024"))
+
+# Optional result cache, enabled by giving it a size.
+cache = None
+if int(os.getenv("SCORING_CACHE_MAX_ENTRIES", "0")) > 0:
+    cache_mb = os.getenv("SCORING_CACHE_MAX_MB")
+    cache_ttl = float(os.getenv("SCORING_CACHE_TTL_SECONDS", "300"))
+    cache_decimals = os.getenv("SCORING_CACHE_DECIMALS", "6")
+    cache = PredictionCache(
+        max_entries=int(os.getenv("SCORING_CACHE_MAX_ENTRIES")),
+        ttl_seconds=cache_ttl if cache_ttl > 0 else None,
+        max_bytes=int(float(cache_mb) * 1024 * 1024) if cache_mb else None,
+        decimals=int(cache_decimals) if cache_decimals != "exact" else None,
+    )
+
+# Explanations are cached separately, keyed the same way as scores.
+explain_cache = None
+if int(os.getenv("EXPLAIN_CACHE_MAX_ENTRIES", "1024")) > 0:
+    explain_cache = PredictionCache(
+        max_entries=int(os.getenv("EXPLAIN_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=float(os.getenv("SCORING_CACHE_TTL_SECONDS", "300")) or None,
+    )
+
+
+def flush_caches(*_):
+    for result_cache in (cache, explain_cache):
+        if result_cache is not None:
+            result_cache.clear()
+
+
+# Cached results belong to the models that computed them.
+scoring_manager.add_swap_listener(flush_caches)
+
+# Admin endpoints are disabled unless a token is configured.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+MODEL_REGISTRY_WATCH_SECONDS = float(os.getenv("MODEL_REGISTRY_WATCH_SECONDS", "0"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scoring_manager.start_loading()
+    watcher = None
+    if MODEL_REGISTRY_WATCH_SECONDS > 0:
+        watcher = RegistryWatcher(
+            MODEL_REGISTRY_DIR, scoring_manager.reload, MODEL_REGISTRY_WATCH_SECONDS
+        )
+    yield
+    if watcher is not None:
+        watcher.close()
+    for mode_batcher in batchers.values():
+        mode_batcher.close()
+    admission.shutdown()
+    scoring_manager.feature_extractor.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(telemetry.MetricsMiddleware)
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded(request: Request, exc: OverloadedError):
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def require_ready():
+    if not scoring_manager.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Models are still loading",
+            headers={"Retry-After": "1"},
+        )
+
 
 @app.get("/health")
 def health():
     return {"message": "health ok"}
 
 
+@app.get("/ready")
+def ready():
+    body = {
+        "ready": scoring_manager.ready,
+        "version": scoring_manager.version,
+        "models": scoring_manager.load_timings,
+        "fast_models": scoring_manager.fast_models,
+    }
+    if scoring_manager.load_error is not None:
+        body["error"] = repr(scoring_manager.load_error)
+    return JSONResponse(body, status_code=200 if scoring_manager.ready else 503)
+
+
+def submit_batch(videos):
+    return admission.submit(scoring_manager.score_many, videos)
+
+
+def explain_one(metrics):
+    return scoring_manager.explain_many([metrics])[0]
+
+
+@app.post("/score", dependencies=[Depends(require_ready)])
+async def score(metrics: VideoMetrics, request: Request, mode: ScoringMode = "full"):
+    telemetry.observe_validation(request)
     logging.info(metrics)
-    prediction = scoring_manager.score(metrics)
+    with admission.admit():
+        # The result cache only holds full-model scores.
+        if cache is not None and mode == "full":
+            prediction = await asyncio.wrap_future(cache.submit(metrics, batcher.submit))
+        else:
+            prediction = await asyncio.wrap_future(batchers[mode].submit(metrics))
     return {"score": prediction}
+
+
+# /score/batch reads its body itself to also accept columnar payloads, so the
+# JSON schema is declared here instead of being inferred from a parameter.
+BATCH_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "application/json": {
+            "schema": VideoMetricsBatch.model_json_schema(ref_template="#/components/schemas/{model}")
+        },
+        **{media_type: {"schema": {"type": "string", "format": "binary"}} for media_type in columnar.MEDIA_TYPES},
+    },
+}
+BATCH_REQUEST_BODY["content"]["application/json"]["schema"].pop("$defs", None)
+
+
+async def score_columnar(body: bytes, media_type: str, mode: str) -> Response:
+    try:
+        columns = columnar.decode(body, media_type)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=415, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    try:
+        with admission.admit():
+            predictions = await asyncio.wrap_future(
+                admission.submit(scoring_manager.score_columns, columns, mode)
+            )
+    except ValueError as exc:  # missing feature columns, or fractional integer fields
+        raise HTTPException(status_code=422, detail=str(exc))
+    content = columnar.encode(predictions, media_type, {"quality_class": QUALITY_MAP})
+    return Response(content, media_type=media_type, headers={"X-Quality-Classes": ",".join(QUALITY_MAP)})
+
+
+@app.post("/score/batch", dependencies=[Depends(require_ready)], openapi_extra={"requestBody": BATCH_REQUEST_BODY})
+async def score_batch(request: Request, mode: ScoringMode = "full"):
+    body = await request.body()
+    media_type = columnar.request_format(request.headers.get("content-type"))
+    if media_type is not None:
+        telemetry.observe_validation(request)
+        return await score_columnar(body, media_type, mode)
+    try:
+        batch = VideoMetricsBatch.model_validate_json(body)
+    except ValidationError as exc:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in exc.errors(include_url=False)]
+        )
+    telemetry.observe_validation(request)
+    logging.info("Scoring batch of %d videos", len(batch.videos))
+    with admission.admit():
+        if cache is not None and mode == "full":
+            predictions = await asyncio.wrap_future(cache.submit_many(batch.videos, submit_batch))
+        else:
+            predictions = await asyncio.wrap_future(
+                admission.submit(scoring_manager.score_many, batch.videos, mode)
+            )
+    return {"scores": predictions}
+
+
+@app.post("/score/explain", dependencies=[Depends(require_ready)])
+async def score_explain(metrics: VideoMetrics, request: Request):
+    telemetry.observe_validation(request)
+    with admission.admit():
+        if explain_cache is not None:
+            explanation = await asyncio.wrap_future(
+                explain_cache.submit(metrics, functools.partial(admission.submit, explain_one))
+            )
+        else:
+            explained = await asyncio.wrap_future(
+                admission.submit(scoring_manager.explain_many, [metrics])
+            )
+            explanation = explained[0]
+    return {"explanation": explanation}
+
+
+@app.post("/score/stream", dependencies=[Depends(require_ready)])
+async def score_stream(request: Request, mode: ScoringMode = "full"):
+    fmt = streaming.input_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send application/x-ndjson or text/csv")
+    # The whole upload holds one admission slot until the response is over,
+    # released by the response itself since the body may never be iterated.
+    admitted = admission.admit()
+    admitted.__enter__()
+
+    def score_chunk(videos):
+        return asyncio.wrap_future(admission.submit(scoring_manager.score_many, videos, mode))
+
+    try:
+        body = streaming.score_stream(streaming.iter_lines(request.stream()), fmt, score_chunk, STREAM_CHUNK_SIZE)
+        return streaming.UploadStreamingResponse(
+            body, media_type=fmt, on_close=lambda: admitted.__exit__(None, None, None)
+        )
+    except BaseException:
+        admitted.__exit__(None, None, None)
+        raise
+
+
+def media_path(path: str) -> str:
+    resolved = os.path.realpath(os.path.join(VIDEO_MEDIA_ROOT, path))
+    if os.path.commonpath([resolved, VIDEO_MEDIA_ROOT]) != VIDEO_MEDIA_ROOT:
+        raise HTTPException(status_code=400, detail=f"{path} is outside the media directory")
+    if not os.path.exists(resolved):
+        raise HTTPException(status_code=404, detail=f"{path} not found")
+    return resolved
+
+
+@app.post("/video/metrics")
+def video_metrics(source: VideoSource):
+    source = source.model_copy(
+        update={
+            "frames_path": media_path(source.frames_path),
+            "audio_path": media_path(source.audio_path),
+        }
+    )
+    try:
+        metrics, timings = scoring_manager.video2metrics(source)
+    except (ValueError, RuntimeError) as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    except (OSError, EOFError, pickle.UnpicklingError) as exc:
+        # Unreadable or truncated media (a directory given as the WAV, an
+        # image Pillow cannot identify, a corrupt .npy) is the client's input.
+        raise HTTPException(status_code=422, detail=f"Unreadable media: {exc}")
+    return {"metrics": metrics, "timings": timings}
+
+
+@app.get("/stats/admission")
+def admission_stats():
+    return admission.stats()
+
+
+@app.get("/stats/batching")
+def batching_stats():
+    return {**batcher.stats(), "fast": batchers["fast"].stats()}
+
+
+@app.get("/stats/cache")
+def cache_stats():
+    return cache.stats() if cache is not None else {"enabled": False}
+
+
+@app.delete("/cache", dependencies=[Depends(require_admin)])
+def flush_cache():
+    flush_caches()
+    return {"message": "cache cleared"}
+
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+def admin_models():
+    return {
+        "current": scoring_manager.version,
+        "loading": scoring_manager.loading,
+        "available": list_versions(MODEL_REGISTRY_DIR),
+        "models": scoring_manager.load_timings,
+        "error": repr(scoring_manager.load_error) if scoring_manager.load_error else None,
+    }
+
+
+@app.post("/admin/models/reload", status_code=202, dependencies=[Depends(require_admin)])
+def admin_reload(version: str = None):
+    """Load `version` (default: what CURRENT names) in the background and swap it in."""
+    if version is not None:
+        try:
+            directory = version_dir(MODEL_REGISTRY_DIR, version)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        if not os.path.isdir(directory):
+            raise HTTPException(status_code=404, detail=f"Model version {version} not found")
+    try:
+        scoring_manager.reload(version)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"loading": version or "current", "serving": scoring_manager.version}
+
+
+@app.get("/metrics")
+def metrics():
+    admission_stats = admission.stats()
+    for stat in ("pending_requests", "queue_depth", "running", "admitted", "rejected"):
+        telemetry.ADMISSION.labels(stat).set(admission_stats[stat])
+    batching_stats = batcher.stats()
+    for stat in ("batches", "requests", "mean_queue_wait_ms"):
+        telemetry.BATCHER.labels(stat).set(batching_stats[stat])
+    if cache is not None:
+        cache_stats = cache.stats()
+        for stat in ("entries", "bytes", "hits", "misses", "coalesced", "evictions", "expirations"):
+            telemetry.CACHE.labels(stat).set(cache_stats[stat])
+    return Response(telemetry.render(), media_type=telemetry.CONTENT_TYPE)
+
+
+@app.get("/memory")
+def memory():
+    return memory_report()
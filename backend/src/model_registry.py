@@ -0,0 +1,143 @@
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from typing import Callable, List, Optional
+
+# models/registry/<version>/ holds one complete model set (the three pickles and
+# their .features.json / .centroids.npz sidecars, plus any _fast surrogates);
+# CURRENT names the version being served.
+REGISTRY_DIR = "models/registry"
+CURRENT_FILE = "CURRENT"
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+
+def check_version(version: str) -> str:
+    if not VERSION_PATTERN.match(version):
+        raise ValueError(f"Invalid model version {version!r}")
+    return version
+
+
+def version_dir(registry_dir: str, version: str) -> str:
+    return os.path.join(registry_dir, check_version(version))
+
+
+def list_versions(registry_dir: str) -> List[str]:
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(registry_dir)
+        if VERSION_PATTERN.match(name) and os.path.isdir(os.path.join(registry_dir, name))
+    )
+
+
+def current_version(registry_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(registry_dir, CURRENT_FILE)) as f:
+            return check_version(f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def set_current(registry_dir: str, version: str):
+    """Point CURRENT at `version` with an atomic rename, so watchers never see a partial file."""
+    if not os.path.isdir(version_dir(registry_dir, version)):
+        raise FileNotFoundError(f"Model version {version} is not in {registry_dir}")
+    fd, tmp = tempfile.mkstemp(dir=registry_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(version + "\n")
+        os.replace(tmp, os.path.join(registry_dir, CURRENT_FILE))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def publish(source_dir: str, registry_dir: str, version: str, activate: bool = True) -> str:
+    """Copy a directory of trained artifacts in as `version`, optionally making it current.
+
+    The copy is made under a temporary name and renamed into place, so a
+    half-copied version is never visible to a loading server.
+    """
+    target = version_dir(registry_dir, version)
+    if os.path.exists(target):
+        raise FileExistsError(f"Model version {version} already exists")
+    os.makedirs(registry_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=registry_dir, prefix=".staging-")
+    try:
+        for name in os.listdir(source_dir):
+            if name.endswith((".pkl", ".features.json", ".centroids.npz")):
+                shutil.copy2(os.path.join(source_dir, name), staging)
+        os.rename(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if activate:
+        set_current(registry_dir, version)
+    return target
+
+
+class RegistryWatcher:
+    """Poll CURRENT and call `on_change(version)` whenever it names a new version.
+
+    If `on_change` raises (e.g. another load is still running) the same
+    version is offered again on the next poll.
+    """
+
+    def __init__(self, registry_dir: str, on_change: Callable[[str], None], interval: float = 5.0):
+        self.registry_dir = registry_dir
+        self.on_change = on_change
+        self.interval = interval
+        self._seen = current_version(registry_dir)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="registry-watcher", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                version = current_version(self.registry_dir)
+            except ValueError:
+                logging.exception("Ignoring unreadable %s", CURRENT_FILE)
+                continue
+            if version is not None and version != self._seen:
+                logging.info("Model registry now points at %s", version)
+                try:
+                    self.on_change(version)
+                except Exception:
+                    # Not marked as seen, so the change is retried on the next poll.
+                    logging.exception("Could not start loading model version %s", version)
+                    continue
+                self._seen = version
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry.")
+    parser.add_argument("--registry", default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish_cmd = commands.add_parser("publish", help="add a directory of artifacts as a version")
+    publish_cmd.add_argument("source")
+    publish_cmd.add_argument("version")
+    publish_cmd.add_argument("--no-activate", action="store_true")
+    activate_cmd = commands.add_parser("activate", help="point CURRENT at an existing version")
+    activate_cmd.add_argument("version")
+    commands.add_parser("list", help="list versions, marking the current one")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        print(publish(args.source, args.registry, args.version, activate=not args.no_activate))
+    elif args.command == "activate":
+        set_current(args.registry, args.version)
+    else:
+        current = current_version(args.registry)
+        for version in list_versions(args.registry):
+            print(("* " if version == current else "  ") + version)
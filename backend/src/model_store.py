@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+
+import joblib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+# Bump when the layout or contents of the cached objects change so stale files
+# are rebuilt.
+SHARED_FORMAT_VERSION = 3
+SHARED_DIR_NAME = ".shared"
+
+
+def _artifact_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def shared_path(artifact_path: str) -> str:
+    directory = os.path.join(os.path.dirname(artifact_path), SHARED_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(artifact_path))[0]
+    return os.path.join(
+        directory,
+        f"{stem}-v{SHARED_FORMAT_VERSION}-{_artifact_digest(artifact_path)}.joblib",
+    )
+
+
+def load_shared(artifact_path: str, build: Callable[[Any], Any]):
+    """Load `build(joblib.load(artifact_path))` as read-only memory-mapped arrays.
+
+    The built object is dumped once, uncompressed, under `models/.shared/`
+    keyed on the artifact's content hash. Every process then maps that file
+    with `mmap_mode="r"`, so the NumPy arrays inside it live in the page cache
+    once instead of once per uvicorn worker. Workers starting together take a
+    file lock so only the first one builds the file.
+    """
+    path = shared_path(artifact_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        with open(path + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(path):
+                logging.info("Building shared model file %s", path)
+                built = build(joblib.load(artifact_path))
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                os.close(fd)
+                joblib.dump(built, tmp)
+                os.replace(tmp, path)
+    return joblib.load(path, mmap_mode="r")
+
+
+def _smaps_rollup(pid: int) -> Dict[str, int]:
+    """Memory counters of a process in bytes, from /proc/<pid>/smaps_rollup."""
+    counters = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                counters[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return counters
+
+
+def _cmdline(pid: int) -> Optional[bytes]:
+    """Command line with digits removed, since spawned workers differ only by fd numbers."""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return re.sub(rb"\d+", b"", f.read())
+    except OSError:
+        return None
+
+
+def _sibling_workers() -> List[int]:
+    """This process and every sibling started with the same command line.
+
+    uvicorn's `--workers` processes are children of one supervisor and share
+    their command line, which is how they are told apart from unrelated
+    children of the same parent.
+    """
+    own_pid, parent = os.getpid(), os.getppid()
+    own_cmdline = _cmdline(own_pid)
+    workers = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if pid == own_pid or (ppid == parent and _cmdline(pid) == own_cmdline):
+            workers.append(pid)
+    return sorted(workers)
+
+
+def memory_report() -> Dict[str, Any]:
+    """Per-worker and total memory of the serving processes.
+
+    `pss` charges each shared page 1/n to each of the n processes mapping it,
+    so the PSS total is the real footprint of all workers together, while the
+    RSS total counts shared model pages once per worker.
+    """
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"pid": os.getpid(), "peak_rss_kb": peak, "workers": [], "detail": "no /proc"}
+
+    workers = []
+    for pid in _sibling_workers():
+        try:
+            counters = _smaps_rollup(pid)
+        except OSError:
+            continue
+        workers.append(
+            {
+                "pid": pid,
+                "rss_mb": counters.get("Rss", 0) / 2**20,
+                "pss_mb": counters.get("Pss", 0) / 2**20,
+                "shared_mb": (counters.get("Shared_Clean", 0) + counters.get("Shared_Dirty", 0)) / 2**20,
+                "private_mb": (counters.get("Private_Clean", 0) + counters.get("Private_Dirty", 0)) / 2**20,
+            }
+        )
+    return {
+        "pid": os.getpid(),
+        "workers": workers,
+        "total_rss_mb": sum(w["rss_mb"] for w in workers),
+        "total_pss_mb": sum(w["pss_mb"] for w in workers),
+    }
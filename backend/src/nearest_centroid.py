@@ -0,0 +1,85 @@
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+
+def centroids_path(artifact_path: str) -> str:
+    """Folded centroid export written next to the classification pipeline."""
+    return os.path.splitext(artifact_path)[0] + ".centroids.npz"
+
+
+class NearestCentroid:
+    """Quality tiers as the nearest KMeans centre, without the sklearn Pipeline.
+
+    With the scaler folded in, the squared distance of a raw row x to centre k
+    in scaled space is |x / scale|^2 + x @ weights[:, k] + bias[k]. The first
+    term is the same for every centre, so the nearest centre is
+    argmin(x @ weights + bias): one small product per batch. `codes[k]` is the
+    tier index of cluster k, so predictions index straight into QUALITY_MAP.
+    """
+
+    def __init__(
+        self,
+        mean: np.ndarray,
+        scale: np.ndarray,
+        centers: np.ndarray,
+        codes: Sequence[int],
+        features: Optional[Sequence[str]] = None,
+    ):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centers = np.asarray(centers, dtype=np.float64)  # in scaled space
+        self.codes = np.asarray(codes, dtype=np.intp)
+        raw_centers = self.mean + self.centers * self.scale
+        inverse_variance = 1.0 / self.scale**2
+        self.weights = (-2.0 * raw_centers * inverse_variance).T
+        self.bias = (raw_centers**2 * inverse_variance).sum(axis=1)
+        self.feature_names_in_ = None if features is None else np.asarray(features, dtype=object)
+        self.n_features_in_ = len(self.mean)
+
+    @classmethod
+    def from_pipeline(cls, pipeline: Pipeline, codes: Optional[Sequence[int]] = None) -> "NearestCentroid":
+        """Fold a fitted StandardScaler + KMeans pipeline; cluster k maps to tier
+        `codes[k]`, by default tier k as the pickled pipeline was always served."""
+        *transforms, (_, kmeans) = pipeline.steps
+        transforms = [step for _, step in transforms if step not in (None, "passthrough")]
+        n_features = kmeans.cluster_centers_.shape[1]
+        mean, scale = np.zeros(n_features), np.ones(n_features)
+        if transforms:
+            if len(transforms) > 1 or not isinstance(transforms[0], StandardScaler):
+                raise ValueError("Only a StandardScaler before KMeans can be folded into the centroids")
+            scaler = transforms[0]
+            if scaler.with_mean:
+                mean = scaler.mean_
+            if scaler.with_std:
+                scale = scaler.scale_
+        if codes is None:
+            codes = range(len(kmeans.cluster_centers_))
+        return cls(mean, scale, kmeans.cluster_centers_, codes, getattr(pipeline, "feature_names_in_", None))
+
+    @classmethod
+    def load(cls, path: str, labels: Sequence[str]) -> "NearestCentroid":
+        """Read an export of training/centroids.py; its cluster labels must be in `labels`."""
+        with np.load(path, allow_pickle=False) as data:
+            unknown = sorted(set(data["labels"]) - set(labels))
+            if unknown:
+                raise ValueError(f"{path} labels clusters with unknown tiers {unknown}")
+            codes = [list(labels).index(label) for label in data["labels"]]
+            return cls(data["mean"], data["scale"], data["centers"], codes, list(data["features"]))
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+
+    def nearest(self, X: np.ndarray) -> np.ndarray:
+        """Index of the nearest centre of every row."""
+        X = np.asarray(X, dtype=np.float64)
+        # Row-wise sums rather than `X @ weights`, so a row's result does not
+        # depend on the size of its batch (see scoring_manager.predict_rows).
+        scores = (X[:, :, None] * self.weights[None, :, :]).sum(axis=1) + self.bias
+        return np.argmin(scores, axis=1)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.codes[self.nearest(X)]
@@ -0,0 +1,269 @@
+import functools
+import hashlib
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from schemas import VideoMetrics
+
+Result = Dict[str, Any]
+
+
+class PredictionCache:
+    """Bounded LRU/TTL cache of score results keyed on the request metrics.
+
+    Keys are a digest of every VideoMetrics field in declaration order, with
+    floats rounded to `decimals` places (None keeps them exact) so that
+    numerically indistinguishable requests share an entry. Concurrent misses
+    on the same key wait for the one computation already in flight instead of
+    scoring the video again.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl_seconds: Optional[float] = 300.0,
+        max_bytes: Optional[int] = None,
+        decimals: Optional[int] = 6,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.decimals = decimals
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._inflight: Dict[bytes, Future] = {}
+        self._bytes = 0
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def key(self, metrics: VideoMetrics) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        for name in VideoMetrics.model_fields:
+            value = getattr(metrics, name)
+            if isinstance(value, float):
+                if self.decimals is not None:
+                    value = round(value, self.decimals) + 0.0  # folds -0.0 into 0.0
+                digest.update(struct.pack("<d", value))
+            else:
+                digest.update(struct.pack("<q", value))
+        return digest.digest()
+
+    def get_or_compute(self, metrics: VideoMetrics, compute: Callable[[VideoMetrics], Result]) -> Result:
+        return self.get_or_compute_many([metrics], lambda batch: [compute(batch[0])])[0]
+
+    def get_or_compute_many(
+        self,
+        metrics_list: Sequence[VideoMetrics],
+        compute_many: Callable[[Sequence[VideoMetrics]], List[Result]],
+    ) -> List[Result]:
+        """Serve cached rows and score only the misses, in one `compute_many` call."""
+        return self.submit_many(metrics_list, functools.partial(_run, compute_many)).result()
+
+    def submit(self, metrics: VideoMetrics, submit: Callable[[VideoMetrics], Future]) -> Future:
+        """`get_or_compute` without blocking: `submit` queues the scoring and
+        returns a Future (e.g. MicroBatcher.submit), and so does this."""
+        one = self.submit_many([metrics], lambda batch: _then(submit(batch[0]), lambda result: [result]))
+        return _then(one, lambda results: results[0])
+
+    def submit_many(
+        self,
+        metrics_list: Sequence[VideoMetrics],
+        submit_many: Callable[[Sequence[VideoMetrics]], Future],
+    ) -> Future:
+        """A Future of every row's result: cached rows are filled in at once,
+        rows already being scored wait for that computation, and the misses
+        are passed to one `submit_many` call.
+
+        Nothing here blocks, so async handlers can await the Future directly.
+        Each caller gets a Future of its own; cancelling it does not cancel the
+        shared computation other callers may be waiting on.
+        """
+        keys = [self.key(metrics) for metrics in metrics_list]
+        results: List[Optional[Result]] = [None] * len(keys)
+        owned: "OrderedDict[bytes, List[int]]" = OrderedDict()
+        waiting = []
+
+        with self._lock:
+            now = time.monotonic()
+            generation = self._generation
+            for i, key in enumerate(keys):
+                if key in owned:
+                    owned[key].append(i)
+                    waiting.append((i, self._inflight[key]))
+                    continue
+                cached = self._lookup(key, now)
+                if cached is not None:
+                    self._hits += 1
+                    results[i] = cached
+                elif key in self._inflight:
+                    self._coalesced += 1
+                    waiting.append((i, self._inflight[key]))
+                else:
+                    self._misses += 1
+                    self._inflight[key] = Future()
+                    owned[key] = [i]
+                    waiting.append((i, self._inflight[key]))
+
+        if owned:
+            try:
+                computing = submit_many([metrics_list[idx[0]] for idx in owned.values()])
+            except BaseException as exc:
+                self._settle(owned, generation, exc, None)
+                raise
+            computing.add_done_callback(
+                lambda done: self._settle(owned, generation, _exception(done), done)
+            )
+        return _gather(results, waiting)
+
+    def _settle(self, owned, generation: int, exc: Optional[BaseException], done: Optional[Future]):
+        with self._lock:
+            if exc is not None:
+                for key in owned:
+                    self._inflight.pop(key).set_exception(exc)
+                return
+            for key, result in zip(owned, done.result()):
+                # Results started before a clear() may come from replaced models.
+                if generation == self._generation:
+                    self._store(key, result)
+                self._inflight.pop(key).set_result(result)
+
+    def clear(self):
+        """Drop every cached result, e.g. after the models were reloaded.
+
+        Computations already in flight still answer their callers but are not
+        stored, since they may have used the models being replaced.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "in_flight": len(self._inflight),
+            }
+
+    def _lookup(self, key: bytes, now: float) -> Optional[Result]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, result = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            self._bytes -= size
+            self._expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _store(self, key: bytes, result: Result):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        size = _entry_size(key, result)
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (expires_at, size, result)
+        self._bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._evictions += 1
+
+
+def _entry_size(key: bytes, result: Result) -> int:
+    return (
+        sys.getsizeof(key)
+        + sys.getsizeof(result)
+        + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in result.items())
+    )
+
+
+def _run(compute_many: Callable, batch) -> Future:
+    """Run `compute_many` here and now, as a completed Future."""
+    future: Future = Future()
+    try:
+        future.set_result(compute_many(batch))
+    except BaseException as exc:
+        future.set_exception(exc)
+    return future
+
+
+def _exception(future: Future) -> Optional[BaseException]:
+    return CancelledError() if future.cancelled() else future.exception()
+
+
+def _then(future: Future, fn: Callable) -> Future:
+    """A Future of `fn(result)` once `future` is done."""
+    mapped: Future = Future()
+
+    def forward(done: Future):
+        if not mapped.set_running_or_notify_cancel():
+            return
+        exc = _exception(done)
+        if exc is not None:
+            mapped.set_exception(exc)
+        else:
+            mapped.set_result(fn(done.result()))
+
+    future.add_done_callback(forward)
+    return mapped
+
+
+def _gather(results: List[Optional[Result]], waiting: List[tuple]) -> Future:
+    """A Future of `results` once every (position, Future) in `waiting` is done,
+    with each result copied so callers cannot change the cached dicts."""
+    gathered: Future = Future()
+    lock = threading.Lock()
+    state = {"remaining": len(waiting), "settled": False}
+
+    def settle(exc: Optional[BaseException]):
+        if not gathered.set_running_or_notify_cancel():
+            return
+        if exc is not None:
+            gathered.set_exception(exc)
+        else:
+            gathered.set_result([dict(result) for result in results])
+
+    def collect(i: int, done: Future):
+        exc = _exception(done)
+        with lock:
+            if state["settled"]:
+                return
+            if exc is None:
+                results[i] = done.result()
+                state["remaining"] -= 1
+                if state["remaining"]:
+                    return
+            state["settled"] = True
+        settle(exc)
+
+    if not waiting:
+        settle(None)
+    for i, future in waiting:
+        future.add_done_callback(functools.partial(collect, i))
+    return gathered
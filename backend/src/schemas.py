@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import List
+
+from pydantic import BaseModel, Field
 
 
 class VideoMetrics(BaseModel):
@@ -17,4 +19,21 @@ class VideoMetrics(BaseModel):
     audio_intensity: float
 
 
+class VideoMetricsBatch(BaseModel):
+    videos: List[VideoMetrics]
+
+
+class VideoSource(BaseModel):
+    """Decoded media on the server plus the post metadata the ratios need."""
 
+    frames_path: str  # (n, H, W, 3) uint8 .npy array or a directory of images
+    audio_path: str  # PCM WAV
+    fps: float = Field(30.0, gt=0)  # only used when the WAV track is empty
+    views: int = Field(gt=0)
+    likes: int = Field(ge=0)
+    comments: int = Field(ge=0)
+    shares: int = Field(ge=0)
+    verified_status: int = 0
+    author_ban_status: int = 0
+    title: str = ""
+    description: str = ""
@@ -1,78 +1,499 @@
+import gc
 import math
-from typing import Any, Dict
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
 import logging
 
 import joblib
 import numpy as np
+from sklearn.ensemble import StackingRegressor
 from sklearn.inspection import permutation_importance
-from schemas import VideoMetrics
+from sklearn.linear_model._base import LinearModel
+from sklearn.pipeline import Pipeline
+from explain import ClusterExplainer, RegressionExplainer
+from feature_schema import (
+    CLASSIFICATION_SCHEMA,
+    ENGAGEMENT_SCHEMA,
+    WATCH_DURATION_SCHEMA,
+    FeatureLayout,
+    load_feature_schema,
+)
+from model_registry import current_version, version_dir
+from model_store import load_shared
+from nearest_centroid import NearestCentroid, centroids_path
+from schemas import VideoMetrics, VideoSource
+from telemetry import BATCH_SIZE, FEATURE_ASSEMBLY, MODEL_LATENCY, MODEL_LOAD, MODELS_READY
+from tree_engine import compile_model, probe_matrix, verify_compiled
+from video_features import FeatureExtractor
 
 logging.basicConfig(level=logging.DEBUG)
 
+QUALITY_MAP = ["High Quality", "Medium Quality", "Low Quality"]
 
-class ScoringManager:
-    def __init__(self):
-        with open("models/tiktok_engagement_stacked_model.pkl", "rb") as f:
-            self.stacked_engagement_model = joblib.load(f)
-        with open("models/tiktok_classification_pipeline.pkl", "rb") as f:
-            self.classification_pipeline = joblib.load(f)
-        with open("models/short_video_stacked_model.pkl", "rb") as f:
-            self.watch_duration_model = joblib.load(f)
+# Unversioned artifacts, used when there is no model registry.
+MODELS_DIR = "models"
+ENGAGEMENT_MODEL_PATH = "models/tiktok_engagement_stacked_model.pkl"
+CLASSIFICATION_MODEL_PATH = "models/tiktok_classification_pipeline.pkl"
+WATCH_DURATION_MODEL_PATH = "models/short_video_stacked_model.pkl"
+# Model name -> (artifact file name, column order used when it has no schema
+# sidecar), in the order their column blocks appear in the packed feature matrix.
+MODEL_FILES = {
+    "engagement": (os.path.basename(ENGAGEMENT_MODEL_PATH), ENGAGEMENT_SCHEMA),
+    "classification": (os.path.basename(CLASSIFICATION_MODEL_PATH), CLASSIFICATION_SCHEMA),
+    "watch_duration": (os.path.basename(WATCH_DURATION_MODEL_PATH), WATCH_DURATION_SCHEMA),
+}
+WARM_UP_ROWS = 64
+# "full" scores with the stacked models, "fast" with the distilled surrogates
+# saved next to them as `<artifact>_fast.pkl` by training/distill.py, where
+# present; models without a surrogate use the full model in both modes.
+MODES = ("full", "fast")
+FAST_SUFFIX = "_fast"
+DISTILLED = ("engagement", "watch_duration")
 
-    def quality_classification(self, metrics: VideoMetrics):
-        prediction = self.classification_pipeline.predict(
-            [
-                [
-                    metrics.video_duration_sec,
-                    metrics.verified_status,
-                    metrics.author_ban_status,
-                    metrics.like_ratio,
-                    metrics.share_ratio,
-                    metrics.comment_ratio,
-                ]
-            ]
-        )
-        quality_map = ["High Quality", "Medium Quality", "Low Quality"]
-        return quality_map[prediction[0]]
+# "sklearn" predicts with the fitted estimators, "compiled" with the packed
+# array tree engine in tree_engine.py. The compiled traversal removes sklearn's
+# per-call overhead but is vectorised NumPy rather than Cython, so batches
+# larger than `compiled_max_rows` still go through sklearn.
+ENGINES = ("sklearn", "compiled")
+COMPILED_MAX_ROWS = 512
 
-    def quality_score(self, metrics: VideoMetrics):
-        prediction = self.stacked_engagement_model.predict(
-            [
-                [
-                    metrics.video_duration_sec,
-                    metrics.verified_status,
-                    metrics.author_ban_status,
-                    metrics.share_ratio,
-                    metrics.comment_ratio,
-                ]
-            ]
-        )
-        return prediction[0]
-    
-    def watch_duration_score(self, metrics: VideoMetrics):
-        prediction = self.watch_duration_model.predict([[
-            metrics.like_ratio, metrics.comment_ratio, metrics.share_ratio,
-            metrics.title_length, metrics.description_length,
-            metrics.edge_intensity, metrics.color_histogram,
-            metrics.spectral_entropy, metrics.audio_intensity]]
+
+def predict_rows(estimator, X: np.ndarray) -> np.ndarray:
+    """Predict so that each row's output does not depend on the rest of the batch.
+
+    BLAS picks different kernels for a 1-row and an n-row matrix product, which
+    makes linear steps drift by an ulp between single and batched calls. Linear
+    steps are therefore evaluated as a row-wise sum; everything else already
+    predicts row by row.
+    """
+    if isinstance(estimator, StackingRegressor):
+        predictions = [
+            predict_rows(est, X) for est in estimator.estimators_ if est != "drop"
+        ]
+        if estimator.passthrough:
+            predictions.append(X)
+        return predict_rows(
+            estimator.final_estimator_, np.column_stack(predictions)
         )
-        return prediction[0]
+    if isinstance(estimator, Pipeline):
+        for _, step in estimator.steps[:-1]:
+            if step is not None and step != "passthrough":
+                X = step.transform(X)
+        return predict_rows(estimator.steps[-1][1], X)
+    if isinstance(estimator, LinearModel) and np.ndim(estimator.coef_) == 1:
+        X = np.asarray(X, dtype=np.float64)
+        return (X * estimator.coef_).sum(axis=1) + estimator.intercept_
+    return estimator.predict(X)
 
 
-    def video2metrics(
+class ModelSet:
+    """One version of the three models, loaded, compiled and warmed up.
+
+    A set is never modified after `load()`; ScoringManager swaps whole sets,
+    so a request that picked up a set keeps using it until it finishes.
+    """
+
+    def __init__(
         self,
+        directory: str = MODELS_DIR,
+        version: Optional[str] = None,
+        engine: str = "sklearn",
+        compiled_max_rows: int = COMPILED_MAX_ROWS,
+        mmap: bool = False,
     ):
-        pass
+        self.directory = directory
+        self.version = version
+        self.engine = engine
+        self.compiled_max_rows = compiled_max_rows
+        self.mmap = mmap
+        self.load_timings: Dict[str, Dict[str, float]] = {}
+        self._engagement_predictor = None
+        self._watch_duration_predictor = None
+        self.fast: Dict[str, Tuple[Any, Any]] = {}
+
+    def load(self) -> "ModelSet":
+        """Load, compile and warm up the three models in parallel."""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(MODEL_FILES), thread_name_prefix="model-load") as pool:
+            loaded = dict(zip(MODEL_FILES, pool.map(self._load_model, MODEL_FILES)))
+            surrogates = dict(zip(DISTILLED, pool.map(self._load_fast, DISTILLED)))
+
+        self.stacked_engagement_model, self._engagement_predictor, _, _ = loaded["engagement"]
+        self.classifier, _, _, _ = loaded["classification"]
+        self.watch_duration_model, self._watch_duration_predictor, _, _ = loaded["watch_duration"]
+        self.layout = FeatureLayout([schema for _, _, schema, _ in loaded.values()])
+        self.explainers = self._build_explainers(loaded)
+        self.load_timings = {name: timings for name, (_, _, _, timings) in loaded.items()}
+        for name, surrogate in surrogates.items():
+            if surrogate is None:
+                continue
+            model, predictor, schema, timings = surrogate
+            if schema.features != loaded[name][2].features:
+                logging.warning("Ignoring the fast %s model, its columns differ from the full model's", name)
+                continue
+            self.fast[name] = (model, predictor)
+            self.load_timings[name + FAST_SUFFIX] = timings
+        for name, timings in self.load_timings.items():
+            MODEL_LOAD.labels(name, "load").set(timings["load_s"])
+            MODEL_LOAD.labels(name, "warm_up").set(timings["warm_up_s"])
+        logging.info(
+            "Model set %s ready in %.2fs", self.version or self.directory, time.perf_counter() - started
+        )
+        return self
+
+    def _load_model(self, name: str):
+        file_name, default_schema = MODEL_FILES[name]
+        path = os.path.join(self.directory, file_name)
+        started = time.perf_counter()
+        predictor = None
+        if name == "classification":
+            model = self._load_classifier(path)
+        elif self.mmap:
+            # Only the packed arrays are kept, mapped read-only from .shared/ next
+            # to the artifact and shared by every worker; they also serve batches
+            # of any size.
+            model = predictor = load_shared(path, self._compile)
+        else:
+            model = joblib.load(path)
+            if self.engine == "compiled":
+                predictor = self._compile(model)
+        schema = load_feature_schema(path, default_schema, model)
+        loaded = time.perf_counter()
+        self._warm_up(model, predictor, len(schema.features))
+        timings = {"load_s": loaded - started, "warm_up_s": time.perf_counter() - loaded}
+        logging.info(
+            "Loaded %s model from %s in %.2fs, warm-up %.3fs",
+            name,
+            path,
+            timings["load_s"],
+            timings["warm_up_s"],
+        )
+        return model, predictor, schema, timings
+
+    @staticmethod
+    def _load_classifier(path: str) -> NearestCentroid:
+        """The folded centroid export if training wrote one, else the pickled
+        StandardScaler + KMeans pipeline folded here, checked against itself."""
+        exported = centroids_path(path)
+        if os.path.exists(exported):
+            return NearestCentroid.load(exported, QUALITY_MAP)
+        pipeline = joblib.load(path)
+        classifier = NearestCentroid.from_pipeline(pipeline)
+        X = probe_matrix(None, classifier.n_features_in_) * classifier.scale + classifier.mean
+        disagree = int((classifier.predict(X) != pipeline.predict(X)).sum())
+        if disagree:
+            logging.warning("Folded centroids disagree with %s on %d of %d probe rows", path, disagree, len(X))
+        return classifier
 
+    def _load_fast(self, name: str):
+        """The distilled surrogate of `name`, or None if it has not been trained
+        or cannot be loaded (the full model then serves mode=fast too)."""
+        file_name, default_schema = MODEL_FILES[name]
+        path = os.path.join(self.directory, os.path.splitext(file_name)[0] + FAST_SUFFIX + ".pkl")
+        if not os.path.exists(path):
+            return None
+        started = time.perf_counter()
+        try:
+            model = joblib.load(path)
+            # Surrogates are small, so they are compiled whenever the full models are
+            # served compiled or shared, without a memory-mapped copy of their own.
+            predictor = self._compile(model) if self.engine == "compiled" or self.mmap else None
+            schema = load_feature_schema(path, default_schema, model)
+            loaded = time.perf_counter()
+            self._warm_up(model, predictor, len(schema.features))
+        except Exception:
+            # A broken surrogate must not take the full models down with it.
+            logging.exception("Ignoring the fast %s model, %s could not be loaded", name, path)
+            return None
+        timings = {"load_s": loaded - started, "warm_up_s": time.perf_counter() - loaded}
+        logging.info("Loaded fast %s model from %s in %.2fs", name, path, timings["load_s"])
+        return model, predictor, schema, timings
 
-    def score(self, metrics):
-        quality_score = self.quality_score(metrics)
-        quality_class = self.quality_classification(metrics)
-        watch_duration = self.watch_duration_score(metrics)
+    @staticmethod
+    def _warm_up(model, predictor, n_features: int):
+        # Pay first-call costs (lazy imports, allocator and BLAS warm-up) before
+        # the first real request does.
+        synthetic = np.zeros((WARM_UP_ROWS, n_features))
+        for rows in (1, WARM_UP_ROWS):
+            if predictor is not None:
+                predictor.predict(synthetic[:rows])
+            else:
+                predict_rows(model, synthetic[:rows])
 
+    @staticmethod
+    def _build_explainers(loaded) -> Dict[str, Any]:
+        """Set up per-request explanations once, reusing compiled models where loaded."""
+        explainers = {}
+        for name, (model, predictor, schema, _) in loaded.items():
+            if name == "classification":
+                explainers[name] = ClusterExplainer(model, schema.features, QUALITY_MAP)
+            else:
+                explainers[name] = RegressionExplainer(predictor or compile_model(model), schema.features)
+        return explainers
+
+    @staticmethod
+    def _compile(model):
+        compiled = compile_model(model)
+        verify_compiled(compiled, model, probe_matrix(compiled, model.n_features_in_))
+        return compiled
+
+    def _predict_quality_codes(self, X: np.ndarray) -> np.ndarray:
+        """Indices into QUALITY_MAP."""
+        return self.classifier.predict(self.layout.project(X, "classification"))
+
+    def _predict_quality_class(self, X: np.ndarray) -> List[str]:
+        return [QUALITY_MAP[label] for label in self._predict_quality_codes(X)]
+
+    def _predict_regression(self, name: str, X: np.ndarray, model, predictor, mode: str) -> np.ndarray:
+        X = self.layout.project(X, name)
+        if mode == "fast" and name in self.fast:
+            model, predictor = self.fast[name]
+        if predictor is not None and len(X) <= self.compiled_max_rows:
+            return predictor.predict(X)
+        return predict_rows(model, X)
+
+    def _predict_quality_score(self, X: np.ndarray, mode: str = "full") -> np.ndarray:
+        return self._predict_regression(
+            "engagement", X, self.stacked_engagement_model, self._engagement_predictor, mode
+        )
+
+    def _predict_watch_duration(self, X: np.ndarray, mode: str = "full") -> np.ndarray:
+        return self._predict_regression(
+            "watch_duration", X, self.watch_duration_model, self._watch_duration_predictor, mode
+        )
+
+    def _latency_label(self, name: str, mode: str) -> str:
+        return name + FAST_SUFFIX if mode == "fast" and name in self.fast else name
+
+    def score_columns(self, X: np.ndarray, mode: str = "full") -> Dict[str, np.ndarray]:
+        """Predictions for rows packed with `self.layout`, one array per output;
+        `quality_class` holds indices into QUALITY_MAP."""
+        if mode not in MODES:
+            raise ValueError(f"Unknown scoring mode {mode!r}, expected one of {MODES}")
+        BATCH_SIZE.labels().observe(len(X))
+        with MODEL_LATENCY.labels(self._latency_label("engagement", mode)).time():
+            quality_scores = self._predict_quality_score(X, mode)
+        with MODEL_LATENCY.labels("classification").time():
+            quality_codes = self._predict_quality_codes(X)
+        with MODEL_LATENCY.labels(self._latency_label("watch_duration", mode)).time():
+            watch_durations = self._predict_watch_duration(X, mode)
         return {
-            "quality_score": quality_score,
-            "quality_class": quality_class,
-            "watch_duration": watch_duration
+            "quality_score": np.asarray(quality_scores, dtype=np.float64),
+            "quality_class": np.asarray(quality_codes),
+            "watch_duration": np.asarray(watch_durations, dtype=np.float64),
+        }
+
+    def score_matrix(self, X: np.ndarray, mode: str = "full") -> List[Dict[str, Any]]:
+        """Score rows already packed with `self.layout`."""
+        columns = self.score_columns(X, mode)
+        return [
+            {
+                "quality_score": float(quality_score),
+                "quality_class": QUALITY_MAP[quality_code],
+                "watch_duration": float(watch_duration),
+            }
+            for quality_score, quality_code, watch_duration in zip(
+                columns["quality_score"], columns["quality_class"], columns["watch_duration"]
+            )
+        ]
+
+    def explain_matrix(self, X: np.ndarray) -> List[Dict[str, Any]]:
+        """Score rows and split every prediction into per-feature contributions."""
+        scores = self.score_matrix(X)
+        explanations = {
+            name: explainer.explain(self.layout.project(X, name))
+            for name, explainer in self.explainers.items()
         }
-    
+        return [
+            {
+                "quality_score": {"prediction": score["quality_score"], **quality},
+                "quality_class": {"prediction": score["quality_class"], **cluster},
+                "watch_duration": {"prediction": score["watch_duration"], **watch},
+            }
+            for score, quality, cluster, watch in zip(
+                scores,
+                explanations["engagement"],
+                explanations["classification"],
+                explanations["watch_duration"],
+            )
+        ]
+
+
+class ScoringManager:
+    """Serves the current ModelSet and replaces it without downtime.
+
+    With `registry_dir` the served set is the version named by the registry's
+    CURRENT file (see model_registry.py), otherwise the unversioned artifacts
+    in `models_dir`. `reload()` loads and warms up a new set in the background
+    and then swaps it in with a single reference assignment: calls already
+    running finish on the set they started with, and the old set is freed
+    once the last of them drops it.
+    """
+
+    def __init__(
+        self,
+        engine: str = "sklearn",
+        compiled_max_rows: int = COMPILED_MAX_ROWS,
+        mmap: bool = False,
+        lazy: bool = False,
+        feature_extractor: Optional[FeatureExtractor] = None,
+        models_dir: str = MODELS_DIR,
+        registry_dir: Optional[str] = None,
+    ):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown scoring engine {engine!r}, expected one of {ENGINES}")
+        if mmap and engine != "compiled":
+            logging.info("Memory-mapped models are served by the compiled engine")
+            engine = "compiled"
+        self.engine = engine
+        self.compiled_max_rows = compiled_max_rows
+        self.mmap = mmap
+        self.models_dir = models_dir
+        self.registry_dir = registry_dir
+        self.feature_extractor = feature_extractor or FeatureExtractor()
+
+        self.models: Optional[ModelSet] = None
+        self.load_error: Optional[BaseException] = None
+        self.loading: Optional[str] = None
+        self._load_lock = threading.Lock()
+        self._swap_listeners: List[Callable[[ModelSet], None]] = []
+        if not lazy:
+            self.load()
+
+    @property
+    def ready(self) -> bool:
+        return self.models is not None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.models.version if self.models is not None else None
+
+    @property
+    def load_timings(self) -> Dict[str, Dict[str, float]]:
+        return self.models.load_timings if self.models is not None else {}
+
+    @property
+    def layout(self) -> FeatureLayout:
+        return self.models.layout
+
+    @property
+    def fast_models(self) -> List[str]:
+        """Models that have a distilled surrogate for mode="fast"."""
+        return sorted(self.models.fast) if self.models is not None else []
+
+    def add_swap_listener(self, listener: Callable[[ModelSet], None]):
+        """Call `listener(new_set)` after every swap, e.g. to flush result caches."""
+        self._swap_listeners.append(listener)
+
+    def _resolve(self, version: Optional[str]) -> Tuple[str, Optional[str]]:
+        if self.registry_dir is not None:
+            version = version or current_version(self.registry_dir)
+            if version is not None:
+                return version_dir(self.registry_dir, version), version
+        if version is not None:
+            raise ValueError("No model registry is configured")
+        return self.models_dir, None
+
+    def load(self, version: Optional[str] = None) -> ModelSet:
+        """Load `version` (default: the registry's current one) and swap it in."""
+        directory, version = self._resolve(version)
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"Model directory {directory} does not exist")
+        models = ModelSet(directory, version, self.engine, self.compiled_max_rows, self.mmap).load()
+        self._swap(models)
+        return models
+
+    def _swap(self, models: ModelSet):
+        previous, self.models = self.models, models
+        self.load_error = None
+        MODELS_READY.labels().set(1)
+        for listener in self._swap_listeners:
+            listener(models)
+        if previous is not None:
+            logging.info("Swapped model set %s for %s", previous.version, models.version)
+            del previous
+            # Stacks hold reference cycles (fitted estimators point at each
+            # other), so collect now rather than whenever gc next runs.
+            gc.collect()
+
+    def start_loading(self, version: Optional[str] = None) -> Future:
+        """Run `load()` on a background thread; the future fails if loading does.
+
+        Raises RuntimeError if a load is already running.
+        """
+        if not self._load_lock.acquire(blocking=False):
+            raise RuntimeError(f"Model set {self.loading} is still loading")
+        self.loading = version or "current"
+        future: Future = Future()
+
+        def run():
+            try:
+                models = self.load(version)
+            except BaseException as exc:
+                self.load_error = exc
+                logging.exception("Model loading failed")
+                future.set_exception(exc)
+            else:
+                future.set_result(models.load_timings)
+            finally:
+                self.loading = None
+                self._load_lock.release()
+
+        threading.Thread(target=run, name="model-loader", daemon=True).start()
+        return future
+
+    reload = start_loading
+
+    def quality_classification(self, metrics: VideoMetrics):
+        models = self.models
+        return models._predict_quality_class(models.layout.assemble([metrics]))[0]
+
+    def quality_score(self, metrics: VideoMetrics):
+        models = self.models
+        return models._predict_quality_score(models.layout.assemble([metrics]))[0]
+
+    def watch_duration_score(self, metrics: VideoMetrics):
+        models = self.models
+        return models._predict_watch_duration(models.layout.assemble([metrics]))[0]
+
+    def video2metrics(self, source: VideoSource) -> Tuple[VideoMetrics, Dict[str, Any]]:
+        """Extract the request features from decoded media, with per-stage timings."""
+        return self.feature_extractor.extract(source)
+
+    def score(self, metrics, mode: str = "full"):
+        return self.score_many([metrics], mode)[0]
+
+    def score_many(self, metrics_list: Sequence[VideoMetrics], mode: str = "full") -> List[Dict[str, Any]]:
+        """Score a batch of videos with one predict call per model."""
+        if not metrics_list:
+            return []
+        models = self.models
+        with FEATURE_ASSEMBLY.labels().time():
+            X = models.layout.assemble(metrics_list)
+        return models.score_matrix(X, mode)
+
+    def explain_many(self, metrics_list: Sequence[VideoMetrics]) -> List[Dict[str, Any]]:
+        """Score a batch and split every prediction into per-feature contributions."""
+        if not metrics_list:
+            return []
+        models = self.models
+        return models.explain_matrix(models.layout.assemble(metrics_list))
+
+    def score_columns(self, columns: Mapping[str, np.ndarray], mode: str = "full") -> Dict[str, np.ndarray]:
+        """Score columnar input (one array per VideoMetrics field) without
+        building a request object per row; see ModelSet.score_columns."""
+        models = self.models
+        with FEATURE_ASSEMBLY.labels().time():
+            X = models.layout.from_columns(columns)
+        if not len(X):
+            return {name: np.empty(0) for name in ("quality_score", "quality_class", "watch_duration")}
+        return models.score_columns(X, mode)
+
+    def score_matrix(
+        self, X: np.ndarray, models: Optional[ModelSet] = None, mode: str = "full"
+    ) -> List[Dict[str, Any]]:
+        """Score rows packed with the layout of `models` (default: the current set)."""
+        return (models or self.models).score_matrix(X, mode)
@@ -0,0 +1,186 @@
+import asyncio
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+from schemas import VideoMetrics
+
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+# Request media types accepted for each input format.
+INPUT_FORMATS = {
+    "application/x-ndjson": NDJSON,
+    "application/jsonl": NDJSON,
+    "application/json": NDJSON,
+    "text/csv": CSV,
+}
+RESULT_FIELDS = ("quality_score", "quality_class", "watch_duration")
+
+Row = Tuple[int, Optional[VideoMetrics], Optional[str]]
+ScoreChunk = Callable[[List[VideoMetrics]], Awaitable[List[Dict[str, Any]]]]
+
+
+def input_format(content_type: Optional[str]) -> Optional[str]:
+    """NDJSON or CSV for a request Content-Type, NDJSON when absent, None if unsupported."""
+    if not content_type:
+        return NDJSON
+    return INPUT_FORMATS.get(content_type.split(";")[0].strip().lower())
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines without holding more than one partial line."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def _describe(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}"
+            for error in exc.errors(include_url=False)
+        )
+    return str(exc)
+
+
+class _CsvParser:
+    def __init__(self):
+        self.header: Optional[List[str]] = None
+
+    def __call__(self, line: str) -> Optional[VideoMetrics]:
+        values = next(csv.reader([line]))
+        if self.header is None:
+            self.header = [name.strip() for name in values]
+            return None
+        if len(values) != len(self.header):
+            raise ValueError(f"expected {len(self.header)} columns, got {len(values)}")
+        return VideoMetrics.model_validate(dict(zip(self.header, values)))
+
+
+def _parse_ndjson(line: str) -> VideoMetrics:
+    return VideoMetrics.model_validate_json(line)
+
+
+def _write_ndjson(rows: List[Row], results: List[Optional[Dict[str, Any]]]) -> bytes:
+    out = []
+    for (line_no, _, error), result in zip(rows, results):
+        body = {"line": line_no, "score": result} if error is None else {"line": line_no, "error": error}
+        out.append(json.dumps(body))
+    return ("\n".join(out) + "\n").encode()
+
+
+def _write_csv(rows: List[Row], results: List[Optional[Dict[str, Any]]]) -> bytes:
+    out = []
+    for (line_no, _, error), result in zip(rows, results):
+        if error is None:
+            values = [line_no] + [result[field] for field in RESULT_FIELDS] + [""]
+        else:
+            values = [line_no, "", "", "", error]
+        out.append(values)
+    return _csv_lines(out)
+
+
+def _csv_lines(rows: List[list]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode()
+
+
+class UploadStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body iterator is still reading the request body.
+
+    Below ASGI spec 2.4 (uvicorn declares 2.3) Starlette watches for the client
+    going away by calling `receive()` next to the body iterator, which would
+    steal the upload's chunks from `request.stream()` and stall it. A client
+    disconnect still surfaces, from `request.stream()` or from `send`.
+
+    `on_close` runs once the response is over however it ended, including a
+    client that went away before the body iterator was ever started.
+    """
+
+    def __init__(self, *args, on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+        if self.background is not None:
+            await self.background()
+
+
+async def _score_rows(rows: List[Row], score_chunk: ScoreChunk, write) -> bytes:
+    metrics = [m for _, m, error in rows if error is None]
+    try:
+        scored = iter(await score_chunk(metrics) if metrics else [])
+    except Exception as exc:
+        rows = [(line_no, m, error or f"scoring failed: {exc}") for line_no, m, error in rows]
+        scored = iter(())
+    results = [next(scored) if error is None else None for _, _, error in rows]
+    return write(rows, results)
+
+
+async def score_stream(
+    lines: AsyncIterator[bytes],
+    fmt: str,
+    score_chunk: ScoreChunk,
+    chunk_size: int = 1024,
+) -> AsyncIterator[bytes]:
+    """Parse `lines`, score them `chunk_size` rows at a time and yield encoded results.
+
+    Each output record carries the 1-based input line it answers; rows that
+    fail to parse or validate get an `error` instead of a score and do not
+    stop the stream. The next chunk is parsed while the previous one is being
+    scored, and at most two chunks are held at any time, so memory does not
+    grow with the size of the upload.
+    """
+    parse = _CsvParser() if fmt == CSV else _parse_ndjson
+    write = _write_csv if fmt == CSV else _write_ndjson
+    if fmt == CSV:
+        yield _csv_lines([["line", *RESULT_FIELDS, "error"]])
+
+    rows: List[Row] = []
+    pending: Optional[asyncio.Future] = None
+    line_no = 0
+    try:
+        async for raw in lines:
+            line_no += 1
+            line = raw.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            try:
+                metrics = parse(line)
+            except (ValueError, csv.Error) as exc:
+                rows.append((line_no, None, _describe(exc)))
+            else:
+                if metrics is None:
+                    continue
+                rows.append((line_no, metrics, None))
+            if len(rows) >= chunk_size:
+                if pending is not None:
+                    yield await pending
+                pending = asyncio.ensure_future(_score_rows(rows, score_chunk, write))
+                rows = []
+        if pending is not None:
+            yield await pending
+            pending = None
+        if rows:
+            yield await _score_rows(rows, score_chunk, write)
+    finally:
+        if pending is not None:
+            pending.cancel()
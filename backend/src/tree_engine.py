@@ -0,0 +1,477 @@
+import logging
+from typing import List, Optional
+
+import numpy as np
+from sklearn.ensemble import (
+    ExtraTreesRegressor,
+    GradientBoostingRegressor,
+    HistGradientBoostingRegressor,
+    RandomForestRegressor,
+    StackingRegressor,
+)
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model._base import LinearModel
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+# Rows traversed per block, bounds the (rows x trees) index matrix.
+BLOCK_ROWS = 4096
+# HistGradientBoostingRegressor losses whose prediction is the raw score itself.
+IDENTITY_LOSSES = ("squared_error", "absolute_error", "quantile")
+
+
+class PackedForest:
+    """Every node of a list of fitted trees laid out in flat arrays.
+
+    Child indices are absolute into the packed arrays and leaves point back to
+    themselves, so a traversal steps every (row, tree) cursor together and
+    drops a cursor once it reaches a node that is its own child. Inputs are
+    rounded to `input_dtype` before comparing, as the fitted model does.
+    """
+
+    input_dtype = np.float32
+
+    def __init__(self, trees: list):
+        feature, threshold, left, right, value, missing_left, roots = ([] for _ in range(7))
+        offset = 0
+        depth = 0
+        for tree in trees:
+            is_leaf = tree.children_left == -1
+            nodes = np.arange(tree.node_count) + offset
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, nodes, tree.children_left + offset))
+            right.append(np.where(is_leaf, nodes, tree.children_right + offset))
+            value.append(tree.value[:, 0, 0])
+            missing = getattr(tree, "missing_go_to_left", None)
+            if missing is None:
+                missing = np.zeros(tree.node_count, dtype=bool)
+            missing_left.append(np.asarray(missing, dtype=bool) & ~is_leaf)
+            roots.append(offset)
+            offset += tree.node_count
+            depth = max(depth, tree.max_depth)
+
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold).astype(np.float64)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.value = np.concatenate(value).astype(np.float64)
+        self.missing_left = np.concatenate(missing_left)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.depth = depth
+        self.has_missing = bool(self.missing_left.any())
+        self.n_features = int(trees[0].n_features) if trees else 0
+        self._link()
+
+    @classmethod
+    def from_histogram(cls, predictors: list, n_features: int) -> "PackedForest":
+        """Trees of a HistGradientBoostingRegressor (its `_predictors`).
+
+        Only leaf values are meaningful in those trees, so each split node gets
+        the mean of its children's values weighted by their training sample
+        counts, as sklearn's own trees store; predictions only use leaves, and
+        path contributions still add up to the leaf value exactly.
+        """
+        packed = cls.__new__(cls)
+        feature, threshold, left, right, value, missing_left, roots = ([] for _ in range(7))
+        offset = 0
+        depth = 0
+        for predictor in predictors:
+            tree = predictor.nodes
+            is_leaf = tree["is_leaf"].astype(bool)
+            nodes = np.arange(len(tree)) + offset
+            values = tree["value"].astype(np.float64)
+            counts = tree["count"].astype(np.float64)
+            for level in range(int(tree["depth"].max()) - 1, -1, -1):
+                split = np.flatnonzero(~is_leaf & (tree["depth"] == level))
+                lo, hi = tree["left"][split], tree["right"][split]
+                total = counts[lo] + counts[hi]
+                weighted = values[lo] * counts[lo] + values[hi] * counts[hi]
+                values[split] = np.divide(weighted, total, out=(values[lo] + values[hi]) / 2, where=total > 0)
+            feature.append(np.where(is_leaf, 0, tree["feature_idx"]))
+            threshold.append(np.where(is_leaf, np.inf, tree["num_threshold"]))
+            left.append(np.where(is_leaf, nodes, tree["left"].astype(np.intp) + offset))
+            right.append(np.where(is_leaf, nodes, tree["right"].astype(np.intp) + offset))
+            value.append(values)
+            missing_left.append(tree["missing_go_to_left"].astype(bool) & ~is_leaf)
+            roots.append(offset)
+            offset += len(tree)
+            depth = max(depth, int(tree["depth"].max()))
+
+        packed.feature = np.concatenate(feature).astype(np.intp)
+        packed.threshold = np.concatenate(threshold).astype(np.float64)
+        packed.left = np.concatenate(left).astype(np.intp)
+        packed.right = np.concatenate(right).astype(np.intp)
+        packed.value = np.concatenate(value)
+        packed.missing_left = np.concatenate(missing_left)
+        packed.roots = np.asarray(roots, dtype=np.intp)
+        packed.depth = depth
+        packed.has_missing = bool(packed.missing_left.any())
+        packed.n_features = n_features
+        # The histogram estimators compare float64 inputs against float64 thresholds.
+        packed.input_dtype = np.float64
+        packed._link()
+        return packed
+
+    def _link(self):
+        # children[2 * node] is the left child, children[2 * node + 1] the right one.
+        self.children = np.column_stack([self.left, self.right]).ravel()
+        self.is_split = self.left != np.arange(len(self.left))
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def concat(cls, forests: List["PackedForest"]) -> "PackedForest":
+        if len({f.input_dtype for f in forests}) > 1:
+            raise ValueError("Cannot pack forests that round their inputs differently")
+        packed = cls.__new__(cls)
+        packed.input_dtype = forests[0].input_dtype
+        offsets = np.cumsum([0] + [len(f.value) for f in forests[:-1]])
+        packed.feature = np.concatenate([f.feature for f in forests])
+        packed.threshold = np.concatenate([f.threshold for f in forests])
+        packed.left = np.concatenate([f.left + o for f, o in zip(forests, offsets)])
+        packed.right = np.concatenate([f.right + o for f, o in zip(forests, offsets)])
+        packed.value = np.concatenate([f.value for f in forests])
+        packed.missing_left = np.concatenate([f.missing_left for f in forests])
+        packed.roots = np.concatenate([f.roots + o for f, o in zip(forests, offsets)])
+        packed.depth = max(f.depth for f in forests)
+        packed.has_missing = any(f.has_missing for f in forests)
+        packed.n_features = forests[0].n_features
+        packed._link()
+        return packed
+
+    def leaf_values(self, X: np.ndarray) -> np.ndarray:
+        """Return the (n_rows, n_trees) matrix of leaf values reached by each row."""
+        # sklearn trees compare float32 inputs against float64 thresholds.
+        X = np.ascontiguousarray(X, dtype=self.input_dtype).astype(np.float64)
+        out = np.empty((X.shape[0], self.n_trees), dtype=np.float64)
+        for start in range(0, X.shape[0], BLOCK_ROWS):
+            block = X[start : start + BLOCK_ROWS]
+            out[start : start + BLOCK_ROWS] = self.value[self._apply(block)].reshape(
+                block.shape[0], self.n_trees
+            )
+        return out
+
+    def _apply(self, X: np.ndarray) -> np.ndarray:
+        """Leaf index for every (row, tree) cursor, flattened row-major."""
+        n_rows, n_features = X.shape
+        flat_x = X.ravel()
+        children = self.children
+        is_split = self.is_split
+        nodes = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_trees)
+        # Only cursors that still sit on a split node are advanced each step.
+        active = np.flatnonzero(is_split[nodes])
+        while active.size:
+            current = nodes[active]
+            x = flat_x[row_offset[active] + self.feature[current]]
+            go_right = ~(x <= self.threshold[current])
+            if self.has_missing:
+                go_right &= ~(np.isnan(x) & self.missing_left[current])
+            current = children[2 * current + go_right]
+            nodes[active] = current
+            active = active[is_split[current]]
+        return nodes
+
+    def contributions(self, X: np.ndarray, weights: np.ndarray):
+        """Path-based (Saabas) attribution of the weighted sum of tree outputs.
+
+        Every split a row passes moves its prediction from the node's value to
+        the child's; that change is credited to the split feature. Returns the
+        per-row bias (weighted root values) and an (n_rows, n_features) matrix
+        that together add up to `leaf_values(X) @ weights` exactly.
+        """
+        X = np.ascontiguousarray(X, dtype=self.input_dtype).astype(np.float64)
+        n_rows, n_features = X.shape
+        flat_x = X.ravel()
+        bias = np.full(n_rows, float(weights @ self.value[self.roots]))
+        contrib = np.zeros(n_rows * n_features)
+        nodes = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_trees)
+        tree_weight = np.tile(np.asarray(weights, dtype=np.float64), n_rows)
+        active = np.flatnonzero(self.is_split[nodes])
+        while active.size:
+            current = nodes[active]
+            cell = row_offset[active] + self.feature[current]
+            x = flat_x[cell]
+            go_right = ~(x <= self.threshold[current])
+            if self.has_missing:
+                go_right &= ~(np.isnan(x) & self.missing_left[current])
+            child = self.children[2 * current + go_right]
+            contrib += np.bincount(
+                cell,
+                weights=tree_weight[active] * (self.value[child] - self.value[current]),
+                minlength=contrib.size,
+            )
+            nodes[active] = child
+            active = active[self.is_split[child]]
+        return bias, contrib.reshape(n_rows, n_features)
+
+
+class CompiledForest:
+    """Random forest / extra trees / single tree regressor: mean of leaf values."""
+
+    def __init__(self, estimator):
+        trees = getattr(estimator, "estimators_", [estimator])
+        self.forest = PackedForest([tree.tree_ for tree in trees])
+
+    def reduce(self, leaf_values: np.ndarray) -> np.ndarray:
+        # Sequential sum in tree order, as sklearn accumulates it.
+        return np.cumsum(leaf_values, axis=1)[:, -1] / leaf_values.shape[1]
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.reduce(self.forest.leaf_values(X))
+
+
+class CompiledBoosting:
+    """GradientBoostingRegressor: initial estimate plus shrunk leaf values."""
+
+    def __init__(self, estimator: GradientBoostingRegressor):
+        self.forest = PackedForest([tree.tree_ for tree in estimator.estimators_[:, 0]])
+        self.learning_rate = estimator.learning_rate
+        self.init = estimator.init_
+        self.init_constant: Optional[float] = None
+        if isinstance(self.init, str) and self.init == "zero":
+            self.init_constant = 0.0
+        elif hasattr(self.init, "constant_"):
+            self.init_constant = float(np.ravel(self.init.constant_)[0])
+
+    def _init(self, X: np.ndarray) -> np.ndarray:
+        if self.init_constant is not None:
+            return np.full(X.shape[0], self.init_constant)
+        return np.asarray(self.init.predict(X), dtype=np.float64).ravel()
+
+    def reduce(self, leaf_values: np.ndarray, X: np.ndarray) -> np.ndarray:
+        stages = np.empty((leaf_values.shape[0], leaf_values.shape[1] + 1))
+        stages[:, 0] = self._init(X)
+        stages[:, 1:] = self.learning_rate * leaf_values
+        return np.cumsum(stages, axis=1)[:, -1]
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.reduce(self.forest.leaf_values(X), X)
+
+
+class CompiledHistBoosting:
+    """HistGradientBoostingRegressor: baseline plus leaf values, which are
+    already shrunk by the learning rate. Missing values follow each split's
+    learned direction, so no imputer is needed in front of it."""
+
+    def __init__(self, estimator: HistGradientBoostingRegressor):
+        predictors = [iteration[0] for iteration in estimator._predictors]
+        self.forest = PackedForest.from_histogram(predictors, estimator.n_features_in_)
+        self.baseline = float(np.ravel(estimator._baseline_prediction)[0])
+
+    def reduce(self, leaf_values: np.ndarray, X: np.ndarray) -> np.ndarray:
+        stages = np.empty((leaf_values.shape[0], leaf_values.shape[1] + 1))
+        stages[:, 0] = self.baseline
+        stages[:, 1:] = leaf_values
+        return np.cumsum(stages, axis=1)[:, -1]
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.reduce(self.forest.leaf_values(X), X)
+
+
+class CompiledLinear:
+    def __init__(self, estimator):
+        self.coef = np.asarray(estimator.coef_, dtype=np.float64)
+        self.intercept = float(estimator.intercept_)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return (np.asarray(X, dtype=np.float64) * self.coef).sum(axis=1) + self.intercept
+
+
+class CompiledStandardScaler:
+    def __init__(self, estimator: StandardScaler):
+        self.mean = estimator.mean_ if estimator.with_mean else None
+        self.scale = estimator.scale_ if estimator.with_std else None
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        if self.mean is not None:
+            X -= self.mean
+        if self.scale is not None:
+            X /= self.scale
+        return X
+
+
+class CompiledImputer:
+    def __init__(self, estimator: SimpleImputer):
+        self.statistics = np.asarray(estimator.statistics_, dtype=np.float64)
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        missing = np.isnan(X)
+        if missing.any():
+            X[missing] = np.broadcast_to(self.statistics, X.shape)[missing]
+        return X
+
+
+class SklearnStep:
+    """Anything without a compiled form keeps using the fitted sklearn object."""
+
+    def __init__(self, estimator):
+        self.estimator = estimator
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return self.estimator.transform(X)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.estimator.predict(X)
+
+
+class CompiledPipeline:
+    def __init__(self, estimator: Pipeline):
+        self.transforms = [
+            compile_transform(step)
+            for _, step in estimator.steps[:-1]
+            if step is not None and step != "passthrough"
+        ]
+        self.final = compile_model(estimator.steps[-1][1])
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        for step in self.transforms:
+            X = step.transform(X)
+        return self.final.predict(X)
+
+
+class CompiledStack:
+    """StackingRegressor whose tree members are traversed in one pass.
+
+    Members that consume the stack input directly (RandomForest, GBR, ...)
+    share a packed forest, so all of their trees are walked together (one
+    forest per input rounding when histogram boosting members are mixed in);
+    the final estimator is compiled the same way over the member outputs.
+    """
+
+    def __init__(self, estimator: StackingRegressor):
+        self.members = [compile_model(est) for est in estimator.estimators_ if est != "drop"]
+        self.passthrough = estimator.passthrough
+        self.final = compile_model(estimator.final_estimator_)
+
+        # Trees that round their inputs alike are packed and walked together.
+        self.packs = []
+        tree_members = [i for i, m in enumerate(self.members) if hasattr(m, "forest")]
+        for dtype in dict.fromkeys(self.members[i].forest.input_dtype for i in tree_members):
+            group = [i for i in tree_members if self.members[i].forest.input_dtype == dtype]
+            forests = [self.members[i].forest for i in group]
+            slices = {}
+            start = 0
+            for i, forest in zip(group, forests):
+                slices[i] = slice(start, start + forest.n_trees)
+                start += forest.n_trees
+            self.packs.append((PackedForest.concat(forests), slices))
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        leaf_values = {}
+        for forest, slices in self.packs:
+            values = forest.leaf_values(X)
+            leaf_values.update({i: values[:, s] for i, s in slices.items()})
+        predictions = []
+        for i, member in enumerate(self.members):
+            if i in leaf_values:
+                if isinstance(member, (CompiledBoosting, CompiledHistBoosting)):
+                    predictions.append(member.reduce(leaf_values[i], X))
+                else:
+                    predictions.append(member.reduce(leaf_values[i]))
+            else:
+                predictions.append(member.predict(X))
+        if self.passthrough:
+            predictions.append(np.asarray(X, dtype=np.float64))
+        return np.column_stack(predictions)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.final.predict(self.transform(X))
+
+
+def compile_transform(step):
+    if isinstance(step, StandardScaler):
+        return CompiledStandardScaler(step)
+    if (
+        isinstance(step, SimpleImputer)
+        and step.strategy in ("mean", "median", "most_frequent", "constant")
+        and not step.add_indicator
+        and not np.isnan(np.asarray(step.statistics_, dtype=np.float64)).any()
+    ):
+        return CompiledImputer(step)
+    return SklearnStep(step)
+
+
+def compile_model(estimator):
+    """Convert a fitted regressor into its array-backed equivalent."""
+    compiled = _compile_model(estimator)
+    compiled.feature_names_in_ = getattr(estimator, "feature_names_in_", None)
+    compiled.n_features_in_ = getattr(estimator, "n_features_in_", None)
+    return compiled
+
+
+def _compile_model(estimator):
+    if isinstance(estimator, StackingRegressor):
+        return CompiledStack(estimator)
+    if isinstance(estimator, Pipeline):
+        return CompiledPipeline(estimator)
+    if isinstance(estimator, (RandomForestRegressor, ExtraTreesRegressor, DecisionTreeRegressor)):
+        if getattr(estimator, "n_outputs_", 1) == 1:
+            return CompiledForest(estimator)
+    if isinstance(estimator, GradientBoostingRegressor):
+        return CompiledBoosting(estimator)
+    if (
+        isinstance(estimator, HistGradientBoostingRegressor)
+        and estimator.loss in IDENTITY_LOSSES
+        and estimator.is_categorical_ is None
+    ):
+        return CompiledHistBoosting(estimator)
+    if isinstance(estimator, LinearModel) and np.ndim(estimator.coef_) == 1:
+        return CompiledLinear(estimator)
+    return SklearnStep(estimator)
+
+
+def probe_matrix(compiled, n_features: int, n_rows: int = 512, seed: int = 0) -> np.ndarray:
+    """Rows that land on both sides of the split thresholds used on the input.
+
+    Used to check a compiled model against sklearn without any training data.
+    """
+    rng = np.random.default_rng(seed)
+    forests = []
+    pending = [compiled]
+    while pending:
+        node = pending.pop()
+        if getattr(node, "forest", None) is not None:
+            forests.append(node.forest)
+        pending.extend(getattr(node, "members", []))
+        if isinstance(node, CompiledPipeline):
+            pending.append(node.final)
+
+    X = rng.normal(size=(n_rows, n_features))
+    for j in range(n_features):
+        thresholds = np.concatenate(
+            [
+                f.threshold[(f.feature == j) & np.isfinite(f.threshold)]
+                for f in forests
+                if f.n_features == n_features
+            ]
+            or [np.empty(0)]
+        )
+        if len(thresholds):
+            picks = rng.choice(thresholds, size=n_rows)
+            X[:, j] = picks + rng.choice([-1.0, 1.0], size=n_rows) * np.abs(picks) * 1e-3
+    return X
+
+
+def verify_compiled(compiled, estimator, X: np.ndarray, rtol: float = 1e-9, atol: float = 1e-12):
+    """Raise ValueError when the compiled model disagrees with sklearn on X."""
+    expected = np.asarray(estimator.predict(X), dtype=np.float64)
+    actual = compiled.predict(X)
+    if not np.allclose(actual, expected, rtol=rtol, atol=atol):
+        worst = float(np.max(np.abs(actual - expected)))
+        raise ValueError(
+            f"Compiled {type(estimator).__name__} deviates from sklearn by up to {worst:g}"
+        )
+    logging.info(
+        "Compiled %s matches sklearn on %d probe rows (max abs diff %g)",
+        type(estimator).__name__,
+        len(X),
+        float(np.max(np.abs(actual - expected))) if len(X) else 0.0,
+    )
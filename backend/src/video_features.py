@@ -0,0 +1,277 @@
+import logging
+import math
+import multiprocessing
+import os
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from schemas import VideoMetrics, VideoSource
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is only needed for image-sequence directories
+    Image = None
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp")
+# Frames converted to float at once; bounds the working set of the edge pass.
+FRAME_BLOCK = 16
+# Largest Sobel magnitude of a [0, 1] image, used to scale edge_intensity to [0, 1].
+SOBEL_MAX = 4.0 * math.sqrt(2.0)
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Feature definitions:
+# - edge_intensity   mean Sobel gradient magnitude of the grey frames, in [0, 1]
+# - color_histogram  entropy of the joint RGB histogram (`histogram_bins` levels per
+#                    channel) over all sampled pixels, normalised to [0, 1]
+# - spectral_entropy entropy of the mean power spectrum of Hann-windowed audio
+#                    frames of `fft_size` samples, normalised to [0, 1]
+# - audio_intensity  RMS of the mono track at full scale 1.0
+
+
+def _frame_count(frames_path: str) -> int:
+    if os.path.isdir(frames_path):
+        return len(_image_files(frames_path))
+    frames = np.load(frames_path, mmap_mode="r")
+    if not frames.ndim:
+        raise ValueError(f"{frames_path} holds a scalar, not an array of frames")
+    return frames.shape[0]
+
+
+def _image_files(directory: str) -> List[str]:
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_SUFFIXES)
+    )
+
+
+def _read_frames(frames_path: str, indices: Sequence[int]) -> np.ndarray:
+    """Decoded frames at `indices` as an (n, H, W, 3) uint8 array."""
+    if os.path.isdir(frames_path):
+        if Image is None:
+            raise RuntimeError("Reading image sequences requires Pillow; send a .npy array instead")
+        files = _image_files(frames_path)
+        frames = np.stack([np.asarray(Image.open(files[i]).convert("RGB")) for i in indices])
+    else:
+        # Memory-mapped, so only the sampled frames are ever read from disk.
+        frames = np.asarray(np.load(frames_path, mmap_mode="r")[list(indices)])
+    if frames.ndim == 3:
+        frames = np.repeat(frames[..., None], 3, axis=-1)
+    if frames.ndim != 4 or frames.shape[-1] < 3:
+        raise ValueError(
+            f"{frames_path} holds frames of shape {frames.shape[1:]}, expected (H, W) or (H, W, 3)"
+        )
+    if frames.dtype != np.uint8:
+        frames = np.clip(frames, 0, 255).astype(np.uint8)
+    return frames[..., :3]
+
+
+def _sobel_sum(frames: np.ndarray) -> float:
+    # Channel-weighted sum rather than `@ LUMA`, which would start BLAS threads
+    # in every pool worker.
+    grey = (frames[..., 0] * LUMA[0] + frames[..., 1] * LUMA[1] + frames[..., 2] * LUMA[2]) / 255.0
+    top, mid, bottom = grey[:, :-2], grey[:, 1:-1], grey[:, 2:]
+    gx = (top[:, :, 2:] + 2 * mid[:, :, 2:] + bottom[:, :, 2:]) - (
+        top[:, :, :-2] + 2 * mid[:, :, :-2] + bottom[:, :, :-2]
+    )
+    left, centre, right = grey[:, :, :-2], grey[:, :, 1:-1], grey[:, :, 2:]
+    gy = (left[:, 2:] + 2 * centre[:, 2:] + right[:, 2:]) - (
+        left[:, :-2] + 2 * centre[:, :-2] + right[:, :-2]
+    )
+    return float(np.sqrt(gx * gx + gy * gy).sum(dtype=np.float64))
+
+
+def _color_counts(frames: np.ndarray, bins: int) -> np.ndarray:
+    q = (frames.astype(np.uint16) * bins) >> 8
+    codes = (q[..., 0] * bins + q[..., 1]) * bins + q[..., 2]
+    return np.bincount(codes.ravel(), minlength=bins**3)
+
+
+def frame_stats(frames_path: str, indices: Sequence[int], bins: int) -> Dict[str, Any]:
+    """Partial sums over some frames; partials of disjoint chunks add up exactly.
+
+    Module-level so process-pool workers can run it; each worker opens the
+    frames itself instead of receiving pixels through a pipe.
+    """
+    stats = {"edge_sum": 0.0, "edge_pixels": 0, "counts": np.zeros(bins**3, dtype=np.int64)}
+    timings = {"read_frames_s": 0.0, "edges_s": 0.0, "histogram_s": 0.0}
+    for start in range(0, len(indices), FRAME_BLOCK):
+        t0 = time.perf_counter()
+        frames = _read_frames(frames_path, indices[start:start + FRAME_BLOCK])
+        t1 = time.perf_counter()
+        if frames.shape[1] > 2 and frames.shape[2] > 2:
+            stats["edge_sum"] += _sobel_sum(frames)
+            stats["edge_pixels"] += frames.shape[0] * (frames.shape[1] - 2) * (frames.shape[2] - 2)
+        t2 = time.perf_counter()
+        stats["counts"] += _color_counts(frames, bins)
+        t3 = time.perf_counter()
+        timings["read_frames_s"] += t1 - t0
+        timings["edges_s"] += t2 - t1
+        timings["histogram_s"] += t3 - t2
+    stats["timings"] = timings
+    return stats
+
+
+def _normalised_entropy(weights: np.ndarray) -> float:
+    total = weights.sum()
+    if total <= 0 or len(weights) < 2:
+        return 0.0
+    p = weights[weights > 0] / total
+    return float(-(p * np.log(p)).sum() / math.log(len(weights)))
+
+
+def _pcm_to_float(raw: bytes, width: int) -> np.ndarray:
+    if width == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128.0) / 128.0
+    if width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        values = b[:, 0].astype(np.int32) | (b[:, 1].astype(np.int32) << 8) | (b[:, 2].astype(np.int32) << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        return values / float(1 << 23)
+    dtype = {2: "<i2", 4: "<i4"}[width]
+    return np.frombuffer(raw, dtype=dtype) / float(2 ** (8 * width - 1))
+
+
+def audio_stats(audio_path: str, fft_size: int, block_frames: int = 1 << 16) -> Dict[str, Any]:
+    """RMS and spectral entropy of a PCM WAV file, read in fixed-size blocks."""
+    timings = {"read_audio_s": 0.0, "fft_s": 0.0}
+    window = np.hanning(fft_size)
+    power = np.zeros(fft_size // 2 + 1)
+    square_sum = 0.0
+    samples = 0
+    spectra = 0
+    carry = np.zeros(0)
+    try:
+        wav = wave.open(audio_path, "rb")
+    except (wave.Error, EOFError) as exc:
+        raise ValueError(f"Unreadable WAV file {os.path.basename(audio_path)}: {exc}")
+    with wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        if width not in (1, 2, 3, 4):
+            raise ValueError(f"Unsupported WAV sample width {width}")
+        # Whole FFT frames per block, so only a partial frame is carried over.
+        block_frames = max(fft_size, block_frames - block_frames % fft_size)
+        while True:
+            t0 = time.perf_counter()
+            raw = wav.readframes(block_frames)
+            if not raw:
+                break
+            mono = _pcm_to_float(raw, width).reshape(-1, channels).mean(axis=1)
+            t1 = time.perf_counter()
+            square_sum += float(np.dot(mono, mono))
+            samples += len(mono)
+            signal = np.concatenate([carry, mono])
+            usable = len(signal) - len(signal) % fft_size
+            if usable:
+                frames = signal[:usable].reshape(-1, fft_size) * window
+                power += (np.abs(np.fft.rfft(frames, axis=1)) ** 2).sum(axis=0)
+                spectra += len(frames)
+            carry = signal[usable:]
+            timings["read_audio_s"] += t1 - t0
+            timings["fft_s"] += time.perf_counter() - t1
+    return {
+        "rate": rate,
+        "samples": samples,
+        "audio_intensity": math.sqrt(square_sum / samples) if samples else 0.0,
+        "spectral_entropy": _normalised_entropy(power) if spectra else 0.0,
+        "timings": timings,
+    }
+
+
+class FeatureExtractor:
+    """Compute `VideoMetrics` from decoded frames, a WAV track and post metadata.
+
+    Every `sample_every`-th frame is used, up to `max_frames`. When more than
+    `parallel_min_frames` frames are sampled they are split across a process
+    pool of `workers`, and the audio is processed on the calling thread in the
+    meantime. `extract` also returns the time spent in each stage; stage times
+    from pool workers are summed, so they can exceed the wall time.
+    """
+
+    def __init__(
+        self,
+        sample_every: int = 5,
+        max_frames: Optional[int] = 600,
+        histogram_bins: int = 8,
+        fft_size: int = 2048,
+        workers: Optional[int] = None,
+        parallel_min_frames: int = 128,
+    ):
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+        self.sample_every = sample_every
+        self.max_frames = max_frames
+        self.histogram_bins = histogram_bins
+        self.fft_size = fft_size
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_min_frames = parallel_min_frames
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def sample_indices(self, n_frames: int) -> List[int]:
+        indices = list(range(0, n_frames, self.sample_every))
+        return indices[: self.max_frames] if self.max_frames else indices
+
+    def extract(self, source: VideoSource) -> Tuple[VideoMetrics, Dict[str, Any]]:
+        started = time.perf_counter()
+        n_frames = _frame_count(source.frames_path)
+        indices = self.sample_indices(n_frames)
+        if not indices:
+            raise ValueError(f"No frames found in {source.frames_path}")
+
+        if len(indices) >= self.parallel_min_frames and self.workers > 1:
+            if self._pool is None:
+                # Spawned rather than forked: the server process runs many threads.
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            size = math.ceil(len(indices) / self.workers)
+            futures = [
+                self._pool.submit(frame_stats, source.frames_path, indices[i:i + size], self.histogram_bins)
+                for i in range(0, len(indices), size)
+            ]
+            audio = audio_stats(source.audio_path, self.fft_size)
+            partials = [future.result() for future in futures]
+        else:
+            partials = [frame_stats(source.frames_path, indices, self.histogram_bins)]
+            audio = audio_stats(source.audio_path, self.fft_size)
+
+        edge_pixels = sum(p["edge_pixels"] for p in partials)
+        counts = sum(p["counts"] for p in partials)
+        duration = audio["samples"] / audio["rate"] if audio["samples"] else n_frames / source.fps
+
+        metrics = VideoMetrics(
+            video_duration_sec=int(round(duration)),
+            verified_status=source.verified_status,
+            author_ban_status=source.author_ban_status,
+            like_ratio=source.likes / source.views,
+            share_ratio=source.shares / source.views,
+            comment_ratio=source.comments / source.views,
+            title_length=len(source.title),
+            description_length=len(source.description),
+            edge_intensity=sum(p["edge_sum"] for p in partials) / edge_pixels / SOBEL_MAX if edge_pixels else 0.0,
+            color_histogram=_normalised_entropy(counts),
+            spectral_entropy=audio["spectral_entropy"],
+            audio_intensity=audio["audio_intensity"],
+        )
+        stages: Dict[str, float] = dict(audio["timings"])
+        for partial in partials:
+            for stage, seconds in partial["timings"].items():
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        timings = {
+            "stages": stages,
+            "wall_s": time.perf_counter() - started,
+            "frames_total": n_frames,
+            "frames_sampled": len(indices),
+            "frame_workers": len(partials),
+        }
+        logging.debug("Extracted features from %s in %.3fs", source.frames_path, timings["wall_s"])
+        return metrics, timings
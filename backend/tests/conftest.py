@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from feature_schema import CLASSIFICATION_SCHEMA, ENGAGEMENT_SCHEMA, WATCH_DURATION_SCHEMA  # noqa: E402
+from schemas import VideoMetrics  # noqa: E402
+from scoring_manager import MODEL_FILES  # noqa: E402
+
+INT_FIELDS = {"video_duration_sec", "verified_status", "author_ban_status", "title_length", "description_length"}
+
+
+def synthetic_videos(n_rows, seed=0):
+    """`VideoMetrics` spread over the ranges the training data covers."""
+    rng = np.random.default_rng(seed)
+    columns = {
+        "video_duration_sec": rng.integers(5, 60, n_rows),
+        "verified_status": rng.integers(0, 2, n_rows),
+        "author_ban_status": rng.integers(0, 3, n_rows),
+        "share_ratio": rng.random(n_rows) * 0.05,
+        "comment_ratio": rng.random(n_rows) * 0.01,
+        "like_ratio": rng.random(n_rows) * 0.3,
+        "title_length": rng.integers(5, 80, n_rows),
+        "description_length": rng.integers(0, 300, n_rows),
+        "edge_intensity": rng.random(n_rows),
+        "color_histogram": rng.random(n_rows),
+        "spectral_entropy": rng.random(n_rows),
+        "audio_intensity": rng.random(n_rows),
+    }
+    return [
+        VideoMetrics(**{name: (int if name in INT_FIELDS else float)(values[i]) for name, values in columns.items()})
+        for i in range(n_rows)
+    ]
+
+
+def write_models(directory, seed=0, n_rows=300):
+    """Small stand-ins for the three artifacts, shaped like the training scripts' models."""
+    from sklearn.cluster import KMeans
+    from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor, StackingRegressor
+    from sklearn.impute import SimpleImputer
+    from sklearn.linear_model import Ridge, RidgeCV
+    from sklearn.pipeline import Pipeline, make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.svm import SVR
+
+    videos = synthetic_videos(n_rows, seed)
+    rng = np.random.default_rng(seed)
+
+    def matrix(schema):
+        return np.array([[getattr(v, name) for name in schema.features] for v in videos], dtype=np.float64)
+
+    X = matrix(ENGAGEMENT_SCHEMA)
+    y = X[:, 3] * 5 + X[:, 4] * 3 + X[:, 0] * 0.001 + rng.random(n_rows) * 0.01
+    imputer = SimpleImputer(strategy="mean")
+    engagement = StackingRegressor(
+        estimators=[
+            ("rf", make_pipeline(imputer, RandomForestRegressor(n_estimators=10, random_state=seed))),
+            ("svr", make_pipeline(imputer, StandardScaler(), SVR(C=1.0, epsilon=0.2))),
+            ("ridge", make_pipeline(imputer, StandardScaler(), Ridge(alpha=1.0))),
+        ],
+        final_estimator=GradientBoostingRegressor(n_estimators=20, random_state=seed),
+    ).fit(X, y)
+
+    classifier = Pipeline(
+        [("scaler", StandardScaler()), ("model", KMeans(n_clusters=3, n_init=3, random_state=seed))]
+    ).fit(matrix(CLASSIFICATION_SCHEMA))
+
+    Xw = matrix(WATCH_DURATION_SCHEMA)
+    yw = Xw[:, 0] * 20 + Xw[:, 5] * 10 + rng.random(n_rows) * 2
+    watch = StackingRegressor(
+        estimators=[
+            ("rf", RandomForestRegressor(n_estimators=10, random_state=seed)),
+            ("gbr", GradientBoostingRegressor(n_estimators=20, max_depth=3, random_state=seed)),
+        ],
+        final_estimator=RidgeCV(),
+    ).fit(Xw, yw)
+
+    os.makedirs(directory, exist_ok=True)
+    for name, model in (("engagement", engagement), ("classification", classifier), ("watch_duration", watch)):
+        joblib.dump(model, os.path.join(directory, MODEL_FILES[name][0]))
+    return directory
+
+
+@pytest.fixture(scope="session")
+def model_dir(tmp_path_factory):
+    return write_models(str(tmp_path_factory.mktemp("models")))
+
+
+@pytest.fixture(scope="session")
+def client(model_dir, tmp_path_factory):
+    """The app serving the `model_dir` artifacts, started once per session
+    (its lifespan shuts the shared executor down)."""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    main.scoring_manager.models_dir = model_dir
+    main.scoring_manager.registry_dir = str(tmp_path_factory.mktemp("registry"))
+    with TestClient(main.app) as test_client:
+        deadline = time.monotonic() + 120
+        while not main.scoring_manager.ready:
+            assert main.scoring_manager.load_error is None, main.scoring_manager.load_error
+            assert time.monotonic() < deadline, "models did not load"
+            time.sleep(0.05)
+        yield test_client
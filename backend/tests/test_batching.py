@@ -0,0 +1,65 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import MicroBatcher
+
+
+def test_cancelled_request_does_not_stall_its_batch():
+    started = threading.Event()
+    release = threading.Event()
+    scored = []
+
+    def score_many(batch):
+        started.set()
+        release.wait(5)
+        scored.append(list(batch))
+        return [{"value": item} for item in batch]
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    # Occupy the executor so the next batch is queued with every future still pending.
+    blocker = MicroBatcher(score_many, max_batch_size=1, adaptive=False, submit_batch=executor.submit)
+    blocker.submit(0)
+    assert started.wait(5)
+
+    batcher = MicroBatcher(score_many, max_batch_size=3, window_ms=1000, adaptive=False, submit_batch=executor.submit)
+    futures = [batcher.submit(i) for i in (1, 2, 3)]
+    assert futures[1].cancel()
+    release.set()
+
+    assert futures[0].result(timeout=5) == {"value": 1}
+    assert futures[2].result(timeout=5) == {"value": 3}
+    assert scored[-1] == [1, 3]
+
+    # The batcher keeps serving later requests.
+    assert batcher.submit(4).result(timeout=5) == {"value": 4}
+    batcher.close()
+    blocker.close()
+    executor.shutdown()
+
+
+
+def test_adaptive_batcher_coalesces_while_batches_run_on_an_executor():
+    def score_many(batch):
+        time.sleep(0.01)
+        return [{"value": item} for item in batch]
+
+    executor = ThreadPoolExecutor(max_workers=4)
+    batcher = MicroBatcher(score_many, max_batch_size=64, window_ms=5, adaptive=True, submit_batch=executor.submit)
+
+    def client(worker):
+        # Closed-loop clients, staggered so their requests rarely arrive together.
+        time.sleep(0.002 * worker)
+        for i in range(20):
+            assert batcher.score((worker, i)) == {"value": (worker, i)}
+
+    with ThreadPoolExecutor(max_workers=16) as clients:
+        list(clients.map(client, range(16)))
+
+    stats = batcher.stats()
+    assert stats["requests"] == 16 * 20
+    assert stats["largest_batch"] > 1
+    assert stats["mean_batch_size"] > 4
+    assert stats["in_flight"] == 0
+    batcher.close()
+    executor.shutdown()
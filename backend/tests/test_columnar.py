@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+import columnar
+from conftest import synthetic_videos
+from schemas import VideoMetrics
+from scoring_manager import QUALITY_MAP
+
+needs_pyarrow = pytest.mark.skipif(columnar.pa is None, reason="pyarrow is not installed")
+FORMATS = [columnar.RAW, pytest.param(columnar.ARROW, marks=needs_pyarrow)]
+
+
+def video_columns(videos):
+    return {
+        name: np.array([getattr(video, name) for video in videos], dtype=np.float64)
+        for name in VideoMetrics.model_fields
+    }
+
+
+def post_columns(client, body, media_type):
+    return client.post("/score/batch", content=body, headers={"Content-Type": media_type})
+
+
+def rows(response):
+    """Per-row scores of a columnar response, in the JSON response's shape."""
+    if response.headers["content-type"] == columnar.ARROW:
+        table = columnar.pa.ipc.open_stream(response.content).read_all()
+        columns = {name: table.column(name).to_pylist() for name in table.column_names}
+    else:
+        columns = columnar.decode_raw(response.content)
+        columns["quality_class"] = [QUALITY_MAP[int(code)] for code in columns["quality_class"]]
+    return [
+        {"quality_score": float(score), "quality_class": label, "watch_duration": float(duration)}
+        for score, label, duration in zip(
+            columns["quality_score"], columns["quality_class"], columns["watch_duration"]
+        )
+    ]
+
+
+@pytest.mark.parametrize("media_type", FORMATS)
+def test_columnar_batch_scores_match_json_batch(client, media_type):
+    videos = synthetic_videos(24, seed=3)
+    expected = client.post("/score/batch", json={"videos": [video.model_dump() for video in videos]})
+    assert expected.status_code == 200
+
+    response = post_columns(client, columnar.encode(video_columns(videos), media_type), media_type)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == media_type
+    assert rows(response) == expected.json()["scores"]
+
+
+@pytest.mark.parametrize("media_type", FORMATS)
+def test_columnar_batch_rejects_fractional_integer_fields(client, media_type):
+    columns = video_columns(synthetic_videos(4))
+    columns["title_length"] = columns["title_length"] + 0.5
+    response = post_columns(client, columnar.encode(columns, media_type), media_type)
+    assert response.status_code == 422
+    assert "title_length" in response.json()["detail"]
+
+
+def raw_body(names, values):
+    """An LBC1 payload with exactly these column names, duplicates included."""
+    header = columnar._HEADER.pack(columnar.MAGIC, len(names), values.shape[1])
+    for name in names:
+        header += columnar._NAME_LENGTH.pack(len(name)) + name.encode()
+    header += b"\0" * (-len(header) % 8)
+    return header + values.astype("<f8").tobytes()
+
+
+def test_columnar_batch_rejects_duplicate_columns(client):
+    columns = video_columns(synthetic_videos(4))
+    names = list(columns) + ["like_ratio"]
+    body = raw_body(names, np.array([columns[name] for name in names]))
+    response = post_columns(client, body, columnar.RAW)
+    assert response.status_code == 422
+    assert "Duplicate columns: ['like_ratio']" in response.json()["detail"]
+
+
+@needs_pyarrow
+def test_arrow_batch_rejects_duplicate_and_non_numeric_columns(client):
+    pa = columnar.pa
+    columns = video_columns(synthetic_videos(4))
+
+    def post_table(arrays, names):
+        batch = pa.RecordBatch.from_arrays(arrays, names=names)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return post_columns(client, sink.getvalue().to_pybytes(), columnar.ARROW)
+
+    arrays = [pa.array(values) for values in columns.values()]
+    response = post_table(arrays + [arrays[0]], list(columns) + [next(iter(columns))])
+    assert response.status_code == 422
+    assert "Duplicate columns" in response.json()["detail"]
+
+    names = list(columns)
+    arrays[names.index("like_ratio")] = pa.array(["0.1"] * 4)
+    response = post_table(arrays, names)
+    assert response.status_code == 422
+    assert "like_ratio" in response.json()["detail"]
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import (
+    GradientBoostingRegressor,
+    HistGradientBoostingRegressor,
+    RandomForestRegressor,
+    StackingRegressor,
+)
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVR
+
+from conftest import synthetic_videos
+from explain import decompose, reference_point
+from tree_engine import compile_model
+
+N_FEATURES = 4
+
+
+def stack(final_estimator, passthrough=False):
+    imputer = SimpleImputer(strategy="mean")
+    return StackingRegressor(
+        estimators=[
+            ("rf", make_pipeline(imputer, RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0))),
+            ("hgb", HistGradientBoostingRegressor(max_iter=20, random_state=0)),
+            ("svr", make_pipeline(imputer, StandardScaler(), SVR(C=1.0, epsilon=0.2))),
+            ("ridge", make_pipeline(imputer, StandardScaler(), Ridge(alpha=1.0))),
+        ],
+        final_estimator=final_estimator,
+        passthrough=passthrough,
+    )
+
+
+@pytest.mark.parametrize(
+    "model",
+    [
+        RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0),
+        GradientBoostingRegressor(n_estimators=20, max_depth=3, random_state=0),
+        HistGradientBoostingRegressor(max_iter=20, random_state=0),
+        make_pipeline(SimpleImputer(), StandardScaler(), Ridge(alpha=1.0)),
+        make_pipeline(StandardScaler(), SVR(C=1.0, epsilon=0.2)),
+        stack(Ridge()),
+        stack(Ridge(), passthrough=True),
+        stack(GradientBoostingRegressor(n_estimators=20, random_state=0)),
+    ],
+    ids=[
+        "random_forest",
+        "gradient_boosting",
+        "hist_boosting",
+        "ridge",
+        "svr",
+        "stack_ridge",
+        "stack_ridge_passthrough",
+        "stack_gbr",
+    ],
+)
+def test_contributions_add_up_to_the_prediction(model):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, N_FEATURES))
+    y = 2 * X[:, 0] + X[:, 1] ** 2 - X[:, 2] * X[:, 3] + rng.normal(scale=0.1, size=len(X))
+    model.fit(X, y)
+    compiled = compile_model(model)
+
+    bias, contrib = decompose(compiled, X, reference_point(compiled, N_FEATURES))
+    assert contrib.shape == X.shape
+    np.testing.assert_allclose(bias + contrib.sum(axis=1), model.predict(X), rtol=1e-7, atol=1e-9)
+
+
+def test_explain_endpoint_adds_up_to_the_scores(client):
+    for video in synthetic_videos(8, seed=4):
+        response = client.post("/score/explain", json=video.model_dump())
+        assert response.status_code == 200
+        explanation = response.json()["explanation"]
+        # Engagement is a stack with a tree final estimator, watch duration one with a linear final estimator.
+        for output in ("quality_score", "watch_duration"):
+            part = explanation[output]
+            total = part["base_value"] + sum(part["contributions"].values())
+            assert total == pytest.approx(part["prediction"], rel=1e-7, abs=1e-9)
+        cluster = explanation["quality_class"]
+        assert sum(cluster["contributions"].values()) == pytest.approx(cluster["margin"])
+        assert cluster["margin"] >= 0
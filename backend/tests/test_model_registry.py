@@ -0,0 +1,130 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+import model_registry
+from conftest import synthetic_videos, write_models
+from model_registry import RegistryWatcher, current_version, list_versions, publish, set_current
+from scoring_manager import ScoringManager
+
+
+@pytest.fixture(scope="module")
+def artifacts(tmp_path_factory):
+    """Two trained model sets that score differently."""
+    return [write_models(str(tmp_path_factory.mktemp(f"models-{seed}")), seed=seed) for seed in (0, 1)]
+
+
+def test_publish_never_exposes_a_partial_version(tmp_path, artifacts, monkeypatch):
+    registry = str(tmp_path)
+    publish(artifacts[0], registry, "v1")
+    copied = []
+
+    def copy_then_fail(source, target):
+        if copied:
+            raise OSError("disk full")
+        copied.append(shutil.copy(source, target))
+
+    monkeypatch.setattr(model_registry.shutil, "copy2", copy_then_fail)
+    with pytest.raises(OSError):
+        publish(artifacts[1], registry, "v2")
+    assert copied
+    # Neither the half-copied version nor its staging directory is left behind.
+    assert sorted(os.listdir(registry)) == ["CURRENT", "v1"]
+    assert current_version(registry) == "v1"
+
+    monkeypatch.undo()
+    publish(artifacts[1], registry, "v2", activate=False)
+    assert list_versions(registry) == ["v1", "v2"]
+    assert current_version(registry) == "v1"
+    assert sorted(os.listdir(os.path.join(registry, "v2"))) == sorted(
+        name for name in os.listdir(artifacts[1]) if name.endswith(".pkl")
+    )
+
+
+def test_set_current_is_atomic_for_concurrent_readers(tmp_path, artifacts):
+    registry = str(tmp_path)
+    publish(artifacts[0], registry, "v1")
+    publish(artifacts[1], registry, "v2")
+    seen = set()
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            # A torn or missing file would read as None or raise ValueError.
+            seen.add(current_version(registry))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for i in range(300):
+            set_current(registry, ("v1", "v2")[i % 2])
+    finally:
+        stop.set()
+        reader.join()
+    assert seen <= {"v1", "v2"} and seen
+    assert sorted(os.listdir(registry)) == ["CURRENT", "v1", "v2"]
+    with pytest.raises(FileNotFoundError):
+        set_current(registry, "v3")
+    assert current_version(registry) in ("v1", "v2")
+
+
+def test_watcher_reports_a_new_current_version_and_retries_failures(tmp_path, artifacts):
+    registry = str(tmp_path)
+    publish(artifacts[0], registry, "v1")
+    publish(artifacts[1], registry, "v2", activate=False)
+    calls = []
+    changed = threading.Event()
+
+    def on_change(version):
+        calls.append(version)
+        if len(calls) == 1:
+            raise RuntimeError("Model set v1 is still loading")
+        changed.set()
+
+    watcher = RegistryWatcher(registry, on_change, interval=0.01)
+    try:
+        time.sleep(0.05)
+        assert calls == []  # the version current at start is not reported
+        set_current(registry, "v2")
+        assert changed.wait(5)
+        time.sleep(0.05)
+    finally:
+        watcher.close()
+    assert calls == ["v2", "v2"]
+
+
+def test_requests_in_flight_finish_on_the_set_they_started_with(tmp_path, artifacts):
+    registry = str(tmp_path)
+    publish(artifacts[0], registry, "v1")
+    publish(artifacts[1], registry, "v2", activate=False)
+    manager = ScoringManager(registry_dir=registry)
+    videos = synthetic_videos(8, seed=5)
+    expected_v1 = manager.score_many(videos)
+
+    old = manager.models
+    started, release = threading.Event(), threading.Event()
+    score_matrix = old.score_matrix
+
+    def held_score_matrix(X, mode="full"):
+        started.set()
+        assert release.wait(30)
+        return score_matrix(X, mode)
+
+    old.score_matrix = held_score_matrix
+    results = []
+    request = threading.Thread(target=lambda: results.append(manager.score_many(videos)))
+    request.start()
+    assert started.wait(30)
+
+    set_current(registry, "v2")
+    manager.reload().result(timeout=120)
+    assert manager.version == "v2"
+    expected_v2 = manager.score_many(videos)
+    assert expected_v2 != expected_v1
+
+    release.set()
+    request.join(30)
+    assert results == [expected_v1]
@@ -0,0 +1,48 @@
+from concurrent.futures import Future
+
+from prediction_cache import PredictionCache
+from schemas import VideoMetrics
+
+
+def metrics(duration):
+    return VideoMetrics(
+        video_duration_sec=duration, verified_status=0, author_ban_status=0, share_ratio=0.1,
+        comment_ratio=0.1, like_ratio=0.1, title_length=10, description_length=20, edge_intensity=0.5,
+        color_histogram=0.5, spectral_entropy=0.5, audio_intensity=0.5,
+    )
+
+
+def test_submit_coalesces_without_blocking_and_isolates_cancellation():
+    cache = PredictionCache(max_entries=10)
+    pending = []
+
+    def submit_many(videos):
+        pending.append((list(videos), Future()))
+        return pending[-1][1]
+
+    def submit(video):
+        future = Future()
+        submit_many([video]).add_done_callback(lambda done: future.set_result(done.result()[0]))
+        return future
+
+    first = cache.submit(metrics(1), submit)
+    second = cache.submit(metrics(1), submit)
+    # Nothing has been scored yet, and only one computation was started.
+    assert not first.done() and not second.done()
+    assert len(pending) == 1
+
+    # A caller going away does not cancel the computation the other waits on.
+    assert first.cancel()
+    pending[0][1].set_result([{"score": 1}])
+    assert second.result(timeout=5) == {"score": 1}
+
+    # Cached rows are served at once and only the misses are submitted.
+    batch = cache.submit_many([metrics(1), metrics(2), metrics(2)], submit_many)
+    assert [video.video_duration_sec for video in pending[1][0]] == [2]
+    pending[1][1].set_result([{"score": 2}])
+    assert batch.result(timeout=5) == [{"score": 1}, {"score": 2}, {"score": 2}]
+
+    # Callers get copies of the cached results.
+    batch.result()[0]["score"] = 0
+    assert cache.get_or_compute(metrics(1), lambda video: {"score": -1}) == {"score": 1}
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
@@ -0,0 +1,22 @@
+import pytest
+
+from conftest import synthetic_videos
+from scoring_manager import ScoringManager
+
+
+@pytest.mark.parametrize("engine", ["sklearn", "compiled"])
+def test_batch_scores_every_row_as_a_single_call_would(model_dir, engine):
+    manager = ScoringManager(engine=engine, models_dir=model_dir)
+    videos = synthetic_videos(64, seed=1)
+    batched = manager.score_many(videos)
+    # Exactly equal, not just close: a row's score must not depend on its batch.
+    assert batched == [manager.score(video) for video in videos]
+    assert manager.score_many(videos[:7]) == batched[:7]
+
+
+def test_score_batch_endpoint_matches_single_scores(client):
+    videos = [video.model_dump() for video in synthetic_videos(16, seed=2)]
+    batch = client.post("/score/batch", json={"videos": videos})
+    assert batch.status_code == 200
+    singles = [client.post("/score", json=video).json()["score"] for video in videos]
+    assert batch.json()["scores"] == singles
@@ -0,0 +1,52 @@
+import asyncio
+
+import main
+
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0", "spec_version": "2.3"},
+    "http_version": "1.1",
+    "method": "POST",
+    "scheme": "http",
+    "path": "/score/stream",
+    "raw_path": b"/score/stream",
+    "query_string": b"",
+    "root_path": "",
+    "headers": [(b"content-type", b"application/x-ndjson")],
+    "client": ("testclient", 50000),
+    "server": ("testserver", 80),
+}
+
+
+def test_stream_releases_its_admission_slot_when_the_client_leaves_before_the_body():
+    main.app.dependency_overrides[main.require_ready] = lambda: None
+    messages = [{"type": "http.request", "body": b'{"video_duration_sec": 1}\n', "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message["type"])
+        raise OSError("client went away")
+
+    async def call():
+        try:
+            await main.app(SCOPE, receive, send)
+        except Exception as exc:
+            # While the error is being handled (its traceback keeps the
+            # response alive) the slot must already be free, not left to
+            # garbage collection of the unstarted body.
+            return exc, main.admission.stats()
+
+    before = main.admission.stats()
+    try:
+        error, after = asyncio.run(call())
+    finally:
+        main.app.dependency_overrides.clear()
+    assert error is not None
+    # The handler admitted the upload, the response never got to its body...
+    assert after["admitted"] == before["admitted"] + 1
+    assert sent[0] == "http.response.start"
+    # ...and the slot was given back anyway.
+    assert after["pending_requests"] == before["pending_requests"] == 0
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import (
+    GradientBoostingRegressor,
+    HistGradientBoostingRegressor,
+    RandomForestRegressor,
+    StackingRegressor,
+)
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVR
+
+from tree_engine import compile_model, probe_matrix
+
+N_FEATURES = 4
+
+
+def data(n_rows=400, missing=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, N_FEATURES))
+    y = 2 * X[:, 0] + X[:, 1] ** 2 - X[:, 2] * X[:, 3] + rng.normal(scale=0.1, size=n_rows)
+    X[rng.random(X.shape) < missing] = np.nan
+    return X, y
+
+
+def thresholds(model):
+    """(feature, threshold) of every split in the fitted trees under `model`."""
+    found = []
+    pending = [model]
+    while pending:
+        est = pending.pop()
+        if hasattr(est, "steps"):
+            pending.extend(step for _, step in est.steps)
+        members = np.asarray(getattr(est, "estimators_", []), dtype=object).ravel()  # 2-D for boosting
+        pending.extend(e for e in members if not isinstance(e, str))
+        if hasattr(est, "final_estimator_"):
+            pending.append(est.final_estimator_)
+        if hasattr(est, "tree_"):
+            split = est.tree_.children_left != -1
+            found += zip(est.tree_.feature[split], est.tree_.threshold[split])
+        for predictor in (p for iteration in getattr(est, "_predictors", []) for p in iteration):
+            nodes = predictor.nodes[~predictor.nodes["is_leaf"].astype(bool)]
+            found += zip(nodes["feature_idx"], nodes["num_threshold"])
+    return found
+
+
+def edge_rows(model, X):
+    """Rows with one feature on, or one float64/float32 step either side of, a split threshold.
+
+    sklearn's exact trees compare float32-rounded inputs against float64
+    thresholds, so values that round onto or across a threshold in float32
+    are where a traversal that skipped the rounding would go wrong.
+    """
+    base = np.nan_to_num(X[: len(X) // 4 or 1])
+    rows = []
+    for feature, threshold in thresholds(model)[:200]:
+        t32 = np.float32(threshold)
+        for value in (
+            threshold,
+            np.nextafter(threshold, -np.inf),
+            np.nextafter(threshold, np.inf),
+            float(t32),
+            float(np.nextafter(t32, np.float32(-np.inf))),
+            float(np.nextafter(t32, np.float32(np.inf))),
+        ):
+            row = base[len(rows) % len(base)].copy()
+            row[feature] = value
+            rows.append(row)
+    return np.array(rows).reshape(-1, N_FEATURES)
+
+
+def assert_matches(model, X):
+    compiled = compile_model(model)
+    checks = [X, probe_matrix(compiled, N_FEATURES)]
+    edges = edge_rows(model, X)
+    if len(edges):
+        checks.append(edges)
+    for rows in checks:
+        np.testing.assert_allclose(compiled.predict(rows), model.predict(rows), rtol=1e-9, atol=1e-12)
+    # Single rows take the same path as batches.
+    np.testing.assert_allclose(compiled.predict(X[:1]), model.predict(X[:1]), rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize(
+    "model",
+    [
+        RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0),
+        GradientBoostingRegressor(n_estimators=20, max_depth=3, random_state=0),
+        make_pipeline(SimpleImputer(), StandardScaler(), Ridge(alpha=1.0)),
+    ],
+    ids=["random_forest", "gradient_boosting", "ridge"],
+)
+def test_compiled_model_matches_sklearn(model):
+    X, y = data()
+    assert_matches(model.fit(X, y), X)
+
+
+def test_compiled_histogram_boosting_matches_sklearn_with_missing_values():
+    X, y = data(missing=0.1)
+    model = HistGradientBoostingRegressor(max_iter=30, random_state=0).fit(X, y)
+    assert_matches(model, X)
+    # Missing values follow the direction each split learned.
+    rows = X[:50].copy()
+    rows[:, 0] = np.nan
+    np.testing.assert_allclose(compile_model(model).predict(rows), model.predict(rows), rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize("final_estimator", ["gbr", "ridge"])
+def test_compiled_stack_matches_sklearn(final_estimator):
+    X, y = data(missing=0.05)
+    imputer = SimpleImputer(strategy="mean")
+    model = StackingRegressor(
+        estimators=[
+            ("rf", make_pipeline(imputer, RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0))),
+            ("hgb", HistGradientBoostingRegressor(max_iter=20, random_state=0)),
+            ("svr", make_pipeline(imputer, StandardScaler(), SVR(C=1.0, epsilon=0.2))),
+            ("ridge", make_pipeline(imputer, StandardScaler(), Ridge(alpha=1.0))),
+        ],
+        final_estimator=(
+            GradientBoostingRegressor(n_estimators=20, random_state=0) if final_estimator == "gbr" else Ridge()
+        ),
+    ).fit(X, y)
+    assert_matches(model, X)
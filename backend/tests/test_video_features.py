@@ -0,0 +1,48 @@
+import os
+import wave
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "VIDEO_MEDIA_ROOT", os.path.realpath(tmp_path))
+    with wave.open(str(tmp_path / "audio.wav"), "wb") as track:
+        track.setnchannels(1)
+        track.setsampwidth(2)
+        track.setframerate(8000)
+        track.writeframes(np.zeros(8000, dtype="<i2").tobytes())
+    return tmp_path
+
+
+def post_frames(client, media, frames):
+    np.save(media / "frames.npy", frames)
+    return client.post(
+        "/video/metrics",
+        json={
+            "frames_path": "frames.npy",
+            "audio_path": "audio.wav",
+            "views": 10,
+            "likes": 1,
+            "comments": 0,
+            "shares": 0,
+        },
+    )
+
+
+@pytest.mark.parametrize("shape", [(4, 8, 8, 3), (4, 8, 8, 4), (4, 8, 8)], ids=["rgb", "rgba", "grey"])
+def test_video_metrics_accepts_rgb_and_grey_frames(client, media, shape):
+    frames = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+    response = post_frames(client, media, frames)
+    assert response.status_code == 200, response.text
+    assert 0 < response.json()["metrics"]["edge_intensity"] <= 1
+
+
+@pytest.mark.parametrize("shape", [(4, 8, 8, 1), (4, 8, 8, 2), (4, 8), (4,), ()])
+def test_video_metrics_rejects_malformed_frames(client, media, shape):
+    response = post_frames(client, media, np.zeros(shape, dtype=np.uint8))
+    assert response.status_code == 422
+    assert "frames" in response.json()["detail"]
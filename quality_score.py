@@ -2,6 +2,8 @@ import os
 import pandas as pd
 import joblib
 import numpy as np
+
+from training.feature_schema import load_feature_schema
 # from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
 # ---- Set Relative Model Paths ----
@@ -19,20 +21,18 @@ retention_model = joblib.load(RETENTION_MODEL_PATH)
 df = pd.read_csv("tiktok_dataset/tiktok_dataset_cleaned.csv")
 
 # ---- Engagement Prediction ----
-engagement_features = [
-    "video_duration_sec", "verified_status", "author_ban_status",
-    "share_ratio", "comment_ratio"
-]
-df["engagement_rate"] = engagement_model.predict(df[engagement_features])
+engagement_features = load_feature_schema(ENGAGEMENT_MODEL_PATH, "engagement")["features"]
+retention_features = load_feature_schema(RETENTION_MODEL_PATH, "watch_duration")["features"]
+
+# Pack every feature column once; each model reads its own block of columns.
+feature_columns = engagement_features + retention_features
+X = df[feature_columns].to_numpy(dtype=np.float64)
+n_engagement = len(engagement_features)
+
+df["engagement_rate"] = engagement_model.predict(X[:, :n_engagement])
 
 # ---- Retention Prediction ----
-retention_features = [
-    "like_ratio", "comment_ratio", "share_ratio", "watch_ratio",
-    "title_length", "description_length",
-    "edge_intensity", "color_histogram",
-    "spectral_entropy", "audio_intensity"
-]
-df["viewer_retention"] = retention_model.predict(df[retention_features])
+df["viewer_retention"] = retention_model.predict(X[:, n_engagement:])
 
 # ---- Sentiment Score ----
 # def compute_sentiment(text):
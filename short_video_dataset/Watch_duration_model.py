@@ -1,114 +1,122 @@
-from sklearn.model_selection import KFold, cross_val_score, train_test_split
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, StackingRegressor
+from sklearn.model_selection import KFold
+from sklearn.ensemble import (
+    RandomForestRegressor, GradientBoostingRegressor, HistGradientBoostingRegressor, StackingRegressor
+)
 from sklearn.linear_model import RidgeCV
-from sklearn.metrics import make_scorer, mean_squared_error, r2_score
-import pandas as pd
-import numpy as np
 import joblib
 # import matplotlib.pyplot as plt
 
-from supabase import create_client
 from dotenv import load_dotenv
 import os
+import sys
 
-load_dotenv()
-
-# === Download Data from Supabase ===
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
-
-supabase = create_client(url, key)
-response = (
-    supabase.table("short_video_engagement")
-    .select("*")
-    .csv()
-    .execute()
-)
-
-if response.data:
-    csv_data = response.data
-    with open("short_video_engagement.csv", "w+", encoding="utf-8") as f:
-        f.write(csv_data)
-    print("Data successfully downloaded as output.csv")
-else:
-    print("Error or no data returned:", response.error)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from training.backends import training_backend
+from training.data_sync import sync_and_load
+from training.evaluation import cross_validate, fit_within_budget
+from training.feature_schema import WATCH_DURATION_FEATURES, WATCH_DURATION_TARGET, save_feature_schema
+from training.search import tuned_params
 
+load_dotenv()
 
-# Load your dataset
-df = pd.read_csv("short_video_engagement.csv")
+TABLE = "short_video_engagement"
+ARTIFACT = "short_video_stacked_model.pkl"
 
 # Feature selection
-features = [
-    "like_ratio", "comment_ratio", "share_ratio", # "watch_ratio",
-    "title_length", "description_length",
-    "edge_intensity", "color_histogram",
-    "spectral_entropy", "audio_intensity"
-]
-target = "watch_duration"  # or use "engagement_score_norm"
-
-X = df[features]
-y = df[target]
-
-# Custom RMSE scorer
-def rmse_func(y_true, y_pred):
-    return np.sqrt(mean_squared_error(y_true, y_pred))
-
-rmse_scorer = make_scorer(rmse_func, greater_is_better=False)
-r2_scorer = make_scorer(r2_score)
-
-# Define base models
-rf = RandomForestRegressor(n_estimators=100, random_state=42)
-gbr = GradientBoostingRegressor(
-    n_estimators=200,
-    learning_rate=0.05,
-    max_depth=4,
-    subsample=0.8,
-    random_state=42
-)
+features = WATCH_DURATION_FEATURES
+target = WATCH_DURATION_TARGET
+
+
+def build_model(backend=None):
+    # "exact" or "hist" trees (TRAINING_BACKEND, see training/backends.py)
+    backend = training_backend(backend)
+
+    # Define base models
+    if backend == "hist":
+        # Wide trees on half the features per split stand in for the forest
+        base_models = [
+            ('hgb_wide', HistGradientBoostingRegressor(
+                max_iter=100,
+                max_leaf_nodes=63,
+                max_features=0.5,
+                random_state=42
+            )),
+            ('hgb', HistGradientBoostingRegressor(
+                max_iter=200,
+                learning_rate=0.05,
+                max_depth=4,
+                random_state=42
+            )),
+        ]
+    else:
+        rf = RandomForestRegressor(n_estimators=100, random_state=42)
+        gbr = GradientBoostingRegressor(
+            n_estimators=200,
+            learning_rate=0.05,
+            max_depth=4,
+            subsample=0.8,
+            random_state=42
+        )
+        base_models = [('rf', rf), ('gbr', gbr)]
+
+    # Define stacking ensemble
+    model = StackingRegressor(
+        estimators=base_models,
+        final_estimator=RidgeCV()
+    )
+
+    # Hyperparameters applied by `python -m training.search watch_duration --apply`
+    return model.set_params(**tuned_params("watch_duration", backend))
+
+
+def prepare(df):
+    return df[features + [target]]
 
-# Define stacking ensemble
-stacked_model = StackingRegressor(
-    estimators=[('rf', rf), ('gbr', gbr)],
-    final_estimator=RidgeCV()
-)
 
 # ----- Cross-validation -----
-kf = KFold(n_splits=5, shuffle=True, random_state=42)
-rmse_scores = cross_val_score(stacked_model, X, y, scoring=rmse_scorer, cv=kf)
-r2_scores = cross_val_score(stacked_model, X, y, scoring=r2_scorer, cv=kf)
-
-print(" Stacked Model Cross-Validated RMSE:")
-print(f" Mean: {-rmse_scores.mean():.4f}, Std: {rmse_scores.std():.4f}")
-print(" Stacked Model Cross-Validated R²:")
-print(f" Mean: {r2_scores.mean():.4f}, Std: {r2_scores.std():.4f}")
-
-# ----- Train/test evaluation -----
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
-
-stacked_model.fit(X_train, y_train)
-y_pred = stacked_model.predict(X_test)
-
-rmse = rmse_func(y_test, y_pred)
-r2 = r2_score(y_test, y_pred)
-
-print("\n Train/Test Evaluation for Stacked Model:")
-print(f"RMSE: {rmse:.4f}")
-print(f"R² Score: {r2:.4f}")
-
-# ----- Save model -----
-joblib.dump(stacked_model, "short_video_stacked_model.pkl")
-print("\nStacked model saved as 'short_video_stacked_model.pkl'")
-
-# ----- Optional: Feature correlation check -----
-corr = df[features + [target]].corr()[target].sort_values(ascending=False)
-print("\nFeature Correlation with Target:")
-print(corr)
-
-# # ----- Optional: Plot Target Distribution -----
-# plt.hist(y, bins=50)
-# plt.title("Distribution of Target: Watch Duration")
-# plt.xlabel("Watch Duration")
-# plt.ylabel("Frequency")
-# plt.show()
+def evaluate(df, n_jobs=None):
+    # Each fold is fitted once, folds run in parallel, and every metric comes
+    # from the same out-of-fold predictions.
+    kf = KFold(n_splits=5, shuffle=True, random_state=42)
+    evaluation = cross_validate(build_model(), df[features], df[target], kf, n_jobs=n_jobs)
+    evaluation.print_report("Stacked Model")
+    return evaluation
+
+
+# ----- Final fit -----
+def train(df, artifact=ARTIFACT, n_jobs=None):
+    # The out-of-fold evaluation is the held-out report, so the saved model
+    # is trained on every row.
+    stacked_model = fit_within_budget(build_model(), df[features], df[target], n_jobs=n_jobs)
+    joblib.dump(stacked_model, artifact)
+    save_feature_schema(artifact, "watch_duration")
+    return stacked_model
+
+
+def main():
+    # Load your dataset
+    # Syncs new rows from Supabase into the local Parquet cache, then reads it.
+    df = prepare(sync_and_load(TABLE, features + [target]))
+
+    evaluation = evaluate(df)
+
+    # ----- Save model -----
+    train(df)
+    evaluation.save(ARTIFACT)
+    print(f"\nStacked model saved as '{ARTIFACT}'")
+
+    # ----- Optional: Feature correlation check -----
+    corr = df[features + [target]].corr()[target].sort_values(ascending=False)
+    print("\nFeature Correlation with Target:")
+    print(corr)
+
+    # # ----- Optional: Plot Target Distribution -----
+    # plt.hist(df[target], bins=50)
+    # plt.title("Distribution of Target: Watch Duration")
+    # plt.xlabel("Watch Duration")
+    # plt.ylabel("Frequency")
+    # plt.show()
+
+
+if __name__ == "__main__":
+    main()
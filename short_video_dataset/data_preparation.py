@@ -1,34 +1,56 @@
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
+import os
+import sys
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from training.preparation import RunningMinMax, iter_csv, ratio, write_csv
 
-# Load dataset
-df = pd.read_csv("multimodal_dataset.csv")  # Update with actual filename
 
-scaler = MinMaxScaler()
+RAW_CSV = "multimodal_dataset.csv"  # Update with actual filename
+OUTPUT_CSV = "short_video_engagement.csv"
+REQUIRED = ["views", "likes", "comments", "shares", "watch_duration", "engagement_score"]
 
-# Drop rows with missing critical values
-df = df.dropna(subset=[
-    "views", "likes", "comments", "shares", "watch_duration", "engagement_score"
-])
 
-# Avoid divide-by-zero
-df = df[df["views"] > 0]
+def clean(chunk):
+    # Drop rows with missing critical values
+    chunk = chunk.dropna(subset=REQUIRED)
 
-# Normalized engagement ratios
-df["like_ratio"] = df["likes"] / df["views"]
-df["comment_ratio"] = df["comments"] / df["views"]
-df["share_ratio"] = df["shares"] / df["views"]
-df["watch_ratio"] = df["watch_duration"] / df["views"]
-df["engagement_score_continuous"] = (
-    df["likes"] +
-    df["shares"] +
-    df["comments"]
-) / df["views"] + (df["watch_duration"] / df["views"])
-# This gives (engagements per view) + (average watch time per view)
+    # Avoid divide-by-zero
+    chunk = chunk[chunk["views"].to_numpy() > 0].copy()
 
-df["engagement_score_norm"] = scaler.fit_transform(
-    df[["engagement_score_continuous"]]
-)
+    views = chunk["views"].to_numpy()
+    # Normalized engagement ratios
+    chunk["like_ratio"] = ratio(chunk["likes"], views)
+    chunk["comment_ratio"] = ratio(chunk["comments"], views)
+    chunk["share_ratio"] = ratio(chunk["shares"], views)
+    chunk["watch_ratio"] = ratio(chunk["watch_duration"], views)
+    chunk["engagement_score_continuous"] = ratio(
+        chunk["likes"].to_numpy() +
+        chunk["shares"].to_numpy() +
+        chunk["comments"].to_numpy(),
+        views
+    ) + chunk["watch_ratio"].to_numpy()
+    # This gives (engagements per view) + (average watch time per view)
+    return chunk
 
-df.to_csv("short_video_engagement.csv", index=False)
+
+def chunks():
+    # Critical columns are read as floats in every chunk, so the output does
+    # not depend on which chunks happen to hold missing values.
+    return (clean(chunk) for chunk in iter_csv(RAW_CSV, dtype={column: "float64" for column in REQUIRED}))
+
+
+# Pass 1: min/max of the score over the whole file, for engagement_score_norm
+score_range = RunningMinMax()
+for chunk in chunks():
+    score_range.update(chunk["engagement_score_continuous"])
+
+
+# Pass 2: add the normalized score and write each chunk as it is ready
+def normalized():
+    for chunk in chunks():
+        chunk["engagement_score_norm"] = score_range.transform(chunk["engagement_score_continuous"])
+        yield chunk
+
+
+rows = write_csv(normalized(), OUTPUT_CSV)
+print(f"Wrote {rows} rows to {OUTPUT_CSV}")
@@ -1,13 +1,27 @@
+import argparse
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import joblib
 import shap
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.inspection import permutation_importance
-from sklearn.metrics import mean_squared_error, r2_score
 import numpy as np
 
+from training.explainability import ROWS, path_contributions, permutation_importance, stratified_sample
+from training.feature_schema import load_feature_schema
+
+parser = argparse.ArgumentParser(description="Feature attributions and permutation importance of the watch duration model.")
+parser.add_argument("--rows", type=int, default=ROWS, help="stratified sample size; widen it if the intervals are too wide")
+parser.add_argument("--shap-rows", type=int, default=1000, help="rows shown in the SHAP summary plot")
+parser.add_argument("--repeats", type=int, default=10)
+parser.add_argument("--jobs", type=int, default=None, help="CPUs to use (default: TRAINING_CPUS or all)")
+parser.add_argument("--no-cache", action="store_true", help="recompute instead of reusing .explain_cache/")
+args = parser.parse_args()
+
 # -----------------------------
 # Load Model and Data
 # -----------------------------
@@ -16,28 +30,30 @@ model_path = os.path.join(base_dir, "short_video_stacked_model.pkl")
 data_path = os.path.join(base_dir, "short_video_engagement.csv")
 
 model = joblib.load(model_path)
-df = pd.read_csv(data_path)
 
 # -----------------------------
 # Define Features
 # -----------------------------
-features = [
-    "like_ratio", "comment_ratio", "share_ratio", #"watch_ratio",
-    "title_length", "description_length",
-    "edge_intensity", "color_histogram",
-    "spectral_entropy", "audio_intensity"
-]
+schema = load_feature_schema(model_path, "watch_duration")
+features = schema["features"]
 
-X = df[features]
-y = df["watch_duration"]
+df = pd.read_csv(data_path, usecols=features + [schema["target"]]).dropna(subset=[schema["target"]])
+sample = df.iloc[stratified_sample(df[schema["target"]], args.rows)]
 
-X_sample = X.sample(100, random_state=42)
+X = sample[features]
+y = sample[schema["target"]]
+
+X_sample = X.iloc[stratified_sample(y, args.shap_rows, seed=0)]
 
 # -----------------------------
 # SHAP Explanation
 # -----------------------------
-explainer = shap.Explainer(model.predict, X_sample)
-shap_values = explainer(X_sample)
+# Exact per-feature contributions along the stack's decision paths and
+# linear terms, in place of a model-agnostic explainer's sampled predictions.
+base_values, contributions = path_contributions(model, X_sample)
+shap_values = shap.Explanation(
+    values=contributions, base_values=base_values, data=X_sample.to_numpy(), feature_names=features
+)
 
 plt.figure()
 shap.summary_plot(shap_values, X_sample, show=False)
@@ -47,15 +63,17 @@ plt.savefig("shap_summary_watch_duration.png", bbox_inches="tight")
 # -----------------------------
 # Permutation Importance
 # -----------------------------
-perm_result = permutation_importance(model, X, y, scoring='r2', n_repeats=10, random_state=42)
-perm_df = pd.DataFrame({
-    'feature': features,
-    'importance': perm_result.importances_mean,
-    'std': perm_result.importances_std
-}).sort_values(by='importance', ascending=False)
+perm_df = permutation_importance(model_path, X, y, n_repeats=args.repeats, n_jobs=args.jobs, use_cache=not args.no_cache)
+print(perm_df.to_string(index=False))
 
 plt.figure(figsize=(10, 6))
-sns.barplot(data=perm_df, x="importance", y="feature", orient="h", palette="viridis")
+ax = sns.barplot(data=perm_df, x="importance", y="feature", orient="h", palette="viridis")
+# 95% intervals over rows and repeats
+ax.errorbar(
+    perm_df["importance"], range(len(perm_df)),
+    xerr=[perm_df["importance"] - perm_df["ci_low"], perm_df["ci_high"] - perm_df["importance"]],
+    fmt="none", ecolor="black", capsize=3,
+)
 plt.title("Permutation Importance (R^2 Drop) for Watch Duration")
 plt.xlabel("Importance")
 plt.tight_layout()
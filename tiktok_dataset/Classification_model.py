@@ -1,83 +1,143 @@
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.pipeline import Pipeline
+import argparse
 import joblib
-from supabase import create_client
 from dotenv import load_dotenv
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from training.centroids import (
+    centroids_path,
+    cluster_means,
+    export_centroids,
+    fit_minibatch,
+    inherit_labels,
+    load_centroids,
+    make_pipeline,
+    previous_tiers,
+    tier_labels,
+    warm_start,
+)
+from training.data_sync import iter_table, load_table, refresh
+from training.evaluation import fit_within_budget
+from training.feature_schema import CLASSIFICATION_FEATURES, save_feature_schema
+
+ARTIFACT = "tiktok_classification_pipeline.pkl"
+TABLE = "tiktok_dataset_cleaned"
+OUTPUT_CSV = "tiktok_quality_classification_pipeline.csv"
 
 load_dotenv()
 
-# === Download Data from Supabase ===
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
+# === Define Engineered Features ===
+features_engineered = CLASSIFICATION_FEATURES
 
-supabase = create_client(url, key)
-response = (
-    supabase.table("tiktok_dataset_cleaned")
-    .select("*")
-    .csv()
-    .execute()
-)
 
-if response.data:
-    csv_data = response.data
-    with open("tiktok_dataset_cleaned.csv", "w+", encoding="utf-8") as f:
-        f.write(csv_data)
-    print("Data successfully downloaded as output.csv")
-else:
-    print("Error or no data returned:", response.error)
+def prepare(df):
+    # === Drop missing values ===
+    return df.dropna(subset=features_engineered)
 
 
-# === Load Data ===
-df = pd.read_csv("tiktok_dataset_cleaned.csv")
-
-# === Define Engineered Features ===
-features_engineered = [
-    "video_duration_sec",
-    "verified_status",
-    "author_ban_status",
-    "like_ratio",
-    "share_ratio",
-    "comment_ratio",
-]
-
-# === Drop missing values ===
-df = df.dropna(subset=features_engineered).copy()
-
-
-# === Assemble Pipeline ===
-pipeline = Pipeline(
-    [("scaler", StandardScaler()), ("model", KMeans(n_clusters=3, random_state=42))]
-)
+# === Previous Model ===
+# Retrains start from the last exported centroids and keep each cluster's tier,
+# so videos do not change tier just because KMeans numbered its clusters differently.
+def load_previous(artifact=ARTIFACT, fresh=False):
+    previous = None if fresh else load_centroids(centroids_path(artifact))
+    if previous is not None and previous["features"] != list(features_engineered):
+        print("Previous centroids were trained on other features, starting fresh.")
+        previous = None
+    return previous
 
 
 # === Train Pipeline ===
-X = df[features_engineered]
-pipeline.fit(X)
-clusters = pipeline.predict(X)
-df["cluster"] = clusters
+def fit(df, previous=None, n_jobs=None):
+    X = df[features_engineered]
+    pipeline = make_pipeline(3)
+    if previous is not None:
+        pipeline.named_steps["scaler"].fit(X)
+        init = warm_start(previous, pipeline.named_steps["scaler"], features_engineered)
+        pipeline.set_params(model__init=init, model__n_init=1)
+    return fit_within_budget(pipeline, X, n_jobs=n_jobs)
 
-# === Determine Quality Labels ===
-cluster_means = df.groupby("cluster")[
-    ["like_ratio", "share_ratio", "comment_ratio"]
-].mean()
-sorted_clusters = cluster_means.mean(axis=1).sort_values().index.tolist()
 
-quality_map = {
-    sorted_clusters[0]: "Low Quality",
-    sorted_clusters[1]: "Medium Quality",
-    sorted_clusters[2]: "High Quality",
-}
+# === Determine Quality Labels ===
+def assign_tiers(pipeline, chunks, previous=None):
+    sorted_labels = tier_labels(cluster_means(pipeline, chunks(), features_engineered))
+    if previous is None:
+        quality_map = sorted_labels
+    else:
+        quality_map = inherit_labels(pipeline, previous)
+        if quality_map != sorted_labels:
+            print("Warning: cluster engagement ranking changed since the last model; keeping the "
+                  f"previous tiers {quality_map} over {sorted_labels} (use --fresh to re-rank).")
+    print("Cluster tiers:", quality_map)
+    return quality_map
 
-df["quality_label"] = df["cluster"].map(quality_map)
 
 # === Save to CSV ===
-df.to_csv("tiktok_quality_classification_pipeline.csv", index=False)
-print("Classification results saved to 'tiktok_quality_classification.csv'.")
-
-
-# === Pickle K-Means Pipeline ===
-with open("tiktok_classification_pipeline.pkl", "wb") as f:
-    joblib.dump(pipeline, f, protocol=5)
+def write_labels(pipeline, quality_map, chunks, previous=None, output_csv=OUTPUT_CSV):
+    changed = rows = 0
+    for i, chunk in enumerate(chunks()):
+        chunk = chunk.copy()
+        chunk["cluster"] = pipeline.predict(chunk[features_engineered])
+        chunk["quality_label"] = chunk["cluster"].map(quality_map)
+        if previous is not None:
+            changed += int((chunk["quality_label"].to_numpy() != previous_tiers(previous, chunk[features_engineered])).sum())
+        rows += len(chunk)
+        chunk.to_csv(output_csv, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    print(f"Classification results saved to '{output_csv}'.")
+    if previous is not None:
+        print(f"{changed} of {rows} videos ({changed / max(rows, 1):.2%}) changed tier since the last model.")
+
+
+# === Pickle K-Means Pipeline and Export Centroids for Serving ===
+def save(pipeline, quality_map, artifact=ARTIFACT):
+    with open(artifact, "wb") as f:
+        joblib.dump(pipeline, f, protocol=5)
+    save_feature_schema(artifact, "classification")
+    print("Centroids exported to", export_centroids(artifact, pipeline, quality_map, features_engineered))
+
+
+def train(df, artifact=ARTIFACT, previous=None, n_jobs=None):
+    """Fit on an in-memory table and save the pipeline and its centroid export."""
+    pipeline = fit(df, previous, n_jobs)
+    quality_map = assign_tiers(pipeline, lambda: [df], previous)
+    save(pipeline, quality_map, artifact)
+    return pipeline, quality_map
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the quality-tier KMeans classifier.")
+    parser.add_argument("--mode", choices=["full", "minibatch"], default="full",
+                        help="minibatch streams the cached table in chunks for data larger than memory")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--fresh", action="store_true",
+                        help="ignore the previous centroid export (no warm start, tiers re-ranked)")
+    args = parser.parse_args()
+
+    # === Sync Data from Supabase ===
+    # New rows are appended to the local Parquet cache; both modes read from it.
+    refresh(TABLE)
+
+    previous = load_previous(ARTIFACT, args.fresh)
+    if args.mode == "minibatch":
+        def chunks():
+            for chunk in iter_table(TABLE, batch_size=args.chunksize):
+                yield prepare(chunk)
+
+        pipeline = fit_minibatch(
+            chunks, features_engineered, 3, args.epochs, min(args.chunksize, 4096), previous=previous
+        )
+    else:
+        df = prepare(load_table(TABLE)).copy()
+        pipeline = fit(df, previous)
+
+        def chunks():
+            return [df]
+
+    quality_map = assign_tiers(pipeline, chunks, previous)
+    write_labels(pipeline, quality_map, chunks, previous)
+    save(pipeline, quality_map)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,89 +1,86 @@
-
-import pandas as pd
-from supabase import create_client, Client
 from dotenv import load_dotenv
+import logging
 import os
+import sys
 import numpy as np
 
-# Load CSV
-df = pd.read_csv("tiktok_dataset.csv")  
-
-# Drop unneeded columns
-df = df.drop(columns=["#", "video_id", "video_transcription_text", "claim_status"])
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from training.bulk_upload import upsert_csv_file
+from training.preparation import iter_csv, ratio, write_csv
 
-# Handle missing values
-df = df.dropna(subset=[
-    "video_view_count", "video_like_count", "video_share_count",
-    "video_download_count", "video_comment_count"
-])
-
-# Convert verified_status to binary
-df["verified_status"] = df["verified_status"].map({
-    "verified": 1,
-    "not verified": 0
-})
-
-# Convert author_ban_status to ordinal
-df["author_ban_status"] = df["author_ban_status"].map({
-    "active": 2,
-    "under scrutiny": 1,
-    "banned": 0
-})
-
-# Avoid divide-by-zero errors
-df = df[df["video_view_count"] > 0]
-
-# Compute new features
-df["engagement_rate"] = (
-    df["video_like_count"] +
-    df["video_share_count"] +
-    df["video_download_count"] +
-    df["video_comment_count"]
-) / df["video_view_count"]
-
-df["like_ratio"] = df["video_like_count"] / df["video_view_count"]
-df["share_ratio"] = df["video_share_count"] / df["video_view_count"]
-df["comment_ratio"] = df["video_comment_count"] / df["video_view_count"]
-
-# show sample
-# print(df[[
-#     "engagement_rate", "like_ratio", "share_ratio", "comment_ratio"
-# ]].head())
-
-df.to_csv('tiktok_dataset_cleaned.csv', index=False)
-
-# Credentials
-load_dotenv()
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
-# print("URL:", os.getenv("SUPABASE_URL"))
-# print("KEY:", os.getenv("SUPABASE_KEY"))
+RAW_CSV = "tiktok_dataset.csv"
+OUTPUT_CSV = "tiktok_dataset_cleaned.csv"
 
-supabase: Client = create_client(url, key)
-
-# Convert count columns to integers to match Supabase schema
 count_cols = [
     "video_view_count", "video_like_count", "video_share_count",
     "video_download_count", "video_comment_count"
 ]
 
-for col in count_cols:
-    df[col] = df[col].astype(int)
-
-# Clean bad float values
-df.replace([np.inf, -np.inf], np.nan, inplace=True)
-df.dropna(inplace=True)
 
-# Upload rows in chunks
-chunk_size = 500
-table_name = "tiktok_dataset_cleaned"
+def prepare(chunk):
+    # Handle missing values
+    chunk = chunk.dropna(subset=count_cols)
+
+    # Avoid divide-by-zero errors
+    chunk = chunk[chunk["video_view_count"].to_numpy() > 0].copy()
+
+    # Convert verified_status to binary
+    chunk["verified_status"] = chunk["verified_status"].map({
+        "verified": 1,
+        "not verified": 0
+    })
+
+    # Convert author_ban_status to ordinal
+    chunk["author_ban_status"] = chunk["author_ban_status"].map({
+        "active": 2,
+        "under scrutiny": 1,
+        "banned": 0
+    })
+
+    # Compute new features
+    views = chunk["video_view_count"].to_numpy()
+    chunk["engagement_rate"] = ratio(
+        chunk["video_like_count"].to_numpy() +
+        chunk["video_share_count"].to_numpy() +
+        chunk["video_download_count"].to_numpy() +
+        chunk["video_comment_count"].to_numpy(),
+        views
+    )
+
+    chunk["like_ratio"] = ratio(chunk["video_like_count"], views)
+    chunk["share_ratio"] = ratio(chunk["video_share_count"], views)
+    chunk["comment_ratio"] = ratio(chunk["video_comment_count"], views)
+    return chunk
+
+
+def for_upload(chunk):
+    # Convert count columns to integers to match Supabase schema
+    for col in count_cols:
+        chunk[col] = chunk[col].astype(int)
+
+    # Clean bad float values
+    chunk = chunk.replace([np.inf, -np.inf], np.nan)
+    return chunk.dropna()
+
+
+# Load the raw CSV a chunk at a time, dropping unneeded columns as it is read
+# (video_id is kept as the upload key). Count columns are read as floats in
+# every chunk, so the output does not depend on where the missing values are.
+chunks = iter_csv(
+    RAW_CSV,
+    usecols=lambda column: column not in {"#", "video_transcription_text", "claim_status"},
+    dtype={col: "float64" for col in count_cols},
+)
+rows = write_csv((prepare(chunk) for chunk in chunks), OUTPUT_CSV)
+print(f"Wrote {rows} rows to {OUTPUT_CSV}")
 
-for start in range(0, len(df), chunk_size):
-    chunk = df.iloc[start:start+chunk_size]
-    data = chunk.to_dict(orient="records")
-    response = supabase.table(table_name).insert(data).execute()
-    if response.data:
-        print(f"Inserted rows {start} to {start+len(data)}")
-    else:
-        print(f"Failed to insert rows {start} to {start+len(data)} → Error: {response.error}")
+# Credentials
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
 
+# Upload rows: concurrent upserts keyed on video_id, streamed from the cleaned
+# CSV, so a rerun after a failure resumes from tiktok_dataset_cleaned.upload.json
+# and never duplicates rows
+table_name = "tiktok_dataset_cleaned"
+uploaded = upsert_csv_file(OUTPUT_CSV, table_name, key="video_id", transform=for_upload)
+print(f"Upserted {uploaded} rows into {table_name}")
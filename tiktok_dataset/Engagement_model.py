@@ -1,129 +1,128 @@
-import pandas as pd
-import numpy as np
 #import matplotlib.pyplot as plt
 import joblib
 
-from sklearn.model_selection import train_test_split, KFold, cross_val_score
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, StackingRegressor
+from sklearn.model_selection import KFold
+from sklearn.ensemble import (
+    RandomForestRegressor, GradientBoostingRegressor, HistGradientBoostingRegressor, StackingRegressor
+)
 from sklearn.linear_model import Ridge
 from sklearn.svm import SVR
 from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_squared_error, r2_score, make_scorer
 from sklearn.impute import SimpleImputer
-from sklearn.pipeline import make_pipeline
 
-from supabase import create_client
 from dotenv import load_dotenv
 import os
+import sys
 
-load_dotenv()
-
-# === Download Data from Supabase ===
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
-
-supabase = create_client(url, key)
-response = (
-    supabase.table("tiktok_dataset_cleaned")
-    .select("*")
-    .csv()
-    .execute()
-)
-
-if response.data:
-    csv_data = response.data
-    with open("tiktok_dataset_cleaned.csv", "w+", encoding="utf-8") as f:
-        f.write(csv_data)
-    print("Data successfully downloaded as output.csv")
-else:
-    print("Error or no data returned:", response.error)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from training.backends import training_backend
+from training.data_sync import sync_and_load
+from training.evaluation import cross_validate, fit_within_budget
+from training.feature_schema import ENGAGEMENT_FEATURES, ENGAGEMENT_TARGET, save_feature_schema
+from training.search import tuned_params
 
+load_dotenv()
 
-# ----- 1. Load Dataset -----
-df = pd.read_csv("tiktok_dataset_cleaned.csv")
+TABLE = "tiktok_dataset_cleaned"
+ARTIFACT = "tiktok_engagement_stacked_model.pkl"
 
 # ----- 2. Select Features and Target -----
-features = [
-    "video_duration_sec", "verified_status", "author_ban_status",
-    # "like_ratio", # Can be added back in if necessary
-    "share_ratio", "comment_ratio"
-]
-target = "engagement_rate"
+features = ENGAGEMENT_FEATURES
+target = ENGAGEMENT_TARGET
 
-X = df[features]
-y = df[target]
 
 # ----- 3. Define Ensemble Model -----
-# Imputer that fills NaNs with mean (or median)
-imputer = SimpleImputer(strategy='mean')
+def build_model(backend=None):
+    # "exact" or "hist" trees (TRAINING_BACKEND, see training/backends.py)
+    backend = training_backend(backend)
 
-estimators = [
-    ("rf", make_pipeline(imputer, RandomForestRegressor(n_estimators=100, random_state=42))),
-    ("svr", make_pipeline(imputer, StandardScaler(), SVR(C=1.0, epsilon=0.2))),
-    ("ridge", make_pipeline(imputer, StandardScaler(), Ridge(alpha=1.0)))
-]
-# Pipelines for models that require scaling
+    # Imputer that fills NaNs with mean (or median)
+    imputer = SimpleImputer(strategy='mean')
 
+    if backend == "hist":
+        # Binned boosting handles NaNs itself, so it needs no imputer
+        trees = ("hgb", HistGradientBoostingRegressor(max_iter=200, random_state=42))
+        final_estimator = HistGradientBoostingRegressor(max_iter=100, max_depth=3, random_state=42)
+    else:
+        trees = ("rf", make_pipeline(imputer, RandomForestRegressor(n_estimators=100, random_state=42)))
+        final_estimator = GradientBoostingRegressor(n_estimators=100, random_state=42)
 
-final_estimator = GradientBoostingRegressor(n_estimators=100, random_state=42)
+    # Pipelines for models that require scaling
+    estimators = [
+        trees,
+        ("svr", make_pipeline(imputer, StandardScaler(), SVR(C=1.0, epsilon=0.2))),
+        ("ridge", make_pipeline(imputer, StandardScaler(), Ridge(alpha=1.0)))
+    ]
 
-stacked_model = StackingRegressor(
-    estimators=estimators,
-    final_estimator=final_estimator,
-    n_jobs=-1
-)
+    model = StackingRegressor(
+        estimators=estimators,
+        final_estimator=final_estimator,
+        n_jobs=-1
+    )
 
-# ----- 4. Cross-Validation -----
-kf = KFold(n_splits=5, shuffle=True, random_state=42)
-rmse_scorer = make_scorer(mean_squared_error, greater_is_better=False)
-r2_scorer = make_scorer(r2_score)
+    # Hyperparameters applied by `python -m training.search engagement --apply`
+    return model.set_params(**tuned_params("engagement", backend))
 
-rmse_scores = cross_val_score(stacked_model, X, y, cv=kf, scoring=rmse_scorer)
-r2_scores = cross_val_score(stacked_model, X, y, cv=kf, scoring=r2_scorer)
 
-print("Cross-Validated RMSE:")
-print(f" Mean: {abs(rmse_scores.mean()):.4f}, Std: {rmse_scores.std():.4f}")
-print("Cross-Validated R²:")
-print(f" Mean: {r2_scores.mean():.4f}, Std: {r2_scores.std():.4f}")
+def prepare(df):
+    return df[features + [target]]
 
-# ----- 5. Train/Test Split Evaluation -----
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
 
-stacked_model.fit(X_train, y_train)
-y_pred = stacked_model.predict(X_test)
-
-rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-r2 = r2_score(y_test, y_pred)
-
-print("\n Train/Test Evaluation:")
-print(f" RMSE: {rmse:.4f}")
-print(f" R² Score: {r2:.4f}")
-
-# # ----- 6. Engagement Rate Distribution -----
-# plt.hist(y, bins=50)
-# plt.title("Engagement Rate Distribution")
-# plt.xlabel("Engagement Rate")
-# plt.ylabel("Frequency")
-# plt.tight_layout()
-# plt.show()
-
-# # ----- 7. Residuals Distribution -----
-# residuals = y_test - y_pred
-# plt.hist(residuals, bins=50, color="orange")
-# plt.title("Residuals Distribution")
-# plt.xlabel("Residual")
-# plt.ylabel("Frequency")
-# plt.tight_layout()
-# plt.show()
-
-# ----- 8. Correlation -----
-corr = df[features + [target]].corr()[target].sort_values(ascending=False)
-print("\nFeature Correlation with Engagement Rate:")
-print(corr)
-
-# ----- 9. Save Model -----
-joblib.dump(stacked_model, "tiktok_engagement_stacked_model.pkl")
-print("\nEnsemble model saved as 'tiktok_engagement_stacked_model.pkl'")
+# ----- 4. Cross-Validation -----
+def evaluate(df, n_jobs=None):
+    # Each fold is fitted once, folds run in parallel, and every metric comes
+    # from the same out-of-fold predictions.
+    kf = KFold(n_splits=5, shuffle=True, random_state=42)
+    evaluation = cross_validate(build_model(), df[features], df[target], kf, n_jobs=n_jobs)
+    evaluation.print_report("Stacked Model")
+    return evaluation
+
+
+# ----- 5. Final Fit -----
+def train(df, artifact=ARTIFACT, n_jobs=None):
+    # The out-of-fold evaluation is the held-out report, so the saved model
+    # is trained on every row.
+    stacked_model = fit_within_budget(build_model(), df[features], df[target], n_jobs=n_jobs)
+    joblib.dump(stacked_model, artifact)
+    save_feature_schema(artifact, "engagement")
+    return stacked_model
+
+
+def main():
+    # ----- 1. Load Dataset -----
+    # Syncs new rows from Supabase into the local Parquet cache, then reads it.
+    df = prepare(sync_and_load(TABLE, features + [target]))
+
+    evaluation = evaluate(df)
+    train(df)
+
+    # # ----- 6. Engagement Rate Distribution -----
+    # plt.hist(df[target], bins=50)
+    # plt.title("Engagement Rate Distribution")
+    # plt.xlabel("Engagement Rate")
+    # plt.ylabel("Frequency")
+    # plt.tight_layout()
+    # plt.show()
+
+    # # ----- 7. Residuals Distribution -----
+    # residuals = evaluation.y_true - evaluation.y_pred
+    # plt.hist(residuals, bins=50, color="orange")
+    # plt.title("Residuals Distribution")
+    # plt.xlabel("Residual")
+    # plt.ylabel("Frequency")
+    # plt.tight_layout()
+    # plt.show()
+
+    # ----- 8. Correlation -----
+    corr = df[features + [target]].corr()[target].sort_values(ascending=False)
+    print("\nFeature Correlation with Engagement Rate:")
+    print(corr)
+
+    # ----- 9. Save Evaluation -----
+    evaluation.save(ARTIFACT)
+    print(f"\nEnsemble model saved as '{ARTIFACT}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,22 @@
+import argparse
 import os
-import joblib
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.inspection import permutation_importance
+
+from training.explainability import ROWS, permutation_importance, stratified_sample
+from training.feature_schema import load_feature_schema
+
+parser = argparse.ArgumentParser(description="Permutation importance of the engagement model.")
+parser.add_argument("--rows", type=int, default=ROWS, help="stratified sample size; widen it if the intervals are too wide")
+parser.add_argument("--repeats", type=int, default=10)
+parser.add_argument("--jobs", type=int, default=None, help="CPUs to use (default: TRAINING_CPUS or all)")
+parser.add_argument("--no-cache", action="store_true", help="recompute instead of reusing .explain_cache/")
+args = parser.parse_args()
 
 # -------------------------
 # Load model and data
@@ -12,41 +25,40 @@ base_dir = os.path.dirname(__file__)
 model_path = os.path.join(base_dir, "tiktok_engagement_stacked_model.pkl")
 data_path = os.path.join(base_dir, "tiktok_dataset_cleaned.csv")
 
-model = joblib.load(model_path)
-df = pd.read_csv(data_path)
-
 # -------------------------
 # Define features and target
 # -------------------------
-features = [
-    "video_duration_sec",
-    "verified_status",
-    "author_ban_status",
-    #"like_ratio",
-    "share_ratio",
-    "comment_ratio"
- 
-]
+schema = load_feature_schema(model_path, "engagement")
+features = schema["features"]
 
+df = pd.read_csv(data_path, usecols=features + [schema["target"]]).dropna(subset=[schema["target"]])
+sample = df.iloc[stratified_sample(df[schema["target"]], args.rows)]
 
-X = df[features]
-y = df["engagement_rate"]
+X = sample[features]
+y = sample[schema["target"]]
 
-print(X.shape)
-print(y.shape)
+print(f"{len(sample)} of {len(df)} rows, stratified on {schema['target']}")
 
 # -------------------------
 # Compute permutation importance
 # -------------------------
 print("Computing permutation importances...")
-result = permutation_importance(model, X, y, n_repeats=10, random_state=42, n_jobs=-1)
-importances = pd.Series(result.importances_mean, index=features).sort_values(ascending=True)
+result = permutation_importance(model_path, X, y, n_repeats=args.repeats, n_jobs=args.jobs, use_cache=not args.no_cache)
+print(result.to_string(index=False))
+result = result.sort_values("importance", ascending=True)
+importances = pd.Series(result["importance"].to_numpy(), index=result["feature"])
 
 # -------------------------
 # Plot setup
 # -------------------------
 plt.figure(figsize=(10, 6))
 ax = sns.barplot(x=importances.values, y=importances.index, palette="Blues_r")
+# 95% intervals over rows and repeats
+ax.errorbar(
+    importances.values, range(len(importances)),
+    xerr=[importances.values - result["ci_low"].to_numpy(), result["ci_high"].to_numpy() - importances.values],
+    fmt="none", ecolor="black", capsize=3,
+)
 
 # -------------------------
 # Threshold interpretation
@@ -65,7 +77,7 @@ for i, (feature, score) in enumerate(importances.items()):
         level = "Low"
         color = "gray"
     
-    ax.text(score + 0.001, i, f"{level} impact", va="center", fontsize=10, color=color)
+    ax.text(result["ci_high"].iloc[i] + 0.001, i, f"{level} impact", va="center", fontsize=10, color=color)
 
 # -------------------------
 # Add threshold lines
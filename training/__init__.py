@@ -0,0 +1 @@
+"""Shared helpers for the training scripts in tiktok_dataset/ and short_video_dataset/."""
@@ -0,0 +1,22 @@
+"""Tree backends of the stacked regressors.
+
+"exact" is the original configuration: RandomForest and GradientBoosting
+members that sort every candidate split, behind a mean imputer. "hist" swaps
+them for HistGradientBoostingRegressor, which bins each feature into at most
+255 buckets once, routes missing values itself (no imputer) and trains on all
+cores, so its fit time grows about linearly with rows. Both are ordinary
+sklearn estimators, so either artifact loads in the backend.
+
+The training scripts use TRAINING_BACKEND (default: exact) unless
+build_model() is given a backend.
+"""
+import os
+
+BACKENDS = ("exact", "hist")
+
+
+def training_backend(backend=None):
+    backend = backend or os.getenv("TRAINING_BACKEND", "exact")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown training backend {backend!r}, expected one of {BACKENDS}")
+    return backend
@@ -0,0 +1,103 @@
+"""Compare the exact and hist tree backends at growing training set sizes.
+
+    python -m training.bench_backends engagement --sizes 10000 100000 1000000
+    python -m training.bench_backends watch_duration --no-sync --output bench.json
+
+A fixed 20% of the cached feature table is held out for scoring. For every
+size, each backend's stack is fitted on that many rows of the rest, drawn
+with replacement once the size exceeds the table (those rows are marked
+"resampled": timings stay meaningful, accuracy less so). Reported per run:
+fit seconds on all --jobs CPUs, held-out RMSE/MAE/R², and prediction latency
+for 1 and 1000 rows with sklearn and with the backend's compiled engine
+(backend/src/tree_engine.py), after checking that the compiled model agrees
+with sklearn, i.e. that the artifact stays servable by ScoringManager.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from joblib import parallel_config
+from sklearn.model_selection import train_test_split
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, "backend", "src"))
+from training.backends import BACKENDS
+from training.distill import predict_ms
+from training.evaluation import LABELS, METRICS, cpu_budget, set_n_jobs
+from tree_engine import compile_model, probe_matrix, verify_compiled
+
+SIZES = (10_000, 100_000, 1_000_000)
+
+
+def bench(script, df, sizes=SIZES, backends=BACKENDS, n_jobs=None, seed=42):
+    n_jobs = cpu_budget(n_jobs)
+    X = df[script.features].to_numpy(dtype=np.float64)
+    y = df[script.target].to_numpy(dtype=np.float64)
+    X_pool, X_test, y_pool, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for size in sizes:
+        resampled = size > len(X_pool)
+        picked = rng.choice(len(X_pool), size, replace=resampled)
+        for backend in backends:
+            model = set_n_jobs(script.build_model(backend), n_jobs)
+            started = time.perf_counter()
+            with parallel_config(n_jobs=n_jobs):
+                model.fit(X_pool[picked], y_pool[picked])
+            fit_seconds = time.perf_counter() - started
+
+            y_pred = model.predict(X_test)
+            compiled = compile_model(model)
+            verify_compiled(compiled, model, probe_matrix(compiled, X.shape[1]))
+            rows.append({
+                "size": size,
+                "backend": backend,
+                "resampled": resampled,
+                "fit_seconds": fit_seconds,
+                **{metric: score(y_test, y_pred) for metric, score in METRICS.items()},
+                "sklearn_ms_1": predict_ms(model, X_test[:1]),
+                "sklearn_ms_1000": predict_ms(model, X_test[:1000], repeats=5),
+                "compiled_ms_1": predict_ms(compiled, X_test[:1]),
+                "compiled_ms_1000": predict_ms(compiled, X_test[:1000], repeats=5),
+            })
+            print_row(rows[-1], flush=True)
+    return rows
+
+
+def print_row(row, flush=False):
+    scores = " ".join(f"{row[metric]:>8.4f}" for metric in METRICS)
+    print(f"{row['size']:>9}{'*' if row['resampled'] else ' '} {row['backend']:<6} {row['fit_seconds']:>8.1f} {scores} "
+          f"{row['sklearn_ms_1']:>9.2f} {row['compiled_ms_1']:>9.2f} {row['sklearn_ms_1000']:>9.1f} "
+          f"{row['compiled_ms_1000']:>9.1f}", flush=flush)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from training.pipeline import DEFAULT_CACHE_DIR, load_features, load_script
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Fit time, latency and accuracy of each tree backend by data size.")
+    parser.add_argument("model", choices=["engagement", "watch_duration"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--jobs", type=int, default=None, help="CPUs to use (default: TRAINING_CPUS or all)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--no-sync", action="store_true", help="use the local data cache as it is")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    script = load_script(args.model)
+    df = load_features(args.model, args.cache_dir, args.no_sync).dropna(subset=[script.target])
+    print(f"{'rows':>10} {'trees':<6} {'fit s':>8} " + " ".join(f"{LABELS[m]:>8}" for m in METRICS)
+          + f" {'ms/row':>9} {'(comp.)':>9} {'ms/1000':>9} {'(comp.)':>9}")
+    rows = bench(script, df, args.sizes, args.backends, args.jobs)
+    if any(row["resampled"] for row in rows):
+        print(f"* more rows than the {len(df)} cached: drawn with replacement")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "rows": len(df), "results": rows}, f, indent=2)
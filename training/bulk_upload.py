@@ -0,0 +1,287 @@
+"""Concurrent, resumable upserts of a DataFrame into a Supabase table.
+
+    upsert_frame(df, "tiktok_dataset_cleaned", key="video_id")
+    upsert_csv_file("tiktok_dataset_cleaned.csv", "tiktok_dataset_cleaned", transform=clean)
+
+Rows are sent as JSON arrays to the REST API (PostgREST) with
+`on_conflict=<key>` and `Prefer: resolution=merge-duplicates`, so sending a
+chunk twice leaves the table as if it was sent once. Up to `concurrency`
+chunks are in flight at a time. Chunk size adapts to the server: it grows
+while requests finish well within TARGET_SECONDS, shrinks when they take
+longer, and a chunk the server rejects as too large (413) is split in half.
+Transient failures are retried with backoff (data_sync.request_with_retry).
+
+Finished row ranges are recorded in a checkpoint file; a run that stops part
+way (crash, Ctrl-C, retries exhausted) resumes from it when started again on
+the same data. The checkpoint is removed once every row is uploaded.
+"""
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+import pandas as pd
+
+from training.data_sync import request_with_retry
+
+CHUNK_SIZE = 500
+MIN_CHUNK_SIZE = 50
+MAX_CHUNK_SIZE = 5000
+CONCURRENCY = 8
+TARGET_SECONDS = 2.0
+# Rows read from a CSV at a time by upsert_csv().
+READ_ROWS = 100_000
+
+
+def fingerprint(df):
+    """Hash of the frame's contents, so a checkpoint only resumes the same data."""
+    digest = hashlib.sha1(",".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(done, total):
+    """The [start, end) row ranges of 0..total not covered by `done`."""
+    gaps, position = [], 0
+    for start, end in merge_ranges(done):
+        if start > position:
+            gaps.append((position, start))
+        position = max(position, end)
+    if position < total:
+        gaps.append((position, total))
+    return gaps
+
+
+class Checkpoint:
+    """Row ranges already uploaded, kept in a JSON file that is replaced
+    atomically after every chunk."""
+
+    def __init__(self, path, table, fingerprint):
+        self.path = path
+        self.state = {"table": table, "fingerprint": fingerprint, "done": []}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if (saved.get("table"), saved.get("fingerprint")) == (table, fingerprint):
+                self.state = saved
+            else:
+                logging.warning("Ignoring %s: it was written for other data", path)
+
+    @property
+    def done(self):
+        return [tuple(r) for r in self.state["done"]]
+
+    def add(self, start, end):
+        self.state["done"] = merge_ranges(self.state["done"] + [[start, end]])
+        if not self.path:
+            return
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ChunkSizer:
+    """Next chunk size from the rows/second the last chunks achieved."""
+
+    def __init__(self, size=CHUNK_SIZE, minimum=MIN_CHUNK_SIZE, maximum=MAX_CHUNK_SIZE, target=TARGET_SECONDS):
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+
+    def succeeded(self, rows, seconds):
+        ideal = rows * self.target / max(seconds, 1e-3)
+        # At most double per step, so one fast answer does not overshoot.
+        self.size = int(min(self.maximum, max(self.minimum, min(ideal, 2 * self.size))))
+
+    def too_large(self, rows):
+        # Payload limits do not change during a run, so never grow past it again.
+        self.maximum = max(self.minimum, min(self.maximum, rows // 2))
+        self.size = min(self.size, self.maximum)
+
+
+def _dedupe(df, key):
+    if key not in df:
+        raise ValueError(f"{key} is not a column; upserts need a stable row key")
+    duplicated = df[key].duplicated(keep="last")
+    if duplicated.any():
+        # One statement cannot update the same row twice; the last copy wins.
+        logging.warning("Dropping %d rows with a repeated %s", int(duplicated.sum()), key)
+        df = df[~duplicated]
+    return df.reset_index(drop=True)
+
+
+def _client(url, api_key, transport):
+    headers = {
+        "apikey": api_key,
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "Prefer": "resolution=merge-duplicates,return=minimal",
+    }
+    return httpx.AsyncClient(
+        base_url=url.rstrip("/") + "/rest/v1", headers=headers, transport=transport, timeout=60
+    )
+
+
+async def _send(client, df, base, table, key, checkpoint, sizer, concurrency, attempts):
+    """Upsert the rows of `df` not yet in the checkpoint; row i of `df` is
+    position base + i in the checkpoint. Returns the number of rows sent."""
+    done = [(start - base, end - base) for start, end in checkpoint.done if end > base and start < base + len(df)]
+    pending = collections.deque(missing_ranges(done, len(df)))
+    sent = 0
+
+    def take():
+        start, end = pending.popleft()
+        stop = min(end, start + sizer.size)
+        if stop < end:
+            pending.appendleft((stop, end))
+        return start, stop
+
+    async def worker():
+        nonlocal sent
+        while pending:
+            start, stop = take()
+            body = df.iloc[start:stop].to_json(orient="records", date_format="iso")
+            started = time.perf_counter()
+            try:
+                await request_with_retry(
+                    client, "POST", f"/{table}", attempts=attempts,
+                    params={"on_conflict": key}, content=body,
+                )
+            except httpx.HTTPStatusError as exc:
+                if exc.response.status_code != 413 or stop - start <= 1:
+                    pending.clear()  # let the other workers finish what they sent, then stop
+                    raise
+                middle = (start + stop) // 2
+                sizer.too_large(stop - start)
+                pending.extendleft([(middle, stop), (start, middle)])
+                continue
+            sizer.succeeded(stop - start, time.perf_counter() - started)
+            checkpoint.add(base + start, base + stop)
+            sent += stop - start
+
+    results = await asyncio.gather(*(worker() for _ in range(concurrency)), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        logging.error("%s: stopped after sending %d rows; rerun to resume from %s", table, sent, checkpoint.path)
+        raise errors[0]
+    return sent
+
+
+async def upsert(
+    df,
+    table,
+    url,
+    api_key,
+    key="video_id",
+    checkpoint_path=None,
+    chunk_size=CHUNK_SIZE,
+    concurrency=CONCURRENCY,
+    attempts=5,
+    transport=None,
+):
+    """Upsert every row of `df` into `table`; returns the number of rows sent."""
+    df = _dedupe(df, key)
+    checkpoint = Checkpoint(checkpoint_path, table, fingerprint(df))
+    if len(df) and not missing_ranges(checkpoint.done, len(df)):
+        logging.info("%s: every row was already uploaded according to %s", table, checkpoint_path)
+    sizer = ChunkSizer(chunk_size)
+    started = time.perf_counter()
+    async with _client(url, api_key, transport) as client:
+        sent = await _send(client, df, 0, table, key, checkpoint, sizer, concurrency, attempts)
+    checkpoint.remove()
+    logging.info(
+        "Upserted %d rows into %s in %.2fs (last chunk size %d)", sent, table, time.perf_counter() - started, sizer.size
+    )
+    return sent
+
+
+def file_fingerprint(path, *extra):
+    digest = hashlib.sha1(repr(extra).encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def upsert_csv(
+    path,
+    table,
+    url,
+    api_key,
+    key="video_id",
+    checkpoint_path=None,
+    transform=None,
+    read_rows=READ_ROWS,
+    chunk_size=CHUNK_SIZE,
+    concurrency=CONCURRENCY,
+    attempts=5,
+    transport=None,
+):
+    """Upsert a CSV too large to load, `read_rows` rows at a time.
+
+    `transform(chunk)` may filter or convert each chunk before it is sent. The
+    checkpoint counts positions within each chunk as read, so it resumes the
+    same file read with the same `read_rows`.
+    """
+    checkpoint = Checkpoint(checkpoint_path, table, file_fingerprint(path, read_rows))
+    sizer = ChunkSizer(chunk_size)
+    sent = 0
+    started = time.perf_counter()
+    async with _client(url, api_key, transport) as client:
+        for i, chunk in enumerate(pd.read_csv(path, chunksize=read_rows)):
+            if transform is not None:
+                chunk = transform(chunk)
+            # Chunk i owns positions from i * read_rows, so rows dropped by
+            # `transform` do not shift the later chunks' checkpoint ranges.
+            sent += await _send(
+                client, _dedupe(chunk, key), i * read_rows, table, key, checkpoint, sizer, concurrency, attempts
+            )
+    checkpoint.remove()
+    logging.info(
+        "Upserted %d rows into %s in %.2fs (last chunk size %d)", sent, table, time.perf_counter() - started, sizer.size
+    )
+    return sent
+
+
+def _credentials():
+    url, api_key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not api_key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set to upload")
+    return url, api_key
+
+
+def upsert_frame(df, table, key="video_id", checkpoint_path=None, **kwargs):
+    """`upsert()` with the SUPABASE_URL / SUPABASE_KEY credentials; the
+    checkpoint defaults to `<table>.upload.json` in the working directory."""
+    if checkpoint_path is None:
+        checkpoint_path = f"{table}.upload.json"
+    return asyncio.run(upsert(df, table, *_credentials(), key, checkpoint_path, **kwargs))
+
+
+def upsert_csv_file(path, table, key="video_id", checkpoint_path=None, **kwargs):
+    """`upsert_csv()` with the SUPABASE_URL / SUPABASE_KEY credentials and the
+    same default checkpoint as `upsert_frame()`."""
+    if checkpoint_path is None:
+        checkpoint_path = f"{table}.upload.json"
+    return asyncio.run(upsert_csv(path, table, *_credentials(), key, checkpoint_path, **kwargs))
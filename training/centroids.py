@@ -0,0 +1,140 @@
+"""Quality-tier clustering helpers: mini-batch training, stable tier labels and
+the centroid export the backend serves from.
+
+The export (`<artifact>.centroids.npz`) holds the StandardScaler mean and scale,
+the KMeans centres in scaled space, the tier label of every cluster and the
+feature order. The backend folds scaler and centres into one small matrix
+product (backend/src/nearest_centroid.py), so the Pipeline is not needed to serve.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+# Tiers from the least to the most engaging cluster, ranked by the mean of
+# these ratios over each cluster's rows.
+TIERS = ["Low Quality", "Medium Quality", "High Quality"]
+RATIO_COLUMNS = ["like_ratio", "share_ratio", "comment_ratio"]
+
+
+def centroids_path(artifact_path):
+    return os.path.splitext(artifact_path)[0] + ".centroids.npz"
+
+
+def tier_labels(cluster_means):
+    """{cluster: tier} from a frame of per-cluster RATIO_COLUMNS means."""
+    sorted_clusters = cluster_means.mean(axis=1).sort_values().index.tolist()
+    return {cluster: TIERS[rank] for rank, cluster in enumerate(sorted_clusters)}
+
+
+def export_centroids(artifact_path, pipeline, quality_map, features):
+    scaler, kmeans = pipeline.named_steps["scaler"], pipeline.named_steps["model"]
+    path = centroids_path(artifact_path)
+    np.savez(
+        path,
+        features=np.array(features),
+        mean=scaler.mean_,
+        scale=scaler.scale_,
+        centers=kmeans.cluster_centers_,
+        labels=np.array([quality_map[k] for k in range(kmeans.n_clusters)]),
+    )
+    return path
+
+
+def load_centroids(path):
+    """Raw-space centres, tier labels and scaler of a previous export, or None."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return {
+            "features": [str(name) for name in data["features"]],
+            "mean": data["mean"],
+            "scale": data["scale"],
+            "raw_centers": data["mean"] + data["centers"] * data["scale"],
+            "labels": [str(label) for label in data["labels"]],
+        }
+
+
+def nearest(previous, X):
+    """Cluster index of each row under a previous export."""
+    Z = (np.asarray(X, dtype=np.float64) - previous["mean"]) / previous["scale"]
+    centers = (previous["raw_centers"] - previous["mean"]) / previous["scale"]
+    return ((Z[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+
+
+def warm_start(previous, scaler, features):
+    """Previous centres in the new scaler's space, to initialise KMeans with."""
+    if previous is None or previous["features"] != list(features):
+        return None
+    return scaler.transform(pd.DataFrame(previous["raw_centers"], columns=features))
+
+
+def inherit_labels(pipeline, previous):
+    """{cluster: tier} taken from the closest previous centres (one-to-one), so
+    a retrain does not move clusters between tiers."""
+    scaler, kmeans = pipeline.named_steps["scaler"], pipeline.named_steps["model"]
+    raw_centers = scaler.mean_ + kmeans.cluster_centers_ * scaler.scale_
+    distance = (((raw_centers[:, None, :] - previous["raw_centers"][None, :, :]) / scaler.scale_) ** 2).sum(axis=2)
+    new, old = linear_sum_assignment(distance)
+    return {int(k): previous["labels"][j] for k, j in zip(new, old)}
+
+
+def make_pipeline(n_clusters, init=None, random_state=42):
+    model = KMeans(
+        n_clusters=n_clusters,
+        init="k-means++" if init is None else init,
+        n_init="auto" if init is None else 1,
+        random_state=random_state,
+    )
+    return Pipeline([("scaler", StandardScaler()), ("model", model)])
+
+
+def fit_minibatch(chunks, features, n_clusters, epochs, batch_size=4096, previous=None, random_state=42):
+    """Fit scaler and KMeans on data too large to load, one chunk at a time.
+
+    `chunks()` returns a fresh iterable of complete-row DataFrames on every
+    call. The first pass fits the scaler; then every epoch feeds each chunk to
+    MiniBatchKMeans.partial_fit. Memory is bounded by the chunk size.
+    """
+    scaler = StandardScaler()
+    rows = 0
+    for chunk in chunks():
+        scaler.partial_fit(chunk[features])
+        rows += len(chunk)
+    if not rows:
+        raise ValueError("No complete rows to cluster")
+
+    init = warm_start(previous, scaler, features)
+    kmeans = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        init="k-means++" if init is None else init,
+        n_init=1 if init is not None else 3,
+        batch_size=batch_size,
+        random_state=random_state,
+    )
+    for epoch in range(epochs):
+        for chunk in chunks():
+            if len(chunk) >= n_clusters:
+                kmeans.partial_fit(scaler.transform(chunk[features]))
+        print(f"Mini-batch epoch {epoch + 1}/{epochs} done ({rows} rows)")
+    return Pipeline([("scaler", scaler), ("model", kmeans)])
+
+
+def cluster_means(pipeline, chunks, features):
+    """Per-cluster RATIO_COLUMNS means, accumulated over `chunks`."""
+    sums, counts = None, None
+    for chunk in chunks:
+        ratios = chunk[RATIO_COLUMNS].groupby(pipeline.predict(chunk[features]))
+        chunk_sums, chunk_counts = ratios.sum(), ratios.count()
+        sums = chunk_sums if sums is None else sums.add(chunk_sums, fill_value=0)
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+    return sums / counts
+
+
+def previous_tiers(previous, X):
+    """Tier of each row under a previous export."""
+    return np.array(previous["labels"])[nearest(previous, X)]
@@ -0,0 +1,357 @@
+"""Incremental sync of Supabase tables into a local Parquet cache.
+
+    python -m training.data_sync tiktok_dataset_cleaned short_video_engagement
+
+Each table is read through the Supabase REST API (PostgREST) from a
+high-water mark: only rows whose cursor column is past the last synced value
+are fetched, in pages requested concurrently, and appended to
+`data_cache/<table>/` as a new Parquet part. Readers merge the parts by the
+table's key, so a changed row replaces its earlier copy; parts are compacted
+once there are more than MAX_PARTS of them.
+
+A serial id cursor only sees new rows: an upsert that edits a row in place
+keeps its id, and deleted rows are never noticed. So every RECHECK_HOURS the
+sync fetches the whole table instead, which replaces edited rows and drops
+deleted ones. A table with an updated_at column maintained by a trigger can
+use it as the cursor instead, and then picks up edits on every sync.
+
+The training scripts call `sync_and_load()`, which syncs when SUPABASE_URL is
+set (falling back to the cache if that fails) and reads from the cache.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+
+import httpx
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data_cache")
+# Supabase caps every response at db-max-rows (1000 by default); larger pages
+# would come back truncated.
+PAGE_SIZE = 1000
+CONCURRENCY = 8
+MAX_PARTS = 16
+STATE_FILE = "state.json"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Longest time an incremental cache goes without a full re-fetch; None never
+# re-fetches (only safe with an updated_at cursor and no deletes).
+RECHECK_HOURS = 24
+
+# `key` identifies a row; `cursor` must grow when a row is inserted (and, to
+# pick up edits between full re-checks, when it is changed). Both tables use
+# their serial id, so edits arrive with the periodic full re-check. Switching
+# to an updated_at cursor needs that column plus a trigger that sets it on
+# every update in Supabase, and one sync with --full.
+TABLES = {
+    # Data_preparation.py upserts on video_id (training/bulk_upload.py).
+    "tiktok_dataset_cleaned": {"key": "video_id", "cursor": "id"},
+    "short_video_engagement": {"key": "id", "cursor": "id"},
+}
+
+
+def table_dir(table, cache_dir=DEFAULT_CACHE_DIR):
+    return os.path.join(cache_dir, table)
+
+
+def read_state(table, cache_dir=DEFAULT_CACHE_DIR):
+    path = os.path.join(table_dir(table, cache_dir), STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_state(table, cache_dir, state):
+    directory = table_dir(table, cache_dir)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, os.path.join(directory, STATE_FILE))
+
+
+def _parts(table, cache_dir):
+    return sorted(glob.glob(os.path.join(table_dir(table, cache_dir), "part-*.parquet")))
+
+
+def _write_part(table, cache_dir, df):
+    """Write `df` as the next part, atomically, and return its path."""
+    directory = table_dir(table, cache_dir)
+    parts = _parts(table, cache_dir)
+    number = int(os.path.basename(parts[-1])[5:10]) + 1 if parts else 0
+    path = os.path.join(directory, f"part-{number:05d}.parquet")
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+async def request_with_retry(client, method, url, attempts=5, backoff=0.5, **kwargs):
+    """Send a request, retrying transport errors and 429/5xx answers with
+    exponential backoff; other errors are raised straight away."""
+    for attempt in range(attempts):
+        try:
+            response = await client.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response
+            error = httpx.HTTPStatusError(
+                f"{response.status_code} from {url}", request=response.request, response=response
+            )
+        except httpx.TransportError as exc:
+            error = exc
+        if attempt == attempts - 1:
+            raise error
+        delay = backoff * 2**attempt
+        logging.warning("%s %s failed (%s), retrying in %.1fs", method, url, error, delay)
+        await asyncio.sleep(delay)
+
+
+def _window(cursor, low, high, inclusive_low):
+    """PostgREST filters for low < cursor <= high (repeated filters are ANDed)."""
+    params = []
+    if low is not None:
+        params.append((cursor, f"{'gte' if inclusive_low else 'gt'}.{low}"))
+    if high is not None:
+        params.append((cursor, f"lte.{high}"))
+    return params
+
+
+async def sync_table(
+    table,
+    url,
+    api_key,
+    cache_dir=DEFAULT_CACHE_DIR,
+    key=None,
+    cursor=None,
+    page_size=PAGE_SIZE,
+    concurrency=CONCURRENCY,
+    full=False,
+    recheck_hours=RECHECK_HOURS,
+    transport=None,
+):
+    """Fetch rows past the table's high-water mark into a new cache part.
+
+    Returns the number of rows fetched. The upper end of the window is fixed
+    when the sync starts, so concurrent offset pages all see the same rows;
+    anything written meanwhile is past it and is picked up by the next sync.
+    The whole table is fetched instead (`full`) when the last full fetch is
+    more than `recheck_hours` old.
+    """
+    config = TABLES.get(table, {})
+    key = key or config.get("key", "id")
+    cursor = cursor or config.get("cursor", key)
+    state = {} if full else read_state(table, cache_dir)
+    if state and (state.get("key"), state.get("cursor")) != (key, cursor):
+        raise ValueError(f"{table} was cached with key/cursor {state['key']}/{state['cursor']}; sync with --full")
+    if state and recheck_hours is not None and time.time() - state.get("full_sync_time", 0) > recheck_hours * 3600:
+        logging.info("%s was last fetched in full over %sh ago; re-fetching every row", table, recheck_hours)
+        state = {}
+    full = not state
+    low = state.get("high_water_mark")
+    # A non-unique cursor (e.g. a timestamp) may have more rows at the mark
+    # than the last sync saw, so the mark itself is fetched again.
+    inclusive_low = cursor != key
+    headers = {"apikey": api_key, "Authorization": f"Bearer {api_key}"}
+
+    def save_state(high, fetched):
+        os.makedirs(table_dir(table, cache_dir), exist_ok=True)
+        _write_state(table, cache_dir, {
+            "key": key,
+            "cursor": cursor,
+            "high_water_mark": high,
+            "synced_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "full_sync_time": time.time() if full else state.get("full_sync_time", 0),
+            "last_sync": "full" if full else "incremental",
+            "last_rows": fetched,
+        })
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(
+        base_url=url.rstrip("/") + "/rest/v1", headers=headers, transport=transport, timeout=60
+    ) as client:
+        top = await request_with_retry(
+            client, "GET", f"/{table}",
+            params=[("select", cursor), ("order", f"{cursor}.desc"), ("limit", "1")]
+            + _window(cursor, low, None, inclusive_low),
+        )
+        if not top.json():
+            if full:
+                # An empty table: the cache is emptied too.
+                for part in _parts(table, cache_dir):
+                    os.remove(part)
+            save_state(low, 0)
+            logging.info("%s is up to date at %s=%s", table, cursor, low)
+            return 0
+        high = top.json()[0][cursor]
+        window = _window(cursor, low, high, inclusive_low)
+
+        counted = await request_with_retry(
+            client, "GET", f"/{table}",
+            params=[("select", key), ("limit", "1")] + window,
+            headers={"Prefer": "count=exact"},
+        )
+        total = int(counted.headers["Content-Range"].rsplit("/", 1)[1])
+        pages = math.ceil(total / page_size)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(page):
+            async with semaphore:
+                response = await request_with_retry(
+                    client, "GET", f"/{table}",
+                    params=[
+                        ("select", "*"),
+                        ("order", f"{cursor}.asc,{key}.asc"),
+                        ("offset", str(page * page_size)),
+                        ("limit", str(page_size)),
+                    ] + window,
+                )
+            rows = response.json()
+            if page < pages - 1 and len(rows) < page_size:
+                raise RuntimeError(
+                    f"{table} page {page} returned {len(rows)} rows, fewer than --page-size {page_size}; "
+                    "the server caps responses lower, use a smaller page size"
+                )
+            return rows
+
+        results = await asyncio.gather(*(fetch(page) for page in range(pages)))
+
+    rows = [row for page in results for row in page]
+    if full:
+        for part in _parts(table, cache_dir):
+            os.remove(part)
+    if rows:
+        os.makedirs(table_dir(table, cache_dir), exist_ok=True)
+        _write_part(table, cache_dir, pd.DataFrame.from_records(rows))
+    # The part is in place before the mark moves; if this is interrupted the
+    # next sync fetches the same rows again and the key merge drops the copies.
+    save_state(high, len(rows))
+    logging.info("Synced %d rows of %s in %d pages in %.2fs", len(rows), table, pages, time.perf_counter() - started)
+    if len(_parts(table, cache_dir)) > MAX_PARTS:
+        compact(table, cache_dir)
+    return len(rows)
+
+
+def _merge(frames, key):
+    df = pd.concat(frames, ignore_index=True)
+    return df.drop_duplicates(subset=key, keep="last", ignore_index=True)
+
+
+def compact(table, cache_dir=DEFAULT_CACHE_DIR):
+    """Merge every part into one, keeping the newest copy of each row."""
+    parts = _parts(table, cache_dir)
+    if len(parts) <= 1:
+        return
+    key = read_state(table, cache_dir).get("key", "id")
+    merged = _merge([pd.read_parquet(part) for part in parts], key)
+    _write_part(table, cache_dir, merged)
+    for part in parts:
+        os.remove(part)
+
+
+def cache_digest(table, cache_dir=DEFAULT_CACHE_DIR):
+    """Content hash of the cached table, compacted first so that the same rows
+    give the same digest however many syncs they arrived in."""
+    compact(table, cache_dir)
+    parts = _parts(table, cache_dir)
+    if not parts:
+        raise FileNotFoundError(f"No cached data for {table} in {table_dir(table, cache_dir)}; run a sync first")
+    digest = hashlib.sha256()
+    with open(parts[0], "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_table(table, columns=None, cache_dir=DEFAULT_CACHE_DIR):
+    """The cached table as a DataFrame, optionally only `columns`."""
+    parts = _parts(table, cache_dir)
+    if not parts:
+        raise FileNotFoundError(f"No cached data for {table} in {table_dir(table, cache_dir)}; run a sync first")
+    if len(parts) == 1:
+        return pd.read_parquet(parts[0], columns=columns)
+    key = read_state(table, cache_dir).get("key", "id")
+    wanted = None if columns is None else list(dict.fromkeys([*columns, key]))
+    df = _merge([pd.read_parquet(part, columns=wanted) for part in parts], key)
+    return df if columns is None else df[list(columns)]
+
+
+def iter_table(table, columns=None, batch_size=100_000, cache_dir=DEFAULT_CACHE_DIR):
+    """Stream the cached table in DataFrames of at most `batch_size` rows."""
+    import pyarrow.parquet as pq
+
+    compact(table, cache_dir)
+    parts = _parts(table, cache_dir)
+    if not parts:
+        raise FileNotFoundError(f"No cached data for {table} in {table_dir(table, cache_dir)}; run a sync first")
+    for batch in pq.ParquetFile(parts[0]).iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def sync(table, cache_dir=DEFAULT_CACHE_DIR, **kwargs):
+    """Sync one table with the SUPABASE_URL / SUPABASE_KEY credentials."""
+    url, api_key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not api_key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set to sync")
+    return asyncio.run(sync_table(table, url, api_key, cache_dir, **kwargs))
+
+
+def refresh(table, cache_dir=DEFAULT_CACHE_DIR):
+    """Bring the cache up to date if Supabase is reachable; an existing cache
+    is used as it is when the sync fails."""
+    try:
+        fetched = sync(table, cache_dir)
+        if read_state(table, cache_dir).get("last_sync") == "full":
+            print(f"Re-fetched all {fetched} rows of {table}")
+        else:
+            print(f"Synced {fetched} new rows of {table}")
+    except (RuntimeError, httpx.HTTPError) as exc:
+        if not _parts(table, cache_dir):
+            raise
+        print(f"Could not sync {table} ({exc}); using the cached copy from {read_state(table, cache_dir).get('synced_at')}")
+
+
+def sync_and_load(table, columns=None, cache_dir=DEFAULT_CACHE_DIR):
+    """`refresh()` the cache, then read it."""
+    started = time.perf_counter()
+    refresh(table, cache_dir)
+    df = load_table(table, columns, cache_dir)
+    print(f"Loaded {len(df)} rows of {table} in {time.perf_counter() - started:.2f}s")
+    return df
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Sync Supabase tables into the local Parquet cache.")
+    parser.add_argument("tables", nargs="+")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--key", help="row key column (default from TABLES, else id)")
+    parser.add_argument("--cursor", help="high-water-mark column (default from TABLES, else the key)")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--full", action="store_true", help="discard the cache and fetch everything")
+    parser.add_argument("--recheck-hours", type=float, default=RECHECK_HOURS,
+                        help="fetch everything when the last full fetch is older than this")
+    args = parser.parse_args()
+
+    for name in args.tables:
+        sync(
+            name,
+            args.cache_dir,
+            key=args.key,
+            cursor=args.cursor,
+            page_size=args.page_size,
+            concurrency=args.concurrency,
+            full=args.full,
+            recheck_hours=args.recheck_hours,
+        )
+        compact(name, args.cache_dir)
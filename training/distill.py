@@ -0,0 +1,186 @@
+"""Fit small surrogate models to the stacked ensembles' own predictions.
+
+    python -m training.distill --models-dir backend/models
+
+The surrogates are trained on the ensembles' predictions rather than on the
+labels, so no labels are needed. Inputs are the rows of the tables the
+training scripts read (tiktok_dataset_cleaned, short_video_engagement), synced
+into the local Parquet cache by training/data_sync.py first unless --no-sync
+(or read from a CSV given with --engagement-data / --watch-data), plus
+synthetic rows that recombine their columns. Candidates are tried from the
+cheapest up; the first whose fidelity on held-out real rows (R² against the
+full model) meets --min-r2 is saved as `<artifact>_fast.pkl` with its feature
+schema, and a `<artifact>_fast.distill.json` report lists every candidate.
+The backend serves it for requests with mode=fast.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import Ridge
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from training.data_sync import load_table, sync_and_load
+from training.feature_schema import load_feature_schema, save_feature_schema
+
+# Full artifact and cached table of each distilled model.
+TEACHERS = {
+    "engagement": ("tiktok_engagement_stacked_model.pkl", "tiktok_dataset_cleaned"),
+    "watch_duration": ("short_video_stacked_model.pkl", "short_video_engagement"),
+}
+FAST_SUFFIX = "_fast"
+
+
+def fast_path(artifact_path):
+    return os.path.splitext(artifact_path)[0] + FAST_SUFFIX + ".pkl"
+
+
+def candidates():
+    """Surrogates in order of serving cost, cheapest first."""
+    return [
+        ("ridge_poly2", make_pipeline(
+            SimpleImputer(strategy="mean"),
+            PolynomialFeatures(degree=2, include_bias=False),
+            StandardScaler(),
+            Ridge(alpha=1.0),
+        )),
+        ("gbr_depth3_50", make_pipeline(
+            SimpleImputer(strategy="mean"),
+            GradientBoostingRegressor(n_estimators=50, max_depth=3, random_state=42),
+        )),
+        ("gbr_depth4_150", make_pipeline(
+            SimpleImputer(strategy="mean"),
+            GradientBoostingRegressor(n_estimators=150, max_depth=4, learning_rate=0.08, random_state=42),
+        )),
+    ]
+
+
+def augment(X, factor, rng, swap_probability=0.5):
+    """Synthetic rows: each one a real row with about half of its columns
+    taken from other random rows, to cover feature combinations the data lacks."""
+    n = len(X) * factor
+    values = X.to_numpy(dtype=np.float64)
+    base = values[rng.integers(0, len(values), n)]
+    donors = values[rng.integers(0, len(values), n)]
+    swap = rng.random(base.shape) < swap_probability
+    return pd.DataFrame(np.where(swap, donors, base), columns=X.columns)
+
+
+def predict_ms(model, X, repeats=20):
+    model.predict(X)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        model.predict(X)
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def fidelity(teacher_pred, student_pred):
+    return {
+        "r2": float(r2_score(teacher_pred, student_pred)),
+        "rmse": float(np.sqrt(mean_squared_error(teacher_pred, student_pred))),
+        "mae": float(mean_absolute_error(teacher_pred, student_pred)),
+        "max_abs_error": float(np.max(np.abs(teacher_pred - student_pred))),
+    }
+
+
+def load_data(model, columns, data_path=None, sync=True):
+    """Transfer rows: `data_path` if given, else the model's table from the data cache."""
+    if data_path:
+        return pd.read_csv(data_path)
+    table = TEACHERS[model][1]
+    return sync_and_load(table, columns) if sync else load_table(table, columns)
+
+
+def distill(model, artifact_path, data_path, min_r2, factor, seed=42, sync=True):
+    schema = load_feature_schema(artifact_path, model)
+    features, target = schema["features"], schema.get("target")
+    teacher = joblib.load(artifact_path)
+
+    df = load_data(model, features + ([target] if target else []), data_path, sync)
+    X_real = df[features].dropna()
+    X_train, X_test = train_test_split(X_real, test_size=0.2, random_state=seed)
+    X_transfer = pd.concat([X_train, augment(X_train, factor, np.random.default_rng(seed))], ignore_index=True)
+    y_transfer = teacher.predict(X_transfer)
+    teacher_test = teacher.predict(X_test)
+
+    one_row, many_rows = X_test.iloc[:1], X_test.iloc[:1000]
+    report = {
+        "model": model,
+        "teacher": os.path.basename(artifact_path),
+        "transfer_rows": len(X_transfer),
+        "test_rows": len(X_test),
+        "min_r2": min_r2,
+        "teacher_latency_ms": {"1": predict_ms(teacher, one_row), str(len(many_rows)): predict_ms(teacher, many_rows)},
+        "candidates": [],
+        "selected": None,
+    }
+    if target in df:
+        y_true = df.loc[X_test.index, target]
+        report["teacher_rmse_vs_labels"] = float(np.sqrt(mean_squared_error(y_true, teacher_test)))
+
+    chosen = None
+    for name, student in candidates():
+        started = time.perf_counter()
+        student.fit(X_transfer, y_transfer)
+        student_test = student.predict(X_test)
+        entry = {
+            "name": name,
+            "fit_s": time.perf_counter() - started,
+            "fidelity": fidelity(teacher_test, student_test),
+            "latency_ms": {"1": predict_ms(student, one_row), str(len(many_rows)): predict_ms(student, many_rows)},
+        }
+        if target in df:
+            entry["rmse_vs_labels"] = float(np.sqrt(mean_squared_error(y_true, student_test)))
+        report["candidates"].append(entry)
+        print(f"{model}: {name} R²={entry['fidelity']['r2']:.4f} vs full model, "
+              f"{entry['latency_ms']['1']:.2f} ms/row (full {report['teacher_latency_ms']['1']:.2f})")
+        if entry["fidelity"]["r2"] >= min_r2:
+            chosen = (name, student)
+            break
+
+    output = fast_path(artifact_path)
+    if chosen is None:
+        print(f"{model}: no surrogate reached R² {min_r2}; {output} not written")
+    else:
+        report["selected"] = chosen[0]
+        joblib.dump(chosen[1], output)
+        save_feature_schema(output, model, features)
+        print(f"{model}: saved {chosen[0]} as {output}")
+    with open(os.path.splitext(output)[0] + ".distill.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distil the stacked models into fast surrogates.")
+    parser.add_argument("--models-dir", default=os.path.join("backend", "models"))
+    parser.add_argument("--model", choices=sorted(TEACHERS), action="append", help="default: all")
+    parser.add_argument("--engagement-data", help="CSV to use instead of the cached table")
+    parser.add_argument("--watch-data", help="CSV to use instead of the cached table")
+    parser.add_argument("--no-sync", action="store_true", help="use the local data cache as it is")
+    parser.add_argument("--min-r2", type=float, default=0.95, help="fidelity budget against the full model")
+    parser.add_argument("--augment", type=int, default=2, help="synthetic rows per real training row")
+    args = parser.parse_args()
+    if not args.no_sync:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+
+    data = {"engagement": args.engagement_data, "watch_duration": args.watch_data}
+    missed = []
+    for model in args.model or sorted(TEACHERS):
+        artifact = os.path.join(args.models_dir, TEACHERS[model][0])
+        if distill(model, artifact, data[model], args.min_r2, args.augment, sync=not args.no_sync)["selected"] is None:
+            missed.append(model)
+    sys.exit(1 if missed else 0)
@@ -0,0 +1,161 @@
+"""Cross-validation that fits every outer fold once.
+
+`cross_validate()` fits the model on each fold's training rows, in parallel,
+and keeps the out-of-fold predictions. Every metric, per fold and pooled over
+all rows, is computed from those predictions, so adding a metric costs no
+extra fit. The pooled out-of-fold scores are the held-out report: every row is
+predicted by a model that did not see it.
+
+Folds share one CPU budget (TRAINING_CPUS, default: all cores): up to one
+worker per fold, with the model's own n_jobs and BLAS threads in each worker
+capped to its share, so nested parallelism (StackingRegressor, random forests)
+does not oversubscribe the machine.
+"""
+import json
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed, parallel_config
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from threadpoolctl import threadpool_limits
+
+METRICS = {
+    "rmse": lambda y_true, y_pred: float(np.sqrt(mean_squared_error(y_true, y_pred))),
+    "mae": lambda y_true, y_pred: float(mean_absolute_error(y_true, y_pred)),
+    "r2": lambda y_true, y_pred: float(r2_score(y_true, y_pred)),
+}
+LABELS = {"rmse": "RMSE", "mae": "MAE", "r2": "R²"}
+
+
+def cpu_budget(n_jobs=None):
+    """Cores to use: n_jobs if given (negative counts back from all cores, as
+    in joblib), else TRAINING_CPUS, else every core."""
+    cores = os.cpu_count() or 1
+    if n_jobs is None:
+        n_jobs = int(os.getenv("TRAINING_CPUS", cores))
+    if n_jobs < 0:
+        n_jobs = cores + 1 + n_jobs
+    return max(1, n_jobs)
+
+
+def set_n_jobs(model, n_jobs):
+    """Set every n_jobs parameter of `model`, nested ones included."""
+    names = [name for name in model.get_params(deep=True) if name.split("__")[-1] == "n_jobs"]
+    return model.set_params(**{name: n_jobs for name in names})
+
+
+def _n_jobs_params(model):
+    return {name: value for name, value in model.get_params(deep=True).items() if name.split("__")[-1] == "n_jobs"}
+
+
+def fit_within_budget(model, X, y=None, n_jobs=None):
+    """Fit `model` in this process on cpu_budget(n_jobs) cores, with its own
+    n_jobs and the BLAS/OpenMP threads capped as in cross_validate().
+
+    The n_jobs values are restored afterwards, on the fitted members of a
+    StackingRegressor too, so the saved artifact predicts as it did before.
+    """
+    budget = cpu_budget(n_jobs)
+    original = _n_jobs_params(model)
+    set_n_jobs(model, budget)
+    with threadpool_limits(budget), parallel_config(backend="loky", inner_max_num_threads=budget):
+        model.fit(X, y)
+    model.set_params(**original)
+    fitted = dict(getattr(model, "named_estimators_", {}))
+    if hasattr(model, "final_estimator_"):
+        fitted["final_estimator"] = model.final_estimator_
+    for name, estimator in fitted.items():
+        if estimator == "drop":
+            continue
+        prefix = name + "__"
+        estimator.set_params(**{key[len(prefix):]: value for key, value in original.items() if key.startswith(prefix)})
+    return model
+
+
+def _fit_fold(model, X, y, train, test):
+    started = time.perf_counter()
+    fitted = clone(model).fit(X.iloc[train], y.iloc[train])
+    return fitted.predict(X.iloc[test]), time.perf_counter() - started
+
+
+class Evaluation:
+    """Out-of-fold predictions of one cross-validation and the metrics on them."""
+
+    def __init__(self, y_true, y_pred, fold, fit_seconds, wall_seconds, n_jobs):
+        self.y_true = np.asarray(y_true, dtype=np.float64)
+        self.y_pred = np.asarray(y_pred, dtype=np.float64)
+        self.fold = np.asarray(fold)
+        self.fit_seconds = list(fit_seconds)
+        self.wall_seconds = wall_seconds
+        self.n_jobs = n_jobs
+
+    @property
+    def n_folds(self):
+        return len(self.fit_seconds)
+
+    def fold_scores(self, metric):
+        score = METRICS[metric]
+        return np.array([
+            score(self.y_true[self.fold == k], self.y_pred[self.fold == k]) for k in range(self.n_folds)
+        ])
+
+    def pooled(self, metric):
+        return METRICS[metric](self.y_true, self.y_pred)
+
+    def summary(self):
+        return {
+            "folds": self.n_folds,
+            "rows": len(self.y_true),
+            "n_jobs": self.n_jobs,
+            "fit_seconds": self.fit_seconds,
+            "wall_seconds": self.wall_seconds,
+            "fold_scores": {metric: self.fold_scores(metric).tolist() for metric in METRICS},
+            "out_of_fold": {metric: self.pooled(metric) for metric in METRICS},
+        }
+
+    def print_report(self, name="Model"):
+        for metric in METRICS:
+            scores = self.fold_scores(metric)
+            print(f"{name} Cross-Validated {LABELS[metric]}:")
+            print(f" Mean: {scores.mean():.4f}, Std: {scores.std():.4f}")
+        print(f"\n Out-of-Fold Evaluation for {name} ({len(self.y_true)} held-out predictions):")
+        for metric in METRICS:
+            print(f" {LABELS[metric]}: {self.pooled(metric):.4f}")
+        print(f" {self.n_folds} folds fitted in {self.wall_seconds:.1f}s on {self.n_jobs} CPUs")
+
+    def save(self, artifact_path):
+        """Write `<artifact>.evaluation.json` and the predictions to
+        `<artifact>.oof.npz`, for reports that should not refit anything."""
+        base = os.path.splitext(artifact_path)[0]
+        with open(base + ".evaluation.json", "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        np.savez(base + ".oof.npz", y_true=self.y_true, y_pred=self.y_pred, fold=self.fold)
+        return base + ".evaluation.json"
+
+
+def cross_validate(model, X, y, cv, n_jobs=None):
+    """Fit `model` once per fold of `cv` and return the Evaluation of its
+    out-of-fold predictions. X and y are a DataFrame and Series."""
+    budget = cpu_budget(n_jobs)
+    splits = list(cv.split(X, y))
+    outer = min(len(splits), budget)
+    inner = max(1, budget // outer)
+    fold_model = set_n_jobs(clone(model), inner)
+
+    started = time.perf_counter()
+    with parallel_config(backend="loky", inner_max_num_threads=inner):
+        results = Parallel(n_jobs=outer)(
+            delayed(_fit_fold)(fold_model, X, y, train, test) for train, test in splits
+        )
+    wall_seconds = time.perf_counter() - started
+
+    y_pred = np.empty(len(y), dtype=np.float64)
+    fold = np.full(len(y), -1)
+    for k, ((_, test), (predictions, _)) in enumerate(zip(splits, results)):
+        y_pred[test] = predictions
+        fold[test] = k
+    if (fold < 0).any():
+        raise ValueError("cv must put every row in exactly one test fold (e.g. KFold)")
+    return Evaluation(y, y_pred, fold, [seconds for _, seconds in results], wall_seconds, budget)
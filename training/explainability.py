@@ -0,0 +1,212 @@
+"""Permutation importance and path attributions on a stratified subsample.
+
+Used by tiktok_dataset/explainability_engagement.py and
+short_video_dataset/explainability_watch_duration.py.
+
+`stratified_sample()` draws rows evenly across target quantiles, so a sample
+of --rows rows covers the whole target range. `permutation_importance()`
+scores each feature by the drop in R² when it is shuffled, as sklearn's does,
+but for a StackingRegressor it predicts the members on the unpermuted rows
+once (cached under .explain_cache/, keyed on the model and the sampled rows)
+and, after shuffling a feature, re-predicts only the members that use it
+before running the final estimator. Every (feature, repeat) runs in parallel.
+The 95% interval comes from the per-row error increases, so it covers both
+the shuffles and the choice of rows: if it is too wide, use more rows.
+
+`path_contributions()` splits each prediction into per-feature parts with the
+backend's explanation engine (backend/src/explain.py): exact along the trees'
+decision paths and linear coefficients, with no model-agnostic sampling.
+"""
+import hashlib
+import json
+import os
+import sys
+from functools import lru_cache
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import StackingRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model._base import LinearModel
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+from training.evaluation import cpu_budget, set_n_jobs
+
+DEFAULT_CACHE_DIR = os.path.join(REPO_ROOT, ".explain_cache")
+ROWS = 20_000
+BINS = 10
+Z_95 = 1.959963984540054
+
+
+def stratified_sample(y, n_rows=ROWS, bins=BINS, seed=42):
+    """Positions of up to n_rows rows, drawn in proportion from each target quantile bin."""
+    y = np.asarray(y, dtype=np.float64)
+    if n_rows >= len(y):
+        return np.arange(len(y))
+    edges = np.unique(np.quantile(y, np.linspace(0, 1, bins + 1)[1:-1]))
+    strata = np.searchsorted(edges, y, side="right")
+    rng = np.random.default_rng(seed)
+    picked = []
+    for stratum in np.unique(strata):
+        in_stratum = np.flatnonzero(strata == stratum)
+        take = int(round(n_rows * len(in_stratum) / len(y)))
+        picked.append(rng.choice(in_stratum, min(take, len(in_stratum)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+def members(model):
+    """Sub-models whose predictions feed the final estimator (the model itself if not a stack)."""
+    if isinstance(model, StackingRegressor):
+        return [est for est in model.estimators_ if est != "drop"]
+    return [model]
+
+
+def combine(model, meta, X):
+    """Final prediction from the members' predictions `meta` on rows X."""
+    if not isinstance(model, StackingRegressor):
+        return meta[:, 0]
+    if model.passthrough:
+        meta = np.column_stack([meta, np.asarray(X, dtype=np.float64)])
+    return model.final_estimator_.predict(meta)
+
+
+def used_features(estimator, n_features):
+    """Boolean mask of the input columns `estimator`'s predictions depend on."""
+    if isinstance(estimator, Pipeline):
+        steps = [step for _, step in estimator.steps[:-1] if step is not None and step != "passthrough"]
+        if all(isinstance(step, (SimpleImputer, StandardScaler)) for step in steps):
+            return used_features(estimator.steps[-1][1], n_features)
+        return np.ones(n_features, dtype=bool)
+    if isinstance(estimator, LinearModel) and np.ndim(estimator.coef_) == 1:
+        return np.asarray(estimator.coef_) != 0
+    trees = [estimator] if hasattr(estimator, "tree_") else getattr(estimator, "estimators_", None)
+    if trees is not None:
+        trees = list(np.asarray(trees, dtype=object).ravel())
+    if trees and all(hasattr(tree, "tree_") for tree in trees):
+        used = np.zeros(n_features, dtype=bool)
+        for tree in trees:
+            used[tree.tree_.feature[tree.tree_.feature >= 0]] = True
+        return used
+    if hasattr(estimator, "_predictors"):
+        used = np.zeros(n_features, dtype=bool)
+        for iteration in estimator._predictors:
+            for predictor in iteration:
+                used[predictor.nodes["feature_idx"][~predictor.nodes["is_leaf"].astype(bool)]] = True
+        return used
+    return np.ones(n_features, dtype=bool)
+
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else json.dumps(part).encode())
+    return digest.hexdigest()[:16]
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+@lru_cache(maxsize=2)
+def _load(model_path):
+    # Loaded once per worker process; the workers' own cores are the parallelism.
+    return set_n_jobs(joblib.load(model_path), 1)
+
+
+def _frame(X, columns):
+    return pd.DataFrame(X, columns=columns) if columns is not None else X
+
+
+def member_predictions(model_path, X, columns=None, cache_dir=DEFAULT_CACHE_DIR, key=None):
+    """(rows, members) predictions on the unpermuted rows, cached on disk under `key`."""
+    path = os.path.join(cache_dir, f"members-{key}.npy") if key else None
+    if path and os.path.exists(path):
+        return np.load(path)
+    meta = np.column_stack([est.predict(_frame(X, columns)) for est in members(_load(model_path))])
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path + ".tmp.npy"
+        np.save(tmp, meta)
+        os.replace(tmp, path)
+    return meta
+
+
+def _permuted_errors(model_path, X, y, meta, used, columns, feature, seed):
+    """Squared error of every row with column `feature` shuffled."""
+    model = _load(model_path)
+    permuted = X.copy()
+    permuted[:, feature] = X[np.random.default_rng(seed).permutation(len(X)), feature]
+    meta = meta.copy()
+    for m, est in enumerate(members(model)):
+        if used[m, feature]:
+            meta[:, m] = est.predict(_frame(permuted, columns))
+    return (y - combine(model, meta, permuted)) ** 2
+
+
+def permutation_importance(model_path, X, y, n_repeats=10, n_jobs=None, seed=42, cache_dir=DEFAULT_CACHE_DIR,
+                           use_cache=True):
+    """Mean R² drop per feature when it is shuffled, with its 95% interval.
+
+    X is a DataFrame, y a Series. Returns a DataFrame sorted by importance,
+    with the R² drop per repeat's std and how many members were re-predicted.
+    """
+    columns = list(X.columns)
+    model = _load(model_path)
+    if getattr(model, "feature_names_in_", None) is None:
+        columns = None
+    Xv = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+    yv = np.asarray(y, dtype=np.float64)
+    key = _digest(_file_digest(model_path), Xv.tobytes(), yv.tobytes()) if use_cache else None
+
+    report_path = os.path.join(cache_dir, f"importance-{key}-{n_repeats}-{seed}.json") if key else None
+    if report_path and os.path.exists(report_path):
+        return pd.read_json(report_path, orient="records")
+
+    meta = member_predictions(model_path, Xv, columns, cache_dir, key)
+    used = np.array([used_features(est, Xv.shape[1]) for est in members(model)])
+    base_errors = (yv - combine(model, meta, Xv)) ** 2
+    variance = float(np.mean((yv - yv.mean()) ** 2))
+
+    tasks = [(j, seed + 1000 * j + r) for j in range(Xv.shape[1]) for r in range(n_repeats)]
+    errors = Parallel(n_jobs=min(cpu_budget(n_jobs), len(tasks)))(
+        delayed(_permuted_errors)(model_path, Xv, yv, meta, used, columns, j, task_seed) for j, task_seed in tasks
+    )
+    errors = np.array(errors).reshape(Xv.shape[1], n_repeats, len(yv))
+
+    rows = []
+    for j, feature in enumerate(X.columns):
+        increase = errors[j].mean(axis=0) - base_errors  # per row, averaged over the repeats
+        importance = increase.mean() / variance
+        half_width = Z_95 * increase.std(ddof=1) / np.sqrt(len(yv)) / variance if len(yv) > 1 else 0.0
+        rows.append({
+            "feature": feature,
+            "importance": float(importance),
+            "ci_low": float(importance - half_width),
+            "ci_high": float(importance + half_width),
+            "repeat_std": float(((errors[j].mean(axis=1) - base_errors.mean()) / variance).std()),
+            "members_repredicted": int(used[:, j].sum()),
+        })
+    result = pd.DataFrame(rows).sort_values("importance", ascending=False, ignore_index=True)
+    if report_path:
+        result.to_json(report_path, orient="records", indent=2)
+    return result
+
+
+def path_contributions(model, X):
+    """(bias per row, rows x features contributions) that add up to each prediction."""
+    sys.path.append(os.path.join(REPO_ROOT, "backend", "src"))
+    from explain import decompose, reference_point
+    from tree_engine import compile_model
+
+    compiled = compile_model(model)
+    X = np.asarray(X, dtype=np.float64)
+    return decompose(compiled, X, reference_point(compiled, X.shape[1]))
@@ -0,0 +1,72 @@
+import json
+import os
+
+# === Feature registry ===
+# The one place the model input columns are listed. Every training script
+# selects its columns from here and writes them next to the artifact as
+# `<artifact>.features.json`, which the backend reads to pack its requests.
+ENGAGEMENT_FEATURES = [
+    "video_duration_sec",
+    "verified_status",
+    "author_ban_status",
+    # "like_ratio", # Can be added back in if necessary
+    "share_ratio",
+    "comment_ratio",
+]
+ENGAGEMENT_TARGET = "engagement_rate"
+
+CLASSIFICATION_FEATURES = [
+    "video_duration_sec",
+    "verified_status",
+    "author_ban_status",
+    "like_ratio",
+    "share_ratio",
+    "comment_ratio",
+]
+
+WATCH_DURATION_FEATURES = [
+    "like_ratio",
+    "comment_ratio",
+    "share_ratio",
+    # "watch_ratio",
+    "title_length",
+    "description_length",
+    "edge_intensity",
+    "color_histogram",
+    "spectral_entropy",
+    "audio_intensity",
+]
+WATCH_DURATION_TARGET = "watch_duration"  # or use "engagement_score_norm"
+
+SCHEMAS = {
+    "engagement": {"features": ENGAGEMENT_FEATURES, "target": ENGAGEMENT_TARGET},
+    "classification": {"features": CLASSIFICATION_FEATURES, "target": None},
+    "watch_duration": {"features": WATCH_DURATION_FEATURES, "target": WATCH_DURATION_TARGET},
+}
+
+
+def schema_path(artifact_path):
+    return os.path.splitext(artifact_path)[0] + ".features.json"
+
+
+def save_feature_schema(artifact_path, model, features=None):
+    """Write the registry entry for `model` next to its pickled artifact.
+
+    `features` overrides the registry's columns when the artifact was fitted
+    on another list (e.g. a surrogate of an older full model).
+    """
+    schema = dict(SCHEMAS[model], model=model)
+    if features is not None:
+        schema["features"] = list(features)
+    with open(schema_path(artifact_path), "w", encoding="utf-8") as f:
+        json.dump(schema, f, indent=2)
+    return schema
+
+
+def load_feature_schema(artifact_path, model):
+    """Column order an artifact was trained with, falling back to the registry."""
+    path = schema_path(artifact_path)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return dict(SCHEMAS[model], model=model)
@@ -0,0 +1,317 @@
+"""One runner for the three training scripts, as a DAG of cached steps.
+
+    python -m training.pipeline                       # every model
+    python -m training.pipeline engagement --jobs 2
+
+For each model the steps are
+
+    sync:<table> -> features:<model> -> train:<model>    -> export:<model>
+                                     -> evaluate:<model> ->
+
+`sync` brings the local Parquet cache up to date (training/data_sync.py) and
+always runs; both TikTok models share one. Every other step but `export` is
+keyed on a content hash of its inputs' outputs, its config (for train and
+evaluate, the unfitted estimator) and the source files it runs. Its outputs
+are stored under `.train_cache/<step>/<key>/`, so a step whose key was seen
+before is skipped and its stored outputs are reused. `export` copies the
+artifacts into --output-dir. Steps whose inputs are ready run in parallel, in
+separate processes, and a timing report is printed at the end.
+
+The classification model warm-starts from the centroid export already in
+--output-dir. That export is not part of the train key: on a hit the cached
+model, with its tiers, is reused unchanged, which is the stable outcome warm
+starting is there for.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import time
+
+import joblib
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+from training import data_sync
+from training.backends import BACKENDS
+from training.evaluation import cpu_budget
+
+DEFAULT_CACHE_DIR = os.path.join(REPO_ROOT, ".train_cache")
+LOG_FILE = "step.log"
+META_FILE = "meta.json"
+
+MODELS = {
+    "engagement": {
+        "script": "tiktok_dataset/Engagement_model.py",
+        "code": ["training/backends.py", "training/evaluation.py", "training/feature_schema.py", "training/search.py"],
+    },
+    "classification": {
+        "script": "tiktok_dataset/Classification_model.py",
+        "code": ["training/centroids.py", "training/feature_schema.py"],
+    },
+    "watch_duration": {
+        "script": "short_video_dataset/Watch_duration_model.py",
+        "code": ["training/backends.py", "training/evaluation.py", "training/feature_schema.py", "training/search.py"],
+    },
+}
+
+_scripts = {}
+
+
+def load_script(model):
+    """The model's training script, imported as a module (its main() is not run)."""
+    if model not in _scripts:
+        path = os.path.join(REPO_ROOT, MODELS[model]["script"])
+        spec = importlib.util.spec_from_file_location(f"train_{model}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _scripts[model] = module
+    return _scripts[model]
+
+
+def hash_files(paths, root=None):
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, root or REPO_ROOT).encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_outputs(directory):
+    """Digest of every file a step wrote, its log and metadata excepted."""
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name not in (LOG_FILE, META_FILE)
+    )
+    return hash_files(paths, directory)
+
+
+# === Step functions ===
+# Each runs in a worker process with its output directory, the output
+# directories of the steps it depends on and its share of the CPUs. A str
+# return value is used as the output digest instead of hashing the directory.
+
+def run_sync(workdir, inputs, n_jobs, table, skip):
+    if not skip:
+        data_sync.refresh(table)
+    return data_sync.cache_digest(table)
+
+
+def run_features(workdir, inputs, n_jobs, model, table, columns):
+    df = load_script(model).prepare(data_sync.load_table(table, columns))
+    df.to_parquet(os.path.join(workdir, "features.parquet"), index=False)
+    print(f"{len(df)} rows, {len(df.columns)} columns")
+
+
+def _features(inputs, model):
+    return pd.read_parquet(os.path.join(inputs[f"features:{model}"], "features.parquet"))
+
+
+def run_train(workdir, inputs, n_jobs, model, output_dir):
+    script = load_script(model)
+    artifact = os.path.join(workdir, script.ARTIFACT)
+    if model == "classification":
+        previous = script.load_previous(os.path.join(output_dir, script.ARTIFACT))
+        script.train(_features(inputs, model), artifact, previous, n_jobs=n_jobs)
+    else:
+        script.train(_features(inputs, model), artifact, n_jobs=n_jobs)
+
+
+def run_evaluate(workdir, inputs, n_jobs, model):
+    script = load_script(model)
+    df = _features(inputs, model)
+    if model == "classification":
+        # The tier of every video, from the trained pipeline and its export.
+        trained = os.path.join(inputs[f"train:{model}"], script.ARTIFACT)
+        pipeline = joblib.load(trained)
+        labels = script.load_centroids(script.centroids_path(trained))["labels"]
+        script.write_labels(pipeline, dict(enumerate(labels)), lambda: [df],
+                            output_csv=os.path.join(workdir, script.OUTPUT_CSV))
+    else:
+        script.evaluate(df, n_jobs=n_jobs).save(os.path.join(workdir, script.ARTIFACT))
+
+
+def run_export(workdir, inputs, n_jobs, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for directory in inputs.values():
+        for name in sorted(os.listdir(directory)):
+            if name not in (LOG_FILE, META_FILE):
+                shutil.copy2(os.path.join(directory, name), os.path.join(output_dir, name))
+                print("exported", name)
+
+
+class Step:
+    def __init__(self, name, func, deps=(), config=None, code=(), cached=True, **kwargs):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.config = config or {}
+        self.code = list(code)
+        self.cached = cached
+        self.kwargs = kwargs
+
+    def key(self, digests):
+        payload = {
+            "step": self.name,
+            "config": self.config,
+            "code": hash_files([os.path.join(REPO_ROOT, path) for path in self.code]),
+            "inputs": {dep: digests[dep] for dep in self.deps},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def build_steps(models, output_dir, skip_sync=False):
+    steps = {}
+    for model in models:
+        script = load_script(model)
+        table = script.TABLE
+        code = [MODELS[model]["script"], *MODELS[model]["code"]]
+        if f"sync:{table}" not in steps:
+            steps[f"sync:{table}"] = Step(f"sync:{table}", run_sync, cached=False, table=table, skip=skip_sync)
+        if model == "classification":
+            columns, estimator = None, script.make_pipeline(3)
+        else:
+            columns, estimator = script.features + [script.target], script.build_model()
+        steps[f"features:{model}"] = Step(
+            f"features:{model}", run_features, [f"sync:{table}"], {"columns": columns}, code,
+            model=model, table=table, columns=columns,
+        )
+        estimator_hash = joblib.hash(estimator)
+        steps[f"train:{model}"] = Step(
+            f"train:{model}", run_train, [f"features:{model}"], {"estimator": estimator_hash}, code,
+            model=model, output_dir=output_dir,
+        )
+        evaluate_deps = [f"features:{model}"] + ([f"train:{model}"] if model == "classification" else [])
+        steps[f"evaluate:{model}"] = Step(
+            f"evaluate:{model}", run_evaluate, evaluate_deps, {"estimator": estimator_hash}, code, model=model,
+        )
+        steps[f"export:{model}"] = Step(
+            f"export:{model}", run_export, [f"train:{model}", f"evaluate:{model}"], cached=False, output_dir=output_dir,
+        )
+    return steps
+
+
+def _execute(func, workdir, inputs, n_jobs, kwargs):
+    """Run one step in a worker process with its output logged to step.log."""
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    started = time.perf_counter()
+    with open(os.path.join(workdir, LOG_FILE), "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        digest = func(workdir, inputs, n_jobs, **kwargs)
+    return digest, time.perf_counter() - started
+
+
+def _entry(cache_dir, step, key):
+    return os.path.join(cache_dir, step.name.replace(":", "-"), key)
+
+
+def run(steps, cache_dir=DEFAULT_CACHE_DIR, jobs=2, force=False):
+    """Run every step once its dependencies are done; returns the report rows."""
+    n_jobs = max(1, cpu_budget() // jobs)
+    digests, outputs, report = {}, {}, {}
+    waiting = dict(steps)
+    running = {}
+
+    def finish(step, status, seconds, key=None, directory=None, digest=None):
+        report[step.name] = {"step": step.name, "status": status, "seconds": seconds, "key": key, "output": directory}
+        if digest is not None:
+            digests[step.name], outputs[step.name] = digest, directory
+        print(f"[{status:>7}] {step.name} ({seconds:.1f}s)", flush=True)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        while waiting or running:
+            for name, step in list(waiting.items()):
+                if any(report.get(dep, {}).get("status") in ("failed", "skipped") for dep in step.deps):
+                    del waiting[name]
+                    finish(step, "skipped", 0.0)
+                    continue
+                if not all(dep in digests for dep in step.deps):
+                    continue
+                del waiting[name]
+                key = step.key(digests) if step.cached else None
+                directory = _entry(cache_dir, step, key) if step.cached else os.path.join(cache_dir, "_runs", name.replace(":", "-"))
+                meta_path = os.path.join(directory, META_FILE)
+                if step.cached and not force and os.path.exists(meta_path):
+                    with open(meta_path, encoding="utf-8") as f:
+                        finish(step, "cached", 0.0, key, directory, json.load(f)["digest"])
+                    continue
+                inputs = {dep: outputs[dep] for dep in step.deps}
+                future = pool.submit(_execute, step.func, directory + ".tmp", inputs, n_jobs, step.kwargs)
+                running[future] = (step, key, directory)
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                step, key, directory = running.pop(future)
+                try:
+                    digest, seconds = future.result()
+                except Exception as exc:
+                    finish(step, "failed", 0.0, key)
+                    log = os.path.join(directory + ".tmp", LOG_FILE)
+                    if os.path.exists(log):
+                        with open(log, encoding="utf-8") as f:
+                            print("".join(f.readlines()[-20:]), end="")
+                    print(f"{step.name}: {type(exc).__name__}: {exc}")
+                    continue
+                digest = digest or hash_outputs(directory + ".tmp")
+                with open(os.path.join(directory + ".tmp", META_FILE), "w", encoding="utf-8") as f:
+                    json.dump({"step": step.name, "key": key, "digest": digest, "seconds": seconds}, f, indent=2)
+                shutil.rmtree(directory, ignore_errors=True)
+                os.replace(directory + ".tmp", directory)
+                finish(step, "ran", seconds, key, directory, digest)
+    return [report[name] for name in steps]
+
+
+def load_features(model, cache_dir=DEFAULT_CACHE_DIR, skip_sync=False):
+    """The model's feature table, through the cached sync and features steps."""
+    steps = build_steps([model], ".", skip_sync)
+    rows = run({name: step for name, step in steps.items() if name.split(":")[0] in ("sync", "features")}, cache_dir, 1)
+    if any(row["status"] in ("failed", "skipped") for row in rows):
+        raise RuntimeError(f"Could not build the features of {model}")
+    output = next(row["output"] for row in rows if row["step"] == f"features:{model}")
+    return pd.read_parquet(os.path.join(output, "features.parquet"))
+
+
+def print_report(rows, wall_seconds):
+    print(f"\n{'step':<32} {'status':<8} {'seconds':>8}")
+    for row in rows:
+        print(f"{row['step']:<32} {row['status']:<8} {row['seconds']:>8.1f}")
+    ran = sum(row["seconds"] for row in rows)
+    print(f"{len(rows)} steps, {ran:.1f}s of step time in {wall_seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Train every model, skipping steps whose inputs did not change.")
+    parser.add_argument("models", nargs="*", help=f"any of {', '.join(MODELS)} (default: all)")
+    parser.add_argument("--jobs", type=int, default=2, help="steps run at the same time; they share the CPUs")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--force", action="store_true", help="rerun every step, ignoring cached outputs")
+    parser.add_argument("--no-sync", action="store_true", help="use the local data cache as it is")
+    parser.add_argument("--backend", choices=BACKENDS, help="tree backend of the regressors (default: TRAINING_BACKEND or exact)")
+    args = parser.parse_args()
+    unknown = sorted(set(args.models) - set(MODELS))
+    if unknown:
+        parser.error(f"unknown models {unknown}")
+    if args.backend:
+        # Read by the scripts' build_model(), here and in the step processes.
+        os.environ["TRAINING_BACKEND"] = args.backend
+
+    started = time.perf_counter()
+    steps = build_steps(args.models or list(MODELS), os.path.abspath(args.output_dir), args.no_sync)
+    rows = run(steps, args.cache_dir, args.jobs, args.force)
+    print_report(rows, time.perf_counter() - started)
+    with open(os.path.join(args.cache_dir, "last_run.json"), "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    sys.exit(1 if any(row["status"] in ("failed", "skipped") for row in rows) else 0)
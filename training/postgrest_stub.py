@@ -0,0 +1,123 @@
+"""In-memory stand-in for the part of the Supabase REST API (PostgREST) that
+data_sync.py and bulk_upload.py use, to run them against fixtures instead of
+a project:
+
+    stub = PostgrestStub({"tiktok_dataset_cleaned": rows})
+    transport = httpx.MockTransport(stub)
+    asyncio.run(sync_table("tiktok_dataset_cleaned", "http://stub", "key", transport=transport))
+
+Supported: `select`, `order`, `limit`, `offset`, eq/gt/gte/lt/lte filters
+(repeated filters are ANDed), `Prefer: count=exact`, and a `max_rows` cap
+like the server's db-max-rows. POST inserts a JSON array of rows; with
+`on_conflict` and `Prefer: resolution=merge-duplicates` it upserts, and a
+duplicate key otherwise answers 409 like a unique constraint would.
+`max_body_rows` answers larger inserts with 413. `fail_rate` answers that
+share of requests with a 503 to exercise retries.
+"""
+import json
+import random
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+import httpx
+
+OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+RESERVED = {"select", "order", "limit", "offset"}
+
+
+def _coerce(value: str, like: Any) -> Any:
+    if isinstance(like, bool):
+        return value == "true"
+    if isinstance(like, (int, float)):
+        return float(value)
+    return value
+
+
+class PostgrestStub:
+    def __init__(self, tables: Dict[str, List[Dict[str, Any]]], max_rows: Optional[int] = None,
+                 fail_rate: float = 0.0, seed: int = 0, max_body_rows: Optional[int] = None):
+        self.tables = tables
+        self.max_rows = max_rows
+        self.max_body_rows = max_body_rows
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.fail_rate and self._random.random() < self.fail_rate:
+            return httpx.Response(503, json={"message": "stub: transient failure"})
+        prefix = "/rest/v1/"
+        if not request.url.path.startswith(prefix):
+            return httpx.Response(404, json={"message": "not found"})
+        table = request.url.path[len(prefix):]
+        if table not in self.tables:
+            return httpx.Response(404, json={"message": f"relation {table} does not exist"})
+        if request.method == "GET":
+            return self._select(request, self.tables[table])
+        if request.method == "POST":
+            return self._insert(request, self.tables[table])
+        return httpx.Response(405, json={"message": f"stub does not support {request.method}"})
+
+    def _select(self, request: httpx.Request, rows: List[Dict[str, Any]]) -> httpx.Response:
+        params = parse_qsl(request.url.query.decode())
+        for column, condition in params:
+            if column in RESERVED:
+                continue
+            op, _, value = condition.partition(".")
+            rows = [
+                row for row in rows
+                if row.get(column) is not None and OPERATORS[op](row[column], _coerce(value, row[column]))
+            ]
+        options = dict(params)
+        for term in reversed(options.get("order", "").split(",") if options.get("order") else []):
+            column, _, direction = term.partition(".")
+            rows = sorted(rows, key=lambda row: row[column], reverse=direction.startswith("desc"))
+        total = len(rows)
+        offset = int(options.get("offset", 0))
+        limit = int(options.get("limit", total))
+        if self.max_rows is not None:
+            limit = min(limit, self.max_rows)
+        rows = rows[offset:offset + limit]
+        if options.get("select", "*") != "*":
+            columns = options["select"].split(",")
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        headers = {"Content-Type": "application/json"}
+        if "count=exact" in request.headers.get("Prefer", ""):
+            end = offset + len(rows) - 1
+            headers["Content-Range"] = f"{offset}-{end}/{total}" if rows else f"*/{total}"
+        return httpx.Response(200, content=json.dumps(rows), headers=headers)
+
+    def _insert(self, request: httpx.Request, rows: List[Dict[str, Any]]) -> httpx.Response:
+        new_rows = json.loads(request.content)
+        if isinstance(new_rows, dict):
+            new_rows = [new_rows]
+        if self.max_body_rows is not None and len(new_rows) > self.max_body_rows:
+            return httpx.Response(413, json={"message": "stub: payload too large"})
+        key = dict(parse_qsl(request.url.query.decode())).get("on_conflict")
+        if key is None:
+            rows.extend(new_rows)
+            return httpx.Response(201)
+        keys = [row.get(key) for row in new_rows]
+        if len(set(keys)) < len(keys):
+            return httpx.Response(400, json={
+                "code": "21000",
+                "message": "ON CONFLICT DO UPDATE command cannot affect row a second time",
+            })
+        merge = "resolution=merge-duplicates" in request.headers.get("Prefer", "")
+        position = {row.get(key): i for i, row in enumerate(rows)}
+        if not merge and any(k in position for k in keys):
+            return httpx.Response(409, json={"code": "23505", "message": f"duplicate key value violates unique constraint on {key}"})
+        for row in new_rows:
+            if row[key] in position:
+                rows[position[row[key]]].update(row)
+            else:
+                position[row[key]] = len(rows)
+                rows.append(row)
+        return httpx.Response(201)
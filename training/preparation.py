@@ -0,0 +1,65 @@
+"""Chunked CSV preparation for raw exports larger than memory.
+
+The data_preparation scripts read the raw CSV `CHUNK_SIZE` rows at a time,
+engineer features on each chunk and append it to the output CSV, so memory is
+bounded by the chunk size rather than the file. Statistics over the whole
+file (the min/max behind engagement_score_norm) come from a first pass that
+only keeps running aggregates.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 100_000
+
+
+def iter_csv(path, chunksize=CHUNK_SIZE, **kwargs):
+    """DataFrames of at most `chunksize` rows; kwargs go to pd.read_csv."""
+    yield from pd.read_csv(path, chunksize=chunksize, **kwargs)
+
+
+def ratio(numerator, denominator):
+    """numerator / denominator as float64, computed without pandas alignment."""
+    return np.divide(
+        np.asarray(numerator, dtype=np.float64),
+        np.asarray(denominator, dtype=np.float64),
+    )
+
+
+def write_csv(chunks, path):
+    """Append every chunk to `path` (header once) and return the row count.
+
+    The output is written next to `path` and renamed at the end, so an
+    interrupted run never leaves a truncated file in its place.
+    """
+    tmp = path + ".tmp"
+    rows = 0
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(tmp, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        rows += len(chunk)
+    if rows == 0 and not os.path.exists(tmp):
+        pd.DataFrame().to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return rows
+
+
+class RunningMinMax:
+    """Min and max seen so far, and MinMaxScaler's transform from them."""
+
+    def __init__(self):
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.size:
+            self.min = min(self.min, float(np.nanmin(values)))
+            self.max = max(self.max, float(np.nanmax(values)))
+
+    def transform(self, values):
+        # The same arithmetic as MinMaxScaler, so results match it bit for bit;
+        # a constant column scales to 0 instead of dividing by 0.
+        span = self.max - self.min
+        scale = 1.0 / (span if span > 0 else 1.0)
+        return np.asarray(values, dtype=np.float64) * scale - self.min * scale
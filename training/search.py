@@ -0,0 +1,317 @@
+"""Hyperparameter search for the stacked models by successive halving.
+
+    python -m training.search engagement --candidates 27 --budget-minutes 30
+    python -m training.search watch_duration --resource n_estimators --apply
+    python -m training.search engagement --backend hist
+
+Random candidates from SPACES (plus the current configuration) are scored by
+cross-validated RMSE on a small budget. The best 1/--factor of them move on
+to a budget --factor times larger, until one rung uses the full budget or the
+wall-clock budget runs out. The budget is either rows of the cached feature
+matrix (n_samples) or a share of every tree-count parameter (n_estimators).
+All folds of all candidates of a rung run in parallel; the feature matrix is
+read once and shared with the workers by joblib's memory mapping.
+
+The finalists are then fitted on every row and their single-row and batch
+prediction latency is measured, since a serving model must be both accurate
+and fast. `<artifact>.search.json` records every rung, the finalists'
+RMSE/latency/fit-time trade-off and which of them are Pareto-optimal.
+The most accurate finalist within --max-latency-ms is the best config;
+--apply writes it to training/params/<model>.json (<model>.hist.json for the
+hist backend), which the training scripts' build_model() applies.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.stats import loguniform
+from sklearn.base import clone
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import KFold, ParameterSampler
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from training.backends import BACKENDS, training_backend
+from training.distill import predict_ms
+from training.evaluation import cpu_budget, set_n_jobs
+
+PARAMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "params")
+
+# Search spaces over the StackingRegressor parameters of each model, with the
+# hist backend's under "<model>.hist".
+LINEAR_SPACE = {
+    "svr__svr__C": loguniform(0.1, 10.0),
+    "svr__svr__epsilon": [0.05, 0.1, 0.2, 0.5],
+    "ridge__ridge__alpha": loguniform(0.01, 100.0),
+}
+SPACES = {
+    "engagement": {
+        "rf__randomforestregressor__n_estimators": [50, 100, 200, 300],
+        "rf__randomforestregressor__max_depth": [None, 8, 16],
+        "rf__randomforestregressor__min_samples_leaf": [1, 2, 5],
+        **LINEAR_SPACE,
+        "final_estimator__n_estimators": [50, 100, 200],
+        "final_estimator__learning_rate": [0.05, 0.1, 0.2],
+        "final_estimator__max_depth": [2, 3, 4],
+    },
+    "watch_duration": {
+        "rf__n_estimators": [50, 100, 200],
+        "rf__max_depth": [None, 10, 20],
+        "gbr__n_estimators": [100, 200, 400],
+        "gbr__learning_rate": [0.02, 0.05, 0.1],
+        "gbr__max_depth": [3, 4, 5],
+        "gbr__subsample": [0.6, 0.8, 1.0],
+    },
+    "engagement.hist": {
+        "hgb__max_iter": [100, 200, 400],
+        "hgb__learning_rate": [0.05, 0.1, 0.2],
+        "hgb__max_leaf_nodes": [15, 31, 63],
+        "hgb__min_samples_leaf": [10, 20, 50],
+        "hgb__l2_regularization": [0.0, 0.1, 1.0],
+        **LINEAR_SPACE,
+        "final_estimator__max_iter": [50, 100, 200],
+        "final_estimator__learning_rate": [0.05, 0.1, 0.2],
+        "final_estimator__max_depth": [2, 3, 4],
+    },
+    "watch_duration.hist": {
+        "hgb_wide__max_iter": [50, 100, 200],
+        "hgb_wide__max_leaf_nodes": [31, 63, 127],
+        "hgb_wide__max_features": [0.3, 0.5, 1.0],
+        "hgb__max_iter": [100, 200, 400],
+        "hgb__learning_rate": [0.02, 0.05, 0.1],
+        "hgb__max_depth": [3, 4, 5],
+    },
+}
+# Parameters scaled by the n_estimators budget.
+TREE_PARAMS = {
+    "engagement": ["rf__randomforestregressor__n_estimators", "final_estimator__n_estimators"],
+    "watch_duration": ["rf__n_estimators", "gbr__n_estimators"],
+    "engagement.hist": ["hgb__max_iter", "final_estimator__max_iter"],
+    "watch_duration.hist": ["hgb_wide__max_iter", "hgb__max_iter"],
+}
+
+
+def space_key(model, backend="exact"):
+    """Key of the model's search space and params file for `backend`."""
+    return model if backend == "exact" else f"{model}.{backend}"
+
+
+def params_path(key):
+    return os.path.join(PARAMS_DIR, f"{key}.json")
+
+
+def tuned_params(model, backend="exact"):
+    """Parameters a search applied for `model` on `backend`, or {} if there are none."""
+    path = params_path(space_key(model, backend))
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["params"]
+
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def candidates(model, baseline, n, seed):
+    """The baseline's own values for every searched parameter, then n - 1 samples."""
+    space = SPACES[model]
+    params = baseline.get_params()
+    sampled = ParameterSampler(space, n_iter=max(n - 1, 0), random_state=seed)
+    return [{name: _plain(params[name]) for name in space}] + [
+        {name: _plain(value) for name, value in candidate.items()} for candidate in sampled
+    ]
+
+
+def schedule(n_candidates, factor, resource, n_rows, min_resource):
+    """Budget of each rung, growing by `factor` up to the full budget."""
+    n_rungs = max(1, int(math.floor(math.log(max(n_candidates, 1), factor))) + 1)
+    full = n_rows if resource == "n_samples" else 1.0
+    budgets = [full / factor ** (n_rungs - 1 - i) for i in range(n_rungs)]
+    if resource == "n_samples":
+        budgets = [int(max(min_resource, budget)) for budget in budgets]
+    return sorted(set(budgets))
+
+
+def configure(baseline, params, model, resource, budget):
+    estimator = clone(baseline).set_params(**params)
+    if resource == "n_estimators":
+        estimator.set_params(**{
+            name: max(1, int(round(params[name] * budget))) for name in TREE_PARAMS[model] if name in params
+        })
+    return set_n_jobs(estimator, 1)
+
+
+def _score_fold(estimator, X, y, train, test):
+    started = time.perf_counter()
+    estimator = clone(estimator).fit(X[train], y[train])
+    return float(mean_squared_error(y[test], estimator.predict(X[test]))) * len(test), len(test), time.perf_counter() - started
+
+
+def _fit(estimator, X, y):
+    return clone(estimator).fit(X, y)
+
+
+def run_rung(baseline, model, configs, X, y, resource, budget, cv, n_jobs, seed):
+    """Cross-validated RMSE and mean fold fit time of every config at `budget`."""
+    rows = np.arange(len(X))
+    if resource == "n_samples":
+        rows = np.random.default_rng(seed).permutation(len(X))[:budget]
+    splits = list(KFold(cv, shuffle=True, random_state=seed).split(rows))
+    tasks = [
+        (i, configure(baseline, params, model, resource, budget), rows[train], rows[test])
+        for i, params in enumerate(configs) for train, test in splits
+    ]
+    results = Parallel(n_jobs=n_jobs)(delayed(_score_fold)(est, X, y, train, test) for _, est, train, test in tasks)
+    scores = []
+    for i in range(len(configs)):
+        mine = [result for (j, *_), result in zip(tasks, results) if j == i]
+        squared, count = sum(r[0] for r in mine), sum(r[1] for r in mine)
+        scores.append({"rmse": math.sqrt(squared / count), "fit_seconds": float(np.mean([r[2] for r in mine]))})
+    return scores
+
+
+def pareto(points):
+    """Indices of the points no other point beats on every objective."""
+    return [
+        i for i, p in enumerate(points)
+        if not any(all(q[k] <= p[k] for k in range(len(p))) and q != p for q in points)
+    ]
+
+
+def search(model, baseline, X, y, n_candidates=27, factor=3, resource="n_samples", min_resource=500,
+           cv=3, budget_seconds=1800, n_jobs=None, max_latency_ms=None, finalists=3, seed=42):
+    started = time.perf_counter()
+    n_jobs = cpu_budget(n_jobs)
+    X, y = np.ascontiguousarray(X, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    configs = candidates(model, baseline, n_candidates, seed)
+    alive = list(range(len(configs)))
+    rungs = []
+
+    budgets = schedule(len(configs), factor, resource, len(X), min_resource)
+    for rung, budget in enumerate(budgets):
+        elapsed = time.perf_counter() - started
+        if rungs:
+            # The next rung fits fewer candidates on `factor` times the budget.
+            last = rungs[-1]
+            projected = last["seconds"] * len(alive) / len(last["scores"]) * budget / last["budget"]
+            if elapsed + projected > budget_seconds:
+                print(f"Stopping before rung {rung}: about {projected:.0f}s needed, "
+                      f"{budget_seconds - elapsed:.0f}s of the budget left")
+                break
+        rung_started = time.perf_counter()
+        scores = run_rung(baseline, model, [configs[i] for i in alive], X, y, resource, budget, cv, n_jobs, seed + rung)
+        rungs.append({
+            "rung": rung,
+            "budget": budget,
+            "seconds": time.perf_counter() - rung_started,
+            "scores": [{"candidate": i, **score} for i, score in zip(alive, scores)],
+        })
+        ranked = [i for _, i in sorted(zip((s["rmse"] for s in scores), alive))]
+        print(f"Rung {rung}: {len(alive)} candidates on {resource}={budget:g}, best RMSE {min(s['rmse'] for s in scores):.4f} "
+              f"({rungs[-1]['seconds']:.1f}s)")
+        if rung < len(budgets) - 1:
+            alive = ranked[:max(1, len(alive) // factor)]
+        else:
+            alive = ranked
+
+    # Finalists: the best of the last rung that scored enough candidates, and
+    # the current configuration. All are scored at the last budget reached, on
+    # the same folds, so their RMSEs compare.
+    pool = next((r for r in reversed(rungs) if len(r["scores"]) >= finalists), rungs[0])
+    finalist_ids = [s["candidate"] for s in sorted(pool["scores"], key=lambda s: s["rmse"])[:finalists]]
+    if 0 not in finalist_ids:
+        finalist_ids.append(0)
+    last = rungs[-1]
+    scored = {s["candidate"]: s for s in last["scores"]}
+    missing = [i for i in finalist_ids if i not in scored]
+    if missing:
+        rescored = run_rung(baseline, model, [configs[i] for i in missing], X, y, resource, last["budget"], cv,
+                            n_jobs, seed + last["rung"])
+        scored.update({i: {"candidate": i, **score} for i, score in zip(missing, rescored)})
+
+    fitted = Parallel(n_jobs=min(n_jobs, len(finalist_ids)))(
+        delayed(_fit)(configure(baseline, configs[i], model, "n_samples", None), X, y) for i in finalist_ids
+    )
+    results = []
+    for i, estimator in zip(finalist_ids, fitted):
+        # Measured one at a time, with no fits running, so latencies compare.
+        results.append({
+            "candidate": i,
+            "baseline": i == 0,
+            "params": configs[i],
+            "cv_rmse": scored[i]["rmse"],
+            "cv_budget": last["budget"],
+            "fold_fit_seconds": scored[i]["fit_seconds"],
+            "latency_ms_1": predict_ms(estimator, X[:1]),
+            "latency_ms_1000": predict_ms(estimator, X[:1000], repeats=5),
+        })
+    front = pareto([(r["cv_rmse"], r["latency_ms_1"], r["fold_fit_seconds"]) for r in results])
+    for k, result in enumerate(results):
+        result["pareto"] = k in front
+    eligible = [r for r in results if max_latency_ms is None or r["latency_ms_1"] <= max_latency_ms] or results
+    best = min(eligible, key=lambda r: r["cv_rmse"])
+    return {
+        "model": model,
+        "resource": resource,
+        "factor": factor,
+        "cv": cv,
+        "candidates": configs,
+        "rungs": rungs,
+        "finalists": results,
+        "max_latency_ms": max_latency_ms,
+        "best": best,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from training.pipeline import DEFAULT_CACHE_DIR, load_features, load_script
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Successive-halving search over the stacked model's hyperparameters.")
+    parser.add_argument("model", choices=sorted(key for key in SPACES if "." not in key))
+    parser.add_argument("--backend", choices=BACKENDS, help="tree backend (default: TRAINING_BACKEND or exact)")
+    parser.add_argument("--candidates", type=int, default=27)
+    parser.add_argument("--factor", type=int, default=3)
+    parser.add_argument("--resource", choices=["n_samples", "n_estimators"], default="n_samples")
+    parser.add_argument("--min-resource", type=int, default=500, help="fewest rows a rung uses (n_samples)")
+    parser.add_argument("--cv", type=int, default=3)
+    parser.add_argument("--budget-minutes", type=float, default=30)
+    parser.add_argument("--jobs", type=int, default=None, help="CPUs to use (default: TRAINING_CPUS or all)")
+    parser.add_argument("--max-latency-ms", type=float, help="single-row latency limit for the best config")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--no-sync", action="store_true", help="use the local data cache as it is")
+    parser.add_argument("--apply", action="store_true", help=f"write the best config to {PARAMS_DIR}")
+    args = parser.parse_args()
+
+    backend = training_backend(args.backend)
+    key = space_key(args.model, backend)
+    script = load_script(args.model)
+    df = load_features(args.model, args.cache_dir, args.no_sync)
+    report = search(
+        key, script.build_model(backend), df[script.features], df[script.target],
+        args.candidates, args.factor, args.resource, args.min_resource, args.cv,
+        args.budget_minutes * 60, args.jobs, args.max_latency_ms,
+    )
+    output = os.path.splitext(script.ARTIFACT)[0] + key[len(args.model):] + ".search.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'candidate':>9} {'cv rmse':>9} {'ms/row':>8} {'fit s':>7}  pareto")
+    for r in report["finalists"]:
+        print(f"{r['candidate']:>9} {r['cv_rmse']:>9.4f} {r['latency_ms_1']:>8.2f} {r['fold_fit_seconds']:>7.1f}  "
+              f"{'yes' if r['pareto'] else ''}{' (current)' if r['baseline'] else ''}")
+    print(f"Best: candidate {report['best']['candidate']} {report['best']['params']}; report in {output}")
+    if args.apply:
+        os.makedirs(PARAMS_DIR, exist_ok=True)
+        with open(params_path(key), "w", encoding="utf-8") as f:
+            json.dump({"params": report["best"]["params"], "cv_rmse": report["best"]["cv_rmse"],
+                       "latency_ms_1": report["best"]["latency_ms_1"]}, f, indent=2)
+        print("Applied to", params_path(key))